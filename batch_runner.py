@@ -0,0 +1,102 @@
+#!/usr/bin/env python2
+
+# Job runner of the batch scripts
+#
+# output_assembly_batch.py and track_width_batch.py run one job per board
+# of a manifest. The jobs are run by a pool of worker processes, so the
+# modules are imported once per worker instead of once per board. A job is
+# run by a module level function (it is pickled by name for the pool):
+#   run_job(job)
+# which returns a dict with at least:
+#   index : position of the job in the manifest
+#   name : name of the job in the summary
+#   error : traceback of the failed job, None if done
+#   time : run time of the job (s)
+#   log : output of the job, printed when the job is finished
+# A failed job does not stop the other ones. The results are summed up in a
+# table with the counts of each script and optionally written to a JSON
+# report; the exit code is 1 if any job failed.
+
+import sys
+import json
+import time
+import multiprocessing
+
+
+def AddArguments(parser, report_help):
+    """Arguments of the runner: -j/--jobs and -r/--report."""
+
+    parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(),
+            help="Number of worker processes (default = %(default)s)")
+    parser.add_argument('-r', '--report', default=None,
+            help=report_help)
+
+
+def RunJobs(run_job, jobs, job_count):
+    """Results of the jobs in the manifest order, the progress is printed as the jobs are finished."""
+
+    pool = None
+    if job_count > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(min(job_count, len(jobs)))
+        job_results = pool.imap_unordered(run_job, jobs)
+    else:
+        job_results = (run_job(job) for job in jobs)
+
+    results = []
+    for r in job_results:
+        results.append(r)
+        print('[%d/%d] %s: %s (%.2f s)'%(len(results), len(jobs), r['name'], 'ok' if r['error'] == None else 'FAILED', r['time']))
+        sys.stdout.write(r['log'])
+        if r['error'] != None:
+            sys.stdout.write(r['error'])
+
+    if pool != None:
+        pool.close()
+        pool.join()
+
+    results.sort(key=lambda r: r['index'])
+    return results
+
+
+def FormatSummary(results, columns, counts):
+    """Table with the result of each job and the totals of the batch.
+
+    columns are the headers of the counts, counts(result) returns the counts
+    of a job that is done.
+    """
+
+    widths = [max(10, len(c)) for c in columns]
+    format_string = '%-24s %-6s %8s' + ''.join([' %%%ds'%w for w in widths]) + '\n'
+    ret = format_string%tuple(['Board', 'Status', 'Time'] + list(columns))
+    totals = [0]*len(columns)
+    failed = 0
+    for r in results:
+        if r['error'] != None:
+            failed += 1
+            ret += format_string%tuple([r['name'], 'FAILED', '%.2f'%r['time']] + ['-']*len(columns))
+            continue
+        job_counts = counts(r)
+        totals = [a + b for a, b in zip(totals, job_counts)]
+        ret += format_string%tuple([r['name'], 'ok', '%.2f'%r['time']] + list(job_counts))
+    ret += format_string%tuple(['Total', '%d/%d'%(len(results) - failed, len(results)),
+            '%.2f'%sum([r['time'] for r in results])] + totals)
+    return ret
+
+
+def Run(run_job, jobs, args, columns, counts):
+    """Run the jobs with the arguments of AddArguments, returns the exit code."""
+
+    t = time.time()
+    results = RunJobs(run_job, jobs, args.jobs)
+
+    print('')
+    sys.stdout.write(FormatSummary(results, columns, counts))
+    print('Batch time %.2f s'%(time.time() - t))
+
+    if args.report != None:
+        with open(args.report, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if any([r['error'] != None for r in results]):
+        return 1
+    return 0
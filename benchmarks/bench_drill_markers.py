@@ -0,0 +1,86 @@
+#!/usr/bin/env python2
+
+# Benchmark for the drill marker drawing in plugin_drill_map/drill_map.py
+#
+# Compares drawing one marker object per hole with the batched marker
+# templates used by DrillMap. Run it with the Kicad python environment (or
+# with plain python on the synthetic_pcbnew.py stand-in):
+#   > python_k benchmarks/bench_drill_markers.py
+
+import sys
+import os
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'plugin_drill_map'))
+# without Kicad, run on the in-memory stand-in
+import synthetic_pcbnew
+synthetic_pcbnew.Install()
+import drill_map
+import pcbnew
+
+
+def GeneratePositions(count):
+    pitch = 800000
+    side = int(count**0.5) + 1
+    return [((i % side) * pitch, (i // side) * pitch) for i in range(count)]
+
+
+def DrawingSignature(board):
+    # geometry of all drawings, used to check that both paths give the same result
+    ret = []
+    for d in board.GetDrawings():
+        if type(d) is pcbnew.TEXTE_PCB:
+            ret.append(('text', d.GetText(), d.GetPosition().Get()))
+        else:
+            ret.append(('segment', d.GetShape(), d.GetStart().Get(), d.GetEnd().Get(), d.GetWidth(), d.GetLayer()))
+    return sorted(ret)
+
+
+def DrawPerObject(board, layer, marker, positions, size):
+    for position in positions:
+        marker(board, layer, position, size)
+
+
+def DrawBatched(board, layer, marker, positions, size):
+    batch = drill_map.MarkerBatch(drill_map.MarkerTemplate(marker, size))
+    batch.Add(positions)
+    batch.Commit(board, layer)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Drill marker drawing benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 40000],
+            help="Number of holes to test (default = %(default)s)")
+    parser.add_argument('--markers', type=int, nargs='+', default=[0, 3, 4, 6, 7],
+            help="Index of the markers in MARKER_LIST to test (default = %(default)s)")
+    args = parser.parse_args()
+
+    size = int(0.3 * pcbnew.IU_PER_MM)
+    layer = pcbnew.Eco1_User
+
+    print('%8s %10s %12s %14s %12s %10s'%('marker', 'holes', 'segments', 'per object (s)', 'batched (s)', 'speedup'))
+    for m in args.markers:
+        marker = drill_map.MARKER_LIST[m]
+        for count in args.sizes:
+            positions = GeneratePositions(count)
+
+            board_ref = pcbnew.BOARD()
+            t0 = time.time()
+            DrawPerObject(board_ref, layer, marker, positions, size)
+            t_ref = time.time() - t0
+
+            board = pcbnew.BOARD()
+            t0 = time.time()
+            DrawBatched(board, layer, marker, positions, size)
+            t_batch = time.time() - t0
+
+            if DrawingSignature(board_ref) != DrawingSignature(board):
+                raise Exception('Drawing mismatch for marker %d'%m)
+
+            print('%8d %10d %12d %14.3f %12.3f %10.2f'%(m, count, len(board.GetDrawings()), t_ref, t_batch, t_ref / max(t_batch, 1e-9)))
+
+
+if __name__=='__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+#!/usr/bin/env python2
+
+# Benchmark for the drill overlap check in plugin_drill_map/drill_map.py
+#
+# Run it with the Kicad python environment (or with plain python on the
+# synthetic_pcbnew.py stand-in):
+#   > python_k benchmarks/bench_drill_overlap.py
+
+import sys
+import os
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'plugin_drill_map'))
+# without Kicad, run on the in-memory stand-in
+import synthetic_pcbnew
+synthetic_pcbnew.Install()
+import drill_map
+
+
+def FindDrillOverlapsBruteForce(drill_list):
+    # reference implementation: all-pairs scan
+    drill_overlaps = []
+    for i, drill1 in enumerate(drill_list):
+        for drill2 in drill_list[i+1:]:
+            if drill_map.DrillsOverlap(drill1, drill2):
+                drill_overlaps.append((drill1[0], drill2[0]))
+    return drill_overlaps
+
+
+def GenerateDrills(count, seed=0):
+    """Via fan-out like hole pattern: 0.8mm pitch array with some jitter and a few large holes."""
+
+    rnd = random.Random(seed)
+    pitch = 800000
+    side = int(count**0.5) + 1
+    sizes = [(200000, 200000), (300000, 300000), (400000, 400000), (600000, 1200000)]
+    drill_list = []
+    for i in range(count):
+        x = (i % side) * pitch + rnd.randint(-100000, 100000)
+        y = (i // side) * pitch + rnd.randint(-100000, 100000)
+        if rnd.random() < 0.001:
+            size = (3200000, 3200000)
+        else:
+            size = rnd.choice(sizes)
+        drill_list.append(((x, y), size))
+    return drill_list
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Drill overlap check benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 10000, 50000, 100000, 200000],
+            help="Number of holes to test (default = %(default)s)")
+    parser.add_argument('--brute_force_max', type=int, default=5000,
+            help="Largest hole count checked against the all-pairs scan (default = %(default)s)")
+    args = parser.parse_args()
+
+    print('%10s %10s %12s %12s %14s'%('holes', 'overlaps', 'grid (s)', 'us/hole', 'all-pairs (s)'))
+    for count in args.sizes:
+        drill_list = GenerateDrills(count)
+
+        t0 = time.time()
+        overlaps = drill_map.FindDrillOverlaps(drill_list)
+        t_grid = time.time() - t0
+
+        t_brute = ''
+        if count <= args.brute_force_max:
+            t0 = time.time()
+            reference = FindDrillOverlapsBruteForce(drill_list)
+            t_brute = '%.3f'%(time.time() - t0)
+            if reference != overlaps:
+                raise Exception('Overlap mismatch for %d holes'%count)
+
+        print('%10d %10d %12.3f %12.2f %14s'%(count, len(overlaps), t_grid, 1e6 * t_grid / count, t_brute))
+
+
+if __name__=='__main__':
+    sys.exit(main())
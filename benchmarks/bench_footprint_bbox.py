@@ -0,0 +1,131 @@
+#!/usr/bin/env python2
+
+# Benchmark for the footprint bounding boxes in footprint_bbox.py
+#
+# Compares merging the box of each pad in a python loop with the vectorized
+# FootprintBoxes() used by build_part_db, on boards with many high pin count
+# parts (BGAs), and checks that both give the same sizes. Only numpy is
+# needed:
+#   > python benchmarks/bench_footprint_bbox.py
+
+import sys
+import os
+import math
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import board_snapshot
+import footprint_bbox
+
+
+def AddFootprint(snapshot, r, pads):
+    """Footprint at a random position and rotation, pads = list of (x, y, size_x, size_y, shape) relative to it."""
+
+    footprints = snapshot.footprints
+    index = len(footprints)
+    pos_x = r.randint(0, 300000000)
+    pos_y = r.randint(0, 300000000)
+    orientation = r.choice([0.0, 900.0, 1800.0, 2700.0, 450.0, 300.0])
+    footprints.reference.append('U%d'%(index + 1))
+    footprints.value.append('X')
+    footprints.footprint.append('Lib:X')
+    footprints.pos_x.append(pos_x)
+    footprints.pos_y.append(pos_y)
+    footprints.orientation.append(orientation)
+    footprints.attributes.append(0)
+    footprints.flipped.append(0)
+    footprints.pad_count.append(len(pads))
+    for x, y, size_x, size_y, shape in pads:
+        dx, dy = board_snapshot.RotatePoint(x, y, orientation / 10.0)
+        snapshot.pads.footprint.append(index)
+        snapshot.pads.pos_x.append(pos_x + dx)
+        snapshot.pads.pos_y.append(pos_y + dy)
+        snapshot.pads.attribute.append(0)
+        snapshot.pads.drill_shape.append(0)
+        snapshot.pads.drill_x.append(0)
+        snapshot.pads.drill_y.append(0)
+        snapshot.pads.size_x.append(size_x)
+        snapshot.pads.size_y.append(size_y)
+        snapshot.pads.orientation.append(orientation)
+        snapshot.pads.shape.append(shape)
+
+
+def GenerateSnapshot(bga_count, balls, passive_count, seed=0):
+    """Snapshot with BGAs of balls x balls round pads and two pad passives."""
+
+    r = random.Random(seed)
+    snapshot = board_snapshot.BoardSnapshot()
+    pitch = 800000
+    bga = []
+    for i in range(balls):
+        for j in range(balls):
+            bga.append(((i - (balls - 1) / 2.0) * pitch, (j - (balls - 1) / 2.0) * pitch, 400000, 400000,
+                board_snapshot.PAD_SHAPE_CIRCLE))
+    bga = [(int(x), int(y), sx, sy, shape) for x, y, sx, sy, shape in bga]
+    passive = [(-750000, 0, 800000, 1000000, board_snapshot.PAD_SHAPE_OVAL),
+            (750000, 0, 800000, 1000000, board_snapshot.PAD_SHAPE_OVAL)]
+    for i in range(bga_count):
+        AddFootprint(snapshot, r, bga)
+    for i in range(passive_count):
+        AddFootprint(snapshot, r, passive)
+    return snapshot
+
+
+def PadLoopSizes(snapshot):
+    # box of each pad merged one pad at a time, in the footprint frame
+    footprints = snapshot.footprints
+    pads = snapshot.pads
+    boxes = [None] * len(footprints)
+    for i in range(len(pads)):
+        f = pads.footprint[i]
+        angle = footprints.orientation[f] / 10.0
+        x, y = board_snapshot.RotatePoint(pads.pos_x[i] - footprints.pos_x[f], pads.pos_y[i] - footprints.pos_y[f], -angle)
+        half_x = pads.size_x[i] / 2.0
+        half_y = pads.size_y[i] / 2.0
+        if pads.shape[i] == board_snapshot.PAD_SHAPE_CIRCLE:
+            half_y = half_x
+        pad_box = (x - half_x, y - half_y, x + half_x, y + half_y)
+        box = boxes[f]
+        if box == None:
+            boxes[f] = pad_box
+        else:
+            boxes[f] = (min(box[0], pad_box[0]), min(box[1], pad_box[1]), max(box[2], pad_box[2]), max(box[3], pad_box[3]))
+    return [(int(round(b[2] - b[0])), int(round(b[3] - b[1]))) if b != None else (0, 0) for b in boxes]
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Footprint bounding box benchmark')
+    parser.add_argument('--bgas', type=int, nargs='+', default=[10, 100, 400],
+            help="Number of BGAs to test (default = %(default)s)")
+    parser.add_argument('--balls', type=int, default=32,
+            help="Balls per side of the BGAs (default = %(default)s)")
+    parser.add_argument('--passives', type=int, default=10000,
+            help="Number of two pad parts (default = %(default)s)")
+    args = parser.parse_args()
+
+    print('%8s %10s %14s %12s %10s'%('bgas', 'pads', 'pad loop (s)', 'numpy (s)', 'speedup'))
+    for count in args.bgas:
+        snapshot = GenerateSnapshot(count, args.balls, args.passives)
+
+        t0 = time.time()
+        ref = PadLoopSizes(snapshot)
+        t_ref = time.time() - t0
+
+        t0 = time.time()
+        boxes = footprint_bbox.FootprintBoxes(snapshot)
+        t_new = time.time() - t0
+
+        new = list(zip(boxes['size_x'].tolist(), boxes['size_y'].tolist()))
+        # the pad positions are rounded to IU, the sizes can differ by 1
+        bad = [i for i, (a, b) in enumerate(zip(ref, new)) if abs(a[0] - b[0]) > 1 or abs(a[1] - b[1]) > 1]
+        if bad:
+            raise Exception('Size mismatch for footprint %d: %s %s'%(bad[0], ref[bad[0]], new[bad[0]]))
+
+        print('%8d %10d %14.3f %12.3f %10.1f'%(count, len(snapshot.pads), t_ref, t_new, t_ref / max(t_new, 1e-9)))
+
+
+if __name__=='__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+#!/usr/bin/env python2
+
+# Benchmark for the part database construction in plugin_output_assembly/output_assembly.py
+#
+# Compares the row by row processing of the part table (DataFrame.apply
+# with the row functions below, as output_assembly.py did before) with the
+# column-wise process_part_db() used by build_part_db, and checks that both
+# give the same table.
+#   > python benchmarks/bench_part_db.py
+
+import sys
+import os
+import re
+import time
+import random
+import argparse
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'plugin_output_assembly'))
+import output_assembly as oa
+
+
+def GeneratePartTable(count, seed=0):
+    """Synthetic table with the columns of the merged schematic and layout data."""
+
+    r = random.Random(seed)
+    prefixes = ['R', 'R', 'R', 'C', 'C', 'C', 'L', 'Y', 'U', 'D', 'FID', 'TP', 'MH', 'J', 'CP']
+    rows = []
+    for i in range(count):
+        prefix = r.choice(prefixes)
+        if prefix in ['R', 'C', 'L', 'Y', 'CP']:
+            footprint = '%s_%s'%(prefix, r.choice(['0402', '0603', '0805', '1206']))
+        else:
+            footprint = r.choice(['SOIC-8', 'QFN-32', 'TestPoint', 'Fiducial', 'Conn'])
+        if prefix == 'R':
+            value = r.choice(['10k', '4.7', '100', '0', '1M', 'DNI 10k', 'TOV 22'])
+        elif prefix == 'C':
+            value = r.choice(['100n', '1u', '10p', 'DNI', 'TOV 1u'])
+        else:
+            value = r.choice(['X', 'Y', 'DNI'])
+        manuf_part = r.choice(['', footprint + '-1', footprint + '-2 ALT1', footprint + '-3 ALT1 ALT2'])
+        rows.append([
+            '%s%d'%(prefix, i + 1),
+            value,
+            'Lib:' + footprint,
+            r.choice(['', 'Yageo', 'Murata']),
+            manuf_part,
+            '',
+            r.choice(['', '1%', '5%']),
+            footprint,
+            r.randint(0, 100000000),
+            r.randint(0, 100000000),
+            r.choice([0.0, 90.0, 180.0, 270.0]),
+            r.choice(['top', 'bottom']),
+            r.choice(['SMT', 'SMT', 'TH', 'VIRT']),
+            ])
+    return pd.DataFrame(rows, columns=['reference', 'value', 'footprint', 'manuf', 'manuf part', 'description',
+        'tolerance', 'footprint_pcb', 'pos_x', 'pos_y', 'rotation_deg', 'side', 'footprint_type'])
+
+
+def get_ref_prefix(row):
+    return re.match('^(.*?)\d', row['reference']).group(1)
+
+
+def get_footprint_short(row):
+    """Generate a short footprint string.
+    
+    For example remove the prefix: R_0402 -> 0402 
+    """
+
+    ref_prefix = row['ref_prefix']
+    if ref_prefix in oa.fooprint_short_spec.keys():
+        return oa.fooprint_short_spec[ref_prefix](row['footprint'])
+
+
+def split_part_numbers(row):
+    """Split part number string into main and alternates."""
+    
+    part_no = ''
+    part_no_alt = ''
+
+    if row['manuf part'] != '':
+        tmp = row['manuf part'].split(None, 1)
+        part_no = tmp[0]
+        if len(tmp) > 1:
+            part_no_alt = tmp[1]
+    row['manuf part'] = part_no
+    row['manuf part alt'] = part_no_alt
+            
+    return row
+
+
+def process_value(row):
+    """Cleanup the value field."""
+
+    if row['reference'].upper()[0] == 'R':
+        # Append ohms for resistor values w/o multiplier
+        if re.match('\d*\.*\d$', row['value']):
+            row['value'] = row['value'] + ' ohms'
+
+    return row
+
+
+def populate_status(row):
+
+    if row['ref_prefix'] in oa.config['DNI_ref_prefix']:
+        return False
+    for dni_pre in oa.config['DNI_val_prefix']:
+        if row['value'].startswith(dni_pre):
+            return False
+    return True
+
+
+def type_override_status(row):
+
+    if row['value'].startswith(tuple(oa.config['TOV_value_prefix'])):
+        return True
+    return False
+
+
+def ProcessRowWise(parts):
+    parts = parts.apply(process_value, axis=1)
+    parts['ref_prefix'] = parts.apply(get_ref_prefix, axis=1)
+    parts['footprint_lib'] = parts['footprint'].apply(lambda x: x.split(':',1)[0])
+    parts['footprint'] = parts['footprint'].apply(lambda x: x.split(':',1)[1])
+    parts['footprint_short'] = parts.apply(get_footprint_short, axis=1)
+    parts['populate'] = parts.apply(populate_status, axis=1)
+    parts['type_override'] = parts.apply(type_override_status, axis=1)
+    parts = parts.apply(split_part_numbers, axis=1)
+    return parts
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Part database construction benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+            help="Number of parts to test (default = %(default)s)")
+    args = parser.parse_args()
+
+    print('%10s %14s %14s %10s'%('parts', 'row-wise (s)', 'columns (s)', 'speedup'))
+    for count in args.sizes:
+        parts = GeneratePartTable(count)
+
+        t0 = time.time()
+        ref = ProcessRowWise(parts.copy())
+        t_ref = time.time() - t0
+
+        t0 = time.time()
+        new = oa.process_part_db(parts.copy())
+        t_new = time.time() - t0
+
+        if list(ref.columns) != list(new.columns) or not ref.equals(new):
+            raise Exception('Part table mismatch for %d parts'%count)
+
+        print('%10d %14.3f %14.3f %10.1f'%(count, t_ref, t_new, t_ref / max(t_new, 1e-9)))
+
+
+if __name__=='__main__':
+    sys.exit(main())
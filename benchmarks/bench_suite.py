@@ -0,0 +1,203 @@
+#!/usr/bin/env python2
+
+# Benchmark suite for the scripts on synthetic boards
+#
+# Runs DrillMap, DrillChart, build_part_db/get_bom_data, set_trace_widths and
+# the drill overlap check on boards generated by synthetic_board.py at
+# growing sizes, and records the time, the throughput (items per second) and
+# the peak memory of each run. The boards are built with synthetic_pcbnew.py, an
+# in-memory stand-in for the pcbnew objects used by the scripts, so the
+# suite runs headless without Kicad (pandas and numpy are needed):
+#   > python benchmarks/bench_suite.py
+#   > python benchmarks/bench_suite.py --footprints 1000 10000 --tools drill_map --report suite.json
+#
+# The peak memory is measured with tracemalloc (python 3) in a second run,
+# so the tracing overhead is not in the times. Without tracemalloc it is
+# the peak memory of the process (profiling.PeakMemoryKB), which only
+# grows over the suite.
+
+import sys
+import os
+import time
+import json
+import shutil
+import tempfile
+import argparse
+import collections
+
+try:
+    import tracemalloc
+except ImportError:
+    # python 2
+    tracemalloc = None
+
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(benchmarks_dir, '..'))
+sys.path.insert(0, os.path.join(benchmarks_dir, '..', 'plugin_drill_map'))
+sys.path.insert(0, os.path.join(benchmarks_dir, '..', 'plugin_output_assembly'))
+
+# the synthetic boards only work with the stand-in, also when Kicad is installed
+import synthetic_pcbnew
+synthetic_pcbnew.Install(force=True)
+
+import synthetic_board
+import board_snapshot
+import profiling
+import drill_map
+import output_assembly
+import track_width
+
+__version__ = '0.1'
+
+REPORT_VERSION = 1
+
+
+class NullLog(object):
+
+    def write(self, s):
+        pass
+
+    def flush(self):
+        pass
+
+
+def SetupDrillMap(board, work_dir):
+    snapshot = board_snapshot.ScanBoard(board)
+    holes = len(snapshot.vias) + sum([1 for x in snapshot.pads.drill_x if x > 0])
+    return lambda: drill_map.DrillMap(board=board, output_log=NullLog()), holes
+
+
+def SetupDrillChart(board, work_dir):
+    snapshot = board_snapshot.ScanBoard(board)
+    holes = len(snapshot.vias) + sum([1 for x in snapshot.pads.drill_x if x > 0])
+    return lambda: drill_map.DrillChart(board=board), holes
+
+
+def SetupPartDb(board, work_dir):
+    bom_fname = os.path.join(work_dir, 'bom.csv')
+    synthetic_board.GenerateBom(board, bom_fname)
+
+    def run():
+        parts = output_assembly.build_part_db(board, bom_fname)
+        output_assembly.get_bom_data(parts)
+
+    return run, len(board.GetModules())
+
+
+def SetupTrackWidths(board, work_dir):
+    target_widths = synthetic_board.GenerateTrackWidths(board.GetCopperLayerCount())
+    tracks = len([t for t in board.GetTracks() if type(t) is synthetic_pcbnew.TRACK])
+    return lambda: track_width.set_trace_widths(board, target_widths), tracks
+
+
+def SetupDrillOverlap(board, work_dir):
+    # same drill list as DrillMap
+    drill_list = drill_map.GetDrillList(drill_map.GetDrillPositions(board_snapshot.ScanBoard(board)))
+    return lambda: drill_map.FindDrillOverlaps(drill_list), len(drill_list)
+
+
+# name : function(board, work_dir) returning the function to time and the number of items it processes
+TOOLS = collections.OrderedDict([
+        ('drill_map',       SetupDrillMap),
+        ('drill_chart',     SetupDrillChart),
+        ('part_db',         SetupPartDb),
+        ('track_width',     SetupTrackWidths),
+        ('drill_overlap',   SetupDrillOverlap),
+        ])
+
+
+def RunTool(name, board_args, work_dir, repeat, measure_memory):
+    """Time a tool on fresh boards, return (items, seconds, peak memory KB)."""
+
+    best = None
+    for k in range(repeat):
+        # the tools change the board, each run gets its own
+        board = synthetic_board.GenerateBoard(**board_args)
+        func, items = TOOLS[name](board, work_dir)
+        t0 = time.time()
+        func()
+        seconds = time.time() - t0
+        if best == None or seconds < best:
+            best = seconds
+
+    peak_kb = None
+    if measure_memory:
+        board = synthetic_board.GenerateBoard(**board_args)
+        func, items = TOOLS[name](board, work_dir)
+        if tracemalloc != None:
+            tracemalloc.start()
+            func()
+            peak_kb = tracemalloc.get_traced_memory()[1] // 1024
+            tracemalloc.stop()
+        else:
+            func()
+            peak_kb = profiling.PeakMemoryKB()
+
+    return items, best, peak_kb
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark suite of the scripts on synthetic boards')
+    parser.add_argument('--footprints', type=int, nargs='+', default=[1000, 5000, 20000],
+            help="Number of footprints of the boards (default = %(default)s)")
+    parser.add_argument('--pads', type=int, default=4,
+            help="Average number of pads per footprint (default = %(default)s)")
+    parser.add_argument('--vias', type=float, default=2,
+            help="Number of vias per footprint (default = %(default)s)")
+    parser.add_argument('--tracks', type=float, default=10,
+            help="Number of tracks per footprint (default = %(default)s)")
+    parser.add_argument('--layers', type=int, default=4,
+            help="Number of copper layers (default = %(default)s)")
+    parser.add_argument('--seed', type=int, default=0,
+            help="Seed of the board generator (default = %(default)s)")
+    parser.add_argument('--tools', nargs='+', choices=list(TOOLS.keys()), default=list(TOOLS.keys()),
+            help="Tools to run (default = %(default)s)")
+    parser.add_argument('--repeat', type=int, default=1,
+            help="Number of timed runs, the best one is kept (default = %(default)s)")
+    parser.add_argument('--no_memory', action='store_true',
+            help="Do not measure the peak memory")
+    parser.add_argument('--report', default=None,
+            help="Write the results to a JSON file")
+    args = parser.parse_args()
+
+    memory_method = None
+    if not args.no_memory:
+        memory_method = 'tracemalloc' if tracemalloc != None else 'process'
+
+    results = []
+    work_dir = tempfile.mkdtemp(prefix='bench_suite')
+    try:
+        print('%-14s %10s %10s %10s %12s %10s'%('tool', 'footprints', 'items', 'time (s)', 'items/s', 'peak (MB)'))
+        for name in args.tools:
+            for footprints in args.footprints:
+                board_args = dict(
+                        footprints=footprints,
+                        pads=args.pads,
+                        vias=int(footprints * args.vias),
+                        layers=args.layers,
+                        tracks=int(footprints * args.tracks),
+                        seed=args.seed,
+                        )
+                items, seconds, peak_kb = RunTool(name, board_args, work_dir, args.repeat, not args.no_memory)
+                throughput = items / max(seconds, 1e-9)
+                print('%-14s %10d %10d %10.3f %12.0f %10s'%(name, footprints, items, seconds, throughput,
+                    '-' if peak_kb == None else '%.1f'%(peak_kb / 1024.0)))
+                sys.stdout.flush()
+                result = dict(tool=name, items=items, time=seconds, throughput=throughput, peak_memory_kb=peak_kb)
+                result.update(board_args)
+                results.append(result)
+    finally:
+        shutil.rmtree(work_dir)
+
+    if args.report != None:
+        report = {}
+        report['version'] = REPORT_VERSION
+        report['memory_method'] = memory_method
+        report['results'] = results
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=1)
+
+
+if __name__=='__main__':
+    sys.exit(main())
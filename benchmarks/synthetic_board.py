@@ -0,0 +1,149 @@
+#!/usr/bin/env python2
+
+# Synthetic boards for the benchmarks
+#
+# GenerateBoard() builds a synthetic_pcbnew board with the requested number
+# of footprints, pads per footprint, vias, copper layers and tracks, and
+# GenerateBom() writes the matching schematic BOM for build_part_db. The
+# boards are random but reproducible (seed).
+
+import random
+
+import synthetic_pcbnew as pcbnew
+
+NET_CLASSES = ['Default', '50_ohms', '90_ohms', 'PWR']
+
+# reference prefix, footprint, attributes (0 TH, 1 SMD, 2 virtual)
+FOOTPRINT_TYPES = [
+        ('R',   'R_0402',       1),
+        ('R',   'R_0603',       1),
+        ('C',   'C_0402',       1),
+        ('C',   'C_0805',       1),
+        ('L',   'L_0805',       1),
+        ('U',   'QFN-32',       1),
+        ('U',   'BGA-256',      1),
+        ('J',   'PinHeader',    0),
+        ('MH',  'MountingHole', 0),
+        ('TP',  'TestPoint',    2),
+        ]
+
+
+def GenerateBoard(footprints=1000, pads=4, vias=2000, layers=4, tracks=10000, seed=0):
+    """Board with footprints of about pads pads each, vias and tracks on layers copper layers."""
+
+    r = random.Random(seed)
+    board = pcbnew.BOARD()
+    board.SetFileName('synthetic.kicad_pcb')
+    board.SetCopperLayerCount(layers)
+
+    # square board, 1 mm2 per item
+    side = int(max(50, (footprints * max(pads, 1) + vias + tracks)**0.5) * pcbnew.IU_PER_MM)
+    for x0, y0, x1, y1 in [(0, 0, side, 0), (side, 0, side, side), (side, side, 0, side), (0, side, 0, 0)]:
+        edge = pcbnew.DRAWSEGMENT(board)
+        edge.SetStart(pcbnew.wxPoint(x0, y0))
+        edge.SetEnd(pcbnew.wxPoint(x1, y1))
+        edge.SetWidth(int(0.1 * pcbnew.IU_PER_MM))
+        edge.SetLayer(pcbnew.Edge_Cuts)
+        board.Add(edge)
+
+    nets = [pcbnew.NETINFO_ITEM(i + 1, 'N%d'%(i + 1), NET_CLASSES[i % len(NET_CLASSES)])
+            for i in range(max(1, footprints))]
+
+    pitch = int(0.5 * pcbnew.IU_PER_MM)
+    for i in range(footprints):
+        prefix, name, attributes = r.choice(FOOTPRINT_TYPES)
+        m = pcbnew.MODULE(board)
+        m.SetReference('%s%d'%(prefix, i + 1))
+        m.SetValue('%dk'%r.randint(1, 100) if prefix in ['R', 'C', 'L'] else name)
+        m.SetFPID(pcbnew.LIB_ID(name))
+        x = r.randint(0, side)
+        y = r.randint(0, side)
+        m.SetPosition(pcbnew.wxPoint(x, y))
+        orientation = r.choice([0.0, 900.0, 1800.0, 2700.0, 450.0])
+        m.SetOrientation(orientation)
+        m.SetAttributes(attributes)
+        m.SetFlipped(r.random() < 0.3)
+
+        pad_count = r.randint(1, 2 * pads - 1) if pads > 1 else pads
+        columns = int(pad_count**0.5) + 1
+        for k in range(pad_count):
+            p = pcbnew.D_PAD(m)
+            p.SetPosition(pcbnew.wxPoint(x + (k % columns) * pitch, y + (k // columns) * pitch))
+            p.SetSize(pcbnew.wxSize(int(0.3 * pcbnew.IU_PER_MM), int(0.4 * pcbnew.IU_PER_MM)))
+            p.SetOrientation(orientation)
+            p.SetShape(r.choice([pcbnew.PAD_SHAPE_RECT, pcbnew.PAD_SHAPE_CIRCLE, pcbnew.PAD_SHAPE_OVAL]))
+            if attributes == 0:
+                p.SetAttribute(pcbnew.PAD_ATTRIB_STANDARD if prefix != 'MH' else pcbnew.PAD_ATTRIB_HOLE_NOT_PLATED)
+                if r.random() < 0.1:
+                    p.SetDrillShape(pcbnew.PAD_DRILL_SHAPE_OBLONG)
+                    p.SetDrillSize(pcbnew.wxSize(int(0.6 * pcbnew.IU_PER_MM), int(1.2 * pcbnew.IU_PER_MM)))
+                else:
+                    drill = int(r.choice([0.8, 1.0, 1.2]) * pcbnew.IU_PER_MM)
+                    p.SetDrillSize(pcbnew.wxSize(drill, drill))
+            m.Add(p)
+
+        courtyard = pcbnew.EDGE_MODULE(m)
+        courtyard.SetLayer(pcbnew.F_CrtYd)
+        courtyard.SetStart0(pcbnew.wxPoint(-pitch, -pitch))
+        courtyard.SetEnd0(pcbnew.wxPoint(columns * pitch, -pitch))
+        courtyard.SetWidth(int(0.05 * pcbnew.IU_PER_MM))
+        m.Add(courtyard)
+        board.Add(m)
+
+    for i in range(vias):
+        v = pcbnew.VIA(board)
+        v.SetPosition(pcbnew.wxPoint(r.randint(0, side), r.randint(0, side)))
+        v.SetDrill(int(r.choice([0.2, 0.3, 0.4]) * pcbnew.IU_PER_MM))
+        v.SetNet(r.choice(nets))
+        board.Add(v)
+
+    copper_layers = list(range(layers - 1)) + [pcbnew.B_Cu]
+    for i in range(tracks):
+        t = pcbnew.TRACK(board)
+        x = r.randint(0, side)
+        y = r.randint(0, side)
+        t.SetStart(pcbnew.wxPoint(x, y))
+        t.SetEnd(pcbnew.wxPoint(x + r.randint(-5, 5) * pitch, y + r.randint(-5, 5) * pitch))
+        t.SetWidth(int(r.choice([0.1, 0.127, 0.2, 0.3]) * pcbnew.IU_PER_MM))
+        t.SetLayer(r.choice(copper_layers))
+        t.SetNet(r.choice(nets))
+        board.Add(t)
+
+    return board
+
+
+def GenerateBom(board, fname, seed=0):
+    """Write the schematic BOM (csv) of the footprints of board."""
+
+    r = random.Random(seed)
+    with open(fname, 'w') as f:
+        f.write('Reference,Value,Footprint,Manuf,Manuf Part,Description,Tolerance,Voltage\n')
+        for m in board.GetModules():
+            name = m.GetFPID().GetLibItemName().c_str()
+            value = m.GetValue()
+            if r.random() < 0.05:
+                value = 'DNI ' + value
+            f.write('%s\n'%','.join([
+                m.GetReference(),
+                value,
+                'Lib:' + name,
+                r.choice(['Yageo', 'Murata', 'TI']),
+                r.choice(['%s-%s'%(name, m.GetValue()), '%s-%s ALT1'%(name, m.GetValue())]),
+                '',
+                r.choice(['1%', '5%', '']),
+                r.choice(['16V', '']),
+                ]))
+
+
+def GenerateTrackWidths(layers):
+    """Target widths (track_width.json format) for the copper layers of GenerateBoard."""
+
+    layer_names = [pcbnew.LAYER_NAMES[layer] for layer in range(layers - 1)] + ['B.Cu']
+    ret = {}
+    for i, nc in enumerate(NET_CLASSES[1:]):
+        width_map = {'Default' : 6 + i}
+        for k, layer_name in enumerate(layer_names):
+            if k % 2 == 0:
+                width_map[layer_name] = 4 + i + k * 0.1
+        ret[nc] = width_map
+    return ret
@@ -0,0 +1,558 @@
+#!/usr/bin/env python2
+
+# In-memory stand-in for the pcbnew module
+#
+# Implements the part of the pcbnew python interface used by the scripts
+# (board items, the constants, the unit conversions) with plain python
+# objects, so the benchmarks can run on a machine without Kicad. Nothing is
+# plotted or saved. The objects are faster than the real SWIG objects, the
+# timings are useful for comparing the python side of two versions of the
+# scripts, not for predicting the run time in Kicad.
+#
+# Install() must be called before importing the scripts:
+#   import synthetic_pcbnew
+#   synthetic_pcbnew.Install()
+#   import drill_map
+
+import sys
+
+IU_PER_MM = 1e6
+IU_PER_MILS = IU_PER_MM * 0.0254
+
+# Kicad 5 values
+PCB_LAYER_ID_COUNT = 50
+F_Cu = 0
+B_Cu = 31
+B_Paste = 34
+F_Paste = 35
+B_SilkS = 36
+F_SilkS = 37
+B_Mask = 38
+F_Mask = 39
+Dwgs_User = 40
+Cmts_User = 41
+Eco1_User = 42
+Eco2_User = 43
+Edge_Cuts = 44
+B_CrtYd = 46
+F_CrtYd = 47
+
+PAD_ATTRIB_STANDARD = 0
+PAD_ATTRIB_SMD = 1
+PAD_ATTRIB_CONN = 2
+PAD_ATTRIB_HOLE_NOT_PLATED = 3
+PAD_DRILL_SHAPE_CIRCLE = 1
+PAD_DRILL_SHAPE_OBLONG = 2
+PAD_SHAPE_CIRCLE = 0
+PAD_SHAPE_RECT = 1
+PAD_SHAPE_OVAL = 2
+
+S_SEGMENT = 0
+S_ARC = 2
+S_CIRCLE = 3
+
+GR_TEXT_HJUSTIFY_LEFT = -1
+GR_TEXT_HJUSTIFY_CENTER = 0
+
+LAYER_NAMES = {
+        B_Paste : 'B.Paste', F_Paste : 'F.Paste', B_SilkS : 'B.SilkS', F_SilkS : 'F.SilkS',
+        B_Mask : 'B.Mask', F_Mask : 'F.Mask', Dwgs_User : 'Dwgs.User', Cmts_User : 'Cmts.User',
+        Eco1_User : 'Eco1.User', Eco2_User : 'Eco2.User', Edge_Cuts : 'Edge.Cuts',
+        B_CrtYd : 'B.CrtYd', F_CrtYd : 'F.CrtYd',
+        }
+LAYER_NAMES[F_Cu] = 'F.Cu'
+LAYER_NAMES[B_Cu] = 'B.Cu'
+LAYER_NAMES.update((layer, 'In%d.Cu'%layer) for layer in range(1, B_Cu))
+LAYER_IDS = dict([(name, layer) for layer, name in LAYER_NAMES.items()])
+
+
+def FromMM(mm):
+    return int(mm * IU_PER_MM)
+
+def ToMM(iu):
+    return iu / IU_PER_MM
+
+def FromMils(mils):
+    return int(mils * IU_PER_MILS)
+
+def ToMils(iu):
+    return iu / IU_PER_MILS
+
+
+class wxPoint(object):
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+    def Get(self):
+        return (self.x, self.y)
+
+
+class wxSize(wxPoint):
+    pass
+
+
+class EDA_RECT(object):
+
+    def __init__(self, x0, y0, x1, y1):
+        self.x0 = x0
+        self.y0 = y0
+        self.x1 = x1
+        self.y1 = y1
+
+    def Merge(self, rect):
+        self.x0 = min(self.x0, rect.x0)
+        self.y0 = min(self.y0, rect.y0)
+        self.x1 = max(self.x1, rect.x1)
+        self.y1 = max(self.y1, rect.y1)
+
+    def GetX(self):
+        return self.x0
+
+    def GetY(self):
+        return self.y0
+
+    def GetWidth(self):
+        return self.x1 - self.x0
+
+    def GetHeight(self):
+        return self.y1 - self.y0
+
+
+class BOARD_ITEM(object):
+
+    def __init__(self, board=None):
+        self._board = board
+        self._layer = F_Cu
+        self._timestamp = 0
+
+    def GetLayer(self):
+        return self._layer
+
+    def SetLayer(self, layer):
+        self._layer = layer
+
+    def GetLayerName(self):
+        return LAYER_NAMES.get(self._layer, '')
+
+    def GetTimeStamp(self):
+        return self._timestamp
+
+    def SetTimeStamp(self, timestamp):
+        self._timestamp = timestamp
+
+    def DeleteStructure(self):
+        self._board.Remove(self)
+
+
+class DRAWSEGMENT(BOARD_ITEM):
+
+    def __init__(self, board=None):
+        BOARD_ITEM.__init__(self, board)
+        self._shape = S_SEGMENT
+        self._start = wxPoint(0, 0)
+        self._end = wxPoint(0, 0)
+        self._width = 0
+        self._angle = 0.0
+
+    def GetShape(self):
+        return self._shape
+
+    def SetShape(self, shape):
+        self._shape = shape
+
+    def GetStart(self):
+        return self._start
+
+    def SetStart(self, point):
+        self._start = point
+
+    def GetEnd(self):
+        return self._end
+
+    def SetEnd(self, point):
+        self._end = point
+
+    def GetCenter(self):
+        return self._start
+
+    def GetRadius(self):
+        return int(((self._end.x - self._start.x)**2 + (self._end.y - self._start.y)**2)**0.5)
+
+    def GetAngle(self):
+        return self._angle
+
+    def GetWidth(self):
+        return self._width
+
+    def SetWidth(self, width):
+        self._width = width
+
+    def GetBoundingBox(self):
+        if self._shape == S_CIRCLE:
+            r = self.GetRadius()
+            return EDA_RECT(self._start.x - r, self._start.y - r, self._start.x + r, self._start.y + r)
+        return EDA_RECT(min(self._start.x, self._end.x), min(self._start.y, self._end.y),
+                max(self._start.x, self._end.x), max(self._start.y, self._end.y))
+
+
+class EDGE_MODULE(DRAWSEGMENT):
+    """Footprint drawing, with the coordinates relative to the footprint (Start0, End0)."""
+
+    def __init__(self, module=None):
+        DRAWSEGMENT.__init__(self, module)
+        self._start0 = wxPoint(0, 0)
+        self._end0 = wxPoint(0, 0)
+
+    def GetStart0(self):
+        return self._start0
+
+    def SetStart0(self, point):
+        self._start0 = point
+
+    def GetEnd0(self):
+        return self._end0
+
+    def SetEnd0(self, point):
+        self._end0 = point
+
+
+class TEXTE_PCB(BOARD_ITEM):
+
+    def __init__(self, board=None):
+        BOARD_ITEM.__init__(self, board)
+        self._text = ''
+        self._position = wxPoint(0, 0)
+        self._size = wxSize(0, 0)
+        self._thickness = 0
+        self._justify = GR_TEXT_HJUSTIFY_CENTER
+
+    def GetText(self):
+        return self._text
+
+    def SetText(self, text):
+        self._text = text
+
+    def GetPosition(self):
+        return self._position
+
+    def SetPosition(self, point):
+        self._position = point
+
+    def SetTextSize(self, size):
+        self._size = size
+
+    def SetThickness(self, thickness):
+        self._thickness = thickness
+
+    def SetHorizJustify(self, justify):
+        self._justify = justify
+
+
+class NETINFO_ITEM(object):
+
+    def __init__(self, netcode, name, class_name='Default'):
+        self._netcode = netcode
+        self._name = name
+        self._class_name = class_name
+
+    def GetNet(self):
+        return self._netcode
+
+    def GetNetname(self):
+        return self._name
+
+    def GetClassName(self):
+        return self._class_name
+
+
+class TRACK(BOARD_ITEM):
+
+    def __init__(self, board=None):
+        BOARD_ITEM.__init__(self, board)
+        self._start = wxPoint(0, 0)
+        self._end = wxPoint(0, 0)
+        self._width = 0
+        self._net = None
+
+    def GetStart(self):
+        return self._start
+
+    def SetStart(self, point):
+        self._start = point
+
+    def GetEnd(self):
+        return self._end
+
+    def SetEnd(self, point):
+        self._end = point
+
+    def GetPosition(self):
+        return self._start
+
+    def GetWidth(self):
+        return self._width
+
+    def SetWidth(self, width):
+        self._width = width
+
+    def GetNet(self):
+        return self._net
+
+    def SetNet(self, net):
+        self._net = net
+
+    def GetNetCode(self):
+        return self._net.GetNet()
+
+    def GetNetname(self):
+        return self._net.GetNetname()
+
+
+class VIA(TRACK):
+
+    def __init__(self, board=None):
+        TRACK.__init__(self, board)
+        self._drill = 0
+
+    def SetPosition(self, point):
+        self._start = point
+        self._end = point
+
+    def GetDrillValue(self):
+        return self._drill
+
+    def SetDrill(self, drill):
+        self._drill = drill
+
+
+class D_PAD(BOARD_ITEM):
+
+    def __init__(self, module=None):
+        BOARD_ITEM.__init__(self, module)
+        self._position = wxPoint(0, 0)
+        self._size = wxSize(0, 0)
+        self._orientation = 0.0
+        self._shape = PAD_SHAPE_RECT
+        self._attribute = PAD_ATTRIB_SMD
+        self._drill_shape = PAD_DRILL_SHAPE_CIRCLE
+        self._drill = wxSize(0, 0)
+
+    def GetPosition(self):
+        return self._position
+
+    def SetPosition(self, point):
+        self._position = point
+
+    def GetSize(self):
+        return self._size
+
+    def SetSize(self, size):
+        self._size = size
+
+    def GetOrientation(self):
+        return self._orientation
+
+    def SetOrientation(self, orientation):
+        self._orientation = orientation
+
+    def GetShape(self):
+        return self._shape
+
+    def SetShape(self, shape):
+        self._shape = shape
+
+    def GetAttribute(self):
+        return self._attribute
+
+    def SetAttribute(self, attribute):
+        self._attribute = attribute
+
+    def GetDrillShape(self):
+        return self._drill_shape
+
+    def SetDrillShape(self, shape):
+        self._drill_shape = shape
+
+    def GetDrillSize(self):
+        return self._drill
+
+    def SetDrillSize(self, size):
+        self._drill = size
+
+
+class LIB_ID(object):
+
+    def __init__(self, name):
+        self._name = name
+
+    def GetLibItemName(self):
+        return self
+
+    def c_str(self):
+        return self._name
+
+
+class MODULE(BOARD_ITEM):
+
+    def __init__(self, board=None):
+        BOARD_ITEM.__init__(self, board)
+        self._reference = ''
+        self._value = ''
+        self._fpid = LIB_ID('')
+        self._position = wxPoint(0, 0)
+        self._orientation = 0.0
+        self._attributes = 0
+        self._flipped = False
+        self._pads = []
+        self._drawings = []
+
+    def GetReference(self):
+        return self._reference
+
+    def SetReference(self, reference):
+        self._reference = reference
+
+    def GetValue(self):
+        return self._value
+
+    def SetValue(self, value):
+        self._value = value
+
+    def GetFPID(self):
+        return self._fpid
+
+    def SetFPID(self, fpid):
+        self._fpid = fpid
+
+    def GetPosition(self):
+        return self._position
+
+    def GetCenter(self):
+        return self._position
+
+    def SetPosition(self, point):
+        self._position = point
+
+    def GetOrientation(self):
+        return self._orientation
+
+    def SetOrientation(self, orientation):
+        self._orientation = orientation
+
+    def GetAttributes(self):
+        return self._attributes
+
+    def SetAttributes(self, attributes):
+        self._attributes = attributes
+
+    def IsFlipped(self):
+        return self._flipped
+
+    def SetFlipped(self, flipped):
+        self._flipped = flipped
+
+    def Pads(self):
+        return self._pads
+
+    def Add(self, item):
+        item._board = self
+        if isinstance(item, D_PAD):
+            self._pads.append(item)
+        else:
+            self._drawings.append(item)
+
+    def GraphicalItems(self):
+        return self._drawings
+
+
+class BOARD(object):
+
+    def __init__(self):
+        self._file_name = ''
+        self._copper_layer_count = 2
+        self._aux_origin = wxPoint(0, 0)
+        self._modules = []
+        self._tracks = []
+        self._drawings = []
+
+    def GetFileName(self):
+        return self._file_name
+
+    def SetFileName(self, file_name):
+        self._file_name = file_name
+
+    def GetCopperLayerCount(self):
+        return self._copper_layer_count
+
+    def SetCopperLayerCount(self, count):
+        self._copper_layer_count = count
+
+    def GetAuxOrigin(self):
+        return self._aux_origin
+
+    def SetAuxOrigin(self, point):
+        self._aux_origin = point
+
+    def GetLayerID(self, name):
+        return LAYER_IDS.get(name, -1)
+
+    def GetLayerName(self, layer):
+        return LAYER_NAMES.get(layer, '')
+
+    def BuildListOfNets(self):
+        pass
+
+    def GetModules(self):
+        return self._modules
+
+    def GetTracks(self):
+        return self._tracks
+
+    def GetDrawings(self):
+        # a copy, the scripts delete drawings while iterating
+        return list(self._drawings)
+
+    def Add(self, item):
+        item._board = self
+        if isinstance(item, MODULE):
+            self._modules.append(item)
+        elif isinstance(item, TRACK):
+            self._tracks.append(item)
+        else:
+            self._drawings.append(item)
+
+    def Remove(self, item):
+        if isinstance(item, MODULE):
+            self._modules.remove(item)
+        elif isinstance(item, TRACK):
+            self._tracks.remove(item)
+        else:
+            self._drawings.remove(item)
+
+
+def GetBoard():
+    return None
+
+
+def LoadBoard(fname):
+    raise Exception('Error: Boards can not be loaded without Kicad: %s'%fname)
+
+
+def SaveBoard(fname, board):
+    # nothing to save, the benchmarks only time the board changes
+    return True
+
+
+def Install(force=False):
+    """Use this module as pcbnew if the Kicad module can not be imported (always with force)."""
+
+    if not force:
+        try:
+            import pcbnew
+            return pcbnew
+        except ImportError:
+            pass
+    sys.modules['pcbnew'] = sys.modules[__name__]
+    return sys.modules[__name__]
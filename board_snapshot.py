@@ -0,0 +1,340 @@
+#!/usr/bin/env python2
+
+# Board data extraction shared by the scripts
+#
+# The board is crawled once and the data needed by the scripts (pads, vias,
+# tracks, footprints) is stored in columnar tables. Walking the board through
+# the python interface is slow on large boards, so a snapshot can be passed
+# to DrillMap, OutputAssembly and set_trace_widths when they are run back to
+# back on the same board.
+#
+# The snapshot can also be read from the board file without Kicad, see
+# kicad_pcb.py
+
+import math
+from array import array
+
+try:
+    import pcbnew
+except ImportError:
+    pcbnew = None
+
+
+if pcbnew != None:
+    IU_PER_MM = pcbnew.IU_PER_MM
+    IU_PER_MILS = pcbnew.IU_PER_MILS
+    PCB_LAYER_ID_COUNT = pcbnew.PCB_LAYER_ID_COUNT
+    F_Cu = pcbnew.F_Cu
+    B_Cu = pcbnew.B_Cu
+    Edge_Cuts = pcbnew.Edge_Cuts
+    PAD_ATTRIB_STANDARD = pcbnew.PAD_ATTRIB_STANDARD
+    PAD_ATTRIB_SMD = pcbnew.PAD_ATTRIB_SMD
+    PAD_ATTRIB_CONN = pcbnew.PAD_ATTRIB_CONN
+    PAD_ATTRIB_HOLE_NOT_PLATED = pcbnew.PAD_ATTRIB_HOLE_NOT_PLATED
+    PAD_DRILL_SHAPE_CIRCLE = pcbnew.PAD_DRILL_SHAPE_CIRCLE
+    PAD_DRILL_SHAPE_OBLONG = pcbnew.PAD_DRILL_SHAPE_OBLONG
+    PAD_SHAPE_CIRCLE = pcbnew.PAD_SHAPE_CIRCLE
+    PAD_SHAPE_OVAL = pcbnew.PAD_SHAPE_OVAL
+    F_CrtYd = pcbnew.F_CrtYd
+    B_CrtYd = pcbnew.B_CrtYd
+    S_SEGMENT = pcbnew.S_SEGMENT
+    S_ARC = pcbnew.S_ARC
+    S_CIRCLE = pcbnew.S_CIRCLE
+else:
+    # Kicad 5 values
+    IU_PER_MM = 1e6
+    IU_PER_MILS = IU_PER_MM * 0.0254
+    PCB_LAYER_ID_COUNT = 50
+    F_Cu = 0
+    B_Cu = 31
+    Edge_Cuts = 44
+    PAD_ATTRIB_STANDARD = 0
+    PAD_ATTRIB_SMD = 1
+    PAD_ATTRIB_CONN = 2
+    PAD_ATTRIB_HOLE_NOT_PLATED = 3
+    PAD_DRILL_SHAPE_CIRCLE = 1
+    PAD_DRILL_SHAPE_OBLONG = 2
+    PAD_SHAPE_CIRCLE = 0
+    PAD_SHAPE_OVAL = 2
+    F_CrtYd = 47
+    B_CrtYd = 46
+    S_SEGMENT = 0
+    S_ARC = 2
+    S_CIRCLE = 3
+
+
+def ToMM(iu):
+    return iu / IU_PER_MM
+
+def ToMils(iu):
+    return iu / IU_PER_MILS
+
+# same rounding of the pcbnew functions
+def FromMM(mm):
+    return int(float(mm) * IU_PER_MM)
+
+def FromMils(mils):
+    return int(float(mils) * IU_PER_MILS)
+
+
+def RotatePoint(x, y, angle_deg):
+    """Rotate a point like Kicad RotatePoint() (counterclockwise on screen, y axis down)."""
+    angle = angle_deg % 360
+    if angle == 0:
+        return x, y
+    if angle == 90:
+        return y, -x
+    if angle == 180:
+        return -x, -y
+    if angle == 270:
+        return -y, x
+    a = math.radians(angle)
+    c = math.cos(a)
+    s = math.sin(a)
+    return int(round(x * c + y * s)), int(round(y * c - x * s))
+
+
+def ArcPoints(cx, cy, x, y, sweep_deg):
+    """End points of an arc plus its extreme points along the axes.
+
+    The arc has center (cx, cy), starts at (x, y) and turns by sweep_deg.
+    """
+    radius = math.hypot(x - cx, y - cy)
+    a0 = math.degrees(math.atan2(y - cy, x - cx))
+    angles = [a0, a0 + sweep_deg] + [90.0 * k for k in range(-8, 9) if min(a0, a0 + sweep_deg) <= 90.0 * k <= max(a0, a0 + sweep_deg)]
+    return [(cx + radius * math.cos(math.radians(a)), cy + radius * math.sin(math.radians(a))) for a in angles]
+
+
+class Table(object):
+    """Columnar table.
+
+    Numeric columns are stored in arrays, the other columns (typecode None)
+    in lists. Columns are accessed as attributes.
+    """
+
+    def __init__(self, columns):
+        self.columns = [name for name, typecode in columns]
+        for name, typecode in columns:
+            if typecode:
+                setattr(self, name, array(typecode))
+            else:
+                setattr(self, name, [])
+
+    def __len__(self):
+        return len(getattr(self, self.columns[0]))
+
+
+class BoardSnapshot(object):
+    """Board data needed by the scripts, stored in columnar tables."""
+
+    def __init__(self):
+        self.file_name = ''
+        self.aux_origin = (0, 0)
+        # bounding box of the Edge.Cuts drawings (x0, y0, x1, y1), None if there are no edges
+        self.edge_bbox = None
+        self.copper_layer_count = 0
+        self.layer_names = {}
+
+        self.net_names = {}
+        self.net_classes = {}
+
+        self.footprints = Table([
+            ('reference',     None),
+            ('value',         None),
+            ('footprint',     None),
+            ('pos_x',         'l'),
+            ('pos_y',         'l'),
+            ('orientation',   'd'),  # tenths of degree
+            ('attributes',    'l'),
+            ('flipped',       'b'),
+            ('pad_count',     'l'),
+            ])
+
+        self.pads = Table([
+            ('footprint',     'l'),  # index in the footprint table
+            ('pos_x',         'l'),
+            ('pos_y',         'l'),
+            ('attribute',     'l'),
+            ('drill_shape',   'l'),
+            ('drill_x',       'l'),
+            ('drill_y',       'l'),
+            ('size_x',        'l'),
+            ('size_y',        'l'),
+            ('orientation',   'd'),  # tenths of degree, absolute
+            ('shape',         'l'),
+            ])
+
+        # courtyard drawings of the footprints, as points with a radius (the
+        # ends of the lines with half the line width, the centers of the
+        # circles, the points of the arcs and polygons)
+        self.courtyards = Table([
+            ('footprint',     'l'),  # index in the footprint table
+            ('x',             'l'),
+            ('y',             'l'),
+            ('radius',        'l'),
+            ])
+
+        self.vias = Table([
+            ('pos_x',         'l'),
+            ('pos_y',         'l'),
+            ('drill',         'l'),
+            ('netcode',       'l'),
+            ])
+
+        self.tracks = Table([
+            ('start_x',       'l'),
+            ('start_y',       'l'),
+            ('end_x',         'l'),
+            ('end_y',         'l'),
+            ('width',         'l'),
+            ('layer',         'l'),
+            ('netcode',       'l'),
+            ])
+
+        # pcbnew objects of the tracks, in the same order of the track table
+        # (empty if the snapshot was not created from a pcbnew board)
+        self.track_items = []
+
+    def GetLayerName(self, layer):
+        return self.layer_names.get(layer, '')
+
+
+def AddCourtyardDrawing(courtyards, index, m, d):
+    """Add the points of a courtyard drawing of the footprint m."""
+
+    shape = d.GetShape()
+    radius = d.GetWidth() // 2
+    start = d.GetStart()
+    end = d.GetEnd()
+    if shape == S_SEGMENT:
+        points = [(start.x, start.y), (end.x, end.y)]
+    elif shape == S_CIRCLE:
+        points = [(start.x, start.y)]
+        radius += int(round(math.hypot(end.x - start.x, end.y - start.y)))
+    elif shape == S_ARC:
+        # in the footprint frame, for the extreme points along the footprint axes
+        start = d.GetStart0()
+        end = d.GetEnd0()
+        pos = m.GetPosition()
+        points = []
+        for x, y in ArcPoints(start.x, start.y, end.x, end.y, d.GetAngle() / 10.0):
+            x, y = RotatePoint(x, y, m.GetOrientation() / 10.0)
+            points.append((pos.x + x, pos.y + y))
+    else:
+        rect = d.GetBoundingBox()
+        points = [(rect.GetX(), rect.GetY()), (rect.GetX() + rect.GetWidth(), rect.GetY() + rect.GetHeight()),
+                (rect.GetX(), rect.GetY() + rect.GetHeight()), (rect.GetX() + rect.GetWidth(), rect.GetY())]
+
+    for x, y in points:
+        courtyards.footprint.append(index)
+        courtyards.x.append(int(round(x)))
+        courtyards.y.append(int(round(y)))
+        courtyards.radius.append(radius)
+
+
+# tables of ScanBoard, as in kicad_pcb.TABLE_SECTIONS
+SCAN_TABLES = ['footprints', 'pads', 'vias', 'tracks', 'edges']
+
+
+def ScanBoard(board, tables=None):
+    """Create a snapshot of a pcbnew board with one pass over its items.
+
+    tables limits the items read to some of the tables of the snapshot (see
+    SCAN_TABLES), the other tables are left empty. The footprints, their
+    pads and courtyards are read together, like the vias and the tracks.
+    """
+
+    if tables == None:
+        tables = SCAN_TABLES
+
+    # without this the netclass information is lost
+    board.BuildListOfNets()
+
+    snapshot = BoardSnapshot()
+    snapshot.file_name = board.GetFileName()
+    snapshot.aux_origin = tuple(board.GetAuxOrigin().Get())
+    snapshot.copper_layer_count = board.GetCopperLayerCount()
+    for layer in range(PCB_LAYER_ID_COUNT):
+        snapshot.layer_names[layer] = board.GetLayerName(layer)
+
+    footprints = snapshot.footprints
+    pads = snapshot.pads
+    modules = board.GetModules() if 'footprints' in tables or 'pads' in tables else []
+    for i, m in enumerate(modules):
+        pos = m.GetCenter()
+        footprints.reference.append(m.GetReference())
+        footprints.value.append(m.GetValue())
+        footprints.footprint.append(m.GetFPID().GetLibItemName().c_str())
+        footprints.pos_x.append(pos.x)
+        footprints.pos_y.append(pos.y)
+        footprints.orientation.append(m.GetOrientation())
+        footprints.attributes.append(m.GetAttributes())
+        footprints.flipped.append(bool(m.IsFlipped()))
+
+        pad_count = 0
+        for p in m.Pads():
+            pad_count += 1
+            pos = p.GetPosition()
+            drill = p.GetDrillSize()
+            size = p.GetSize()
+            pads.footprint.append(i)
+            pads.pos_x.append(pos.x)
+            pads.pos_y.append(pos.y)
+            pads.attribute.append(p.GetAttribute())
+            pads.drill_shape.append(p.GetDrillShape())
+            pads.drill_x.append(drill.x)
+            pads.drill_y.append(drill.y)
+            pads.size_x.append(size.x)
+            pads.size_y.append(size.y)
+            pads.orientation.append(p.GetOrientation())
+            pads.shape.append(p.GetShape())
+        footprints.pad_count.append(pad_count)
+
+        for d in m.GraphicalItems():
+            # the texts are also in the graphical items
+            if type(d) is not pcbnew.EDGE_MODULE or d.GetLayer() not in (F_CrtYd, B_CrtYd):
+                continue
+            AddCourtyardDrawing(snapshot.courtyards, i, m, d)
+
+    vias = snapshot.vias
+    tracks = snapshot.tracks
+    board_tracks = board.GetTracks() if 'vias' in tables or 'tracks' in tables else []
+    for t in board_tracks:
+        netcode = t.GetNetCode()
+        if netcode not in snapshot.net_names:
+            # resolve each net only once
+            net = t.GetNet()
+            snapshot.net_names[netcode] = net.GetNetname()
+            snapshot.net_classes[netcode] = net.GetClassName()
+
+        if type(t) is pcbnew.VIA:
+            pos = t.GetPosition()
+            vias.pos_x.append(pos.x)
+            vias.pos_y.append(pos.y)
+            vias.drill.append(t.GetDrillValue())
+            vias.netcode.append(netcode)
+        elif type(t) is pcbnew.TRACK:
+            start = t.GetStart()
+            end = t.GetEnd()
+            tracks.start_x.append(start.x)
+            tracks.start_y.append(start.y)
+            tracks.end_x.append(end.x)
+            tracks.end_y.append(end.y)
+            tracks.width.append(t.GetWidth())
+            tracks.layer.append(t.GetLayer())
+            tracks.netcode.append(netcode)
+            snapshot.track_items.append(t)
+
+    rect = None
+    drawings = board.GetDrawings() if 'edges' in tables else []
+    for d in drawings:
+        if d.GetLayer() != Edge_Cuts:
+            continue
+        if rect == None:
+            rect = d.GetBoundingBox()
+        else:
+            rect.Merge(d.GetBoundingBox())
+    if rect != None:
+        snapshot.edge_bbox = (rect.GetX(), rect.GetY(), rect.GetX() + rect.GetWidth(), rect.GetY() + rect.GetHeight())
+
+    return snapshot
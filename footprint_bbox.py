@@ -0,0 +1,141 @@
+#!/usr/bin/env python2
+
+# Bounding boxes of the footprints
+#
+# The pads and the courtyard drawings of the footprints are covered by
+# points with a radius: the corners of the rectangular pads, the centers of
+# the round pads, the centers of the ends of the oval pads and the points of
+# the courtyard drawings (see board_snapshot.py). The boxes are computed in
+# the frame of each footprint, so the size of a footprint does not depend on
+# its rotation, for all the footprints at once with numpy.
+
+import numpy as np
+
+import board_snapshot
+
+BBOX_MODES = ['pads', 'courtyard']
+
+
+def Column(table, name):
+    """Numpy array with the data of a numeric column of a board_snapshot.Table."""
+
+    data = getattr(table, name)
+    if len(data) == 0:
+        return np.zeros(0, dtype=data.typecode)
+    return np.frombuffer(data, dtype=data.typecode)
+
+
+def PadPoints(pads):
+    """Points covering the pads: (footprint index, x, y, radius) arrays, 4 points per pad.
+
+    Pads that are not round or oval are covered by the corners of their size
+    (e.g. the size of the anchor of custom pads).
+    """
+
+    half_x = Column(pads, 'size_x') / 2.0
+    half_y = Column(pads, 'size_y') / 2.0
+    shape = Column(pads, 'shape')
+    circle = shape == board_snapshot.PAD_SHAPE_CIRCLE
+    oval = shape == board_snapshot.PAD_SHAPE_OVAL
+    radius = np.where(circle, half_x, np.where(oval, np.minimum(half_x, half_y), 0.0))
+    # corners at (+-ax, +-ay) from the pad center, the same point for round pads
+    ax = half_x - radius
+    ay = np.where(circle, 0.0, half_y - radius)
+
+    angle = np.radians(Column(pads, 'orientation') / 10.0)
+    c = np.cos(angle)
+    s = np.sin(angle)
+    pos_x = Column(pads, 'pos_x')
+    pos_y = Column(pads, 'pos_y')
+    x = []
+    y = []
+    for sx, sy in [(-1, -1), (-1, 1), (1, -1), (1, 1)]:
+        # Kicad RotatePoint()
+        dx = sx * ax
+        dy = sy * ay
+        x.append(pos_x + dx * c + dy * s)
+        y.append(pos_y + dy * c - dx * s)
+
+    # the points of a pad are consecutive, so the points stay sorted by footprint
+    return (np.repeat(Column(pads, 'footprint'), 4), np.stack(x, axis=1).ravel(),
+            np.stack(y, axis=1).ravel(), np.repeat(radius, 4))
+
+
+def CourtyardPoints(courtyards):
+    """Points covering the courtyard drawings: (footprint index, x, y, radius) arrays."""
+
+    return (Column(courtyards, 'footprint'), Column(courtyards, 'x').astype(float),
+            Column(courtyards, 'y').astype(float), Column(courtyards, 'radius').astype(float))
+
+
+def PointBoxes(footprints, index, x, y, radius):
+    """Boxes of the points of each footprint, in the footprint frame.
+
+    Returns the number of points and the box (x0, y0, x1, y1) relative to the
+    footprint position of each footprint, the boxes of the footprints without
+    points are empty.
+    """
+
+    count = len(footprints)
+    if len(index) and np.any(index[1:] < index[:-1]):
+        order = np.argsort(index, kind='mergesort')
+        index, x, y, radius = index[order], x[order], y[order], radius[order]
+
+    angle = np.radians(Column(footprints, 'orientation')[index] / 10.0)
+    c = np.cos(angle)
+    s = np.sin(angle)
+    dx = x - Column(footprints, 'pos_x')[index]
+    dy = y - Column(footprints, 'pos_y')[index]
+    # inverse of the rotation of the footprint
+    local_x = dx * c - dy * s
+    local_y = dy * c + dx * s
+
+    points = np.bincount(index, minlength=count)
+    box = [np.zeros(count) for i in range(4)]
+    if len(index):
+        # first point of each footprint with points
+        starts = np.flatnonzero(np.r_[True, index[1:] != index[:-1]])
+        ids = index[starts]
+        box[0][ids] = np.minimum.reduceat(local_x - radius, starts)
+        box[1][ids] = np.minimum.reduceat(local_y - radius, starts)
+        box[2][ids] = np.maximum.reduceat(local_x + radius, starts)
+        box[3][ids] = np.maximum.reduceat(local_y + radius, starts)
+    return points, box
+
+
+def FootprintBoxes(snapshot, mode='pads'):
+    """Bounding boxes of the footprints of a snapshot.
+
+    The box covers the pads or, with mode 'courtyard', the courtyard (the
+    pads are used for the footprints without courtyard). Returns a dict of
+    arrays: size_x and size_y in the footprint frame (i.e. for the footprint
+    not rotated), center_x and center_y of the box on the board and count,
+    the number of points of the box (0 for the footprints without pads,
+    their box is empty and centered on the footprint position).
+    """
+
+    if mode not in BBOX_MODES:
+        raise Exception('Error: Invalid bounding box mode %s'%mode)
+
+    footprints = snapshot.footprints
+    count, box = PointBoxes(footprints, *PadPoints(snapshot.pads))
+    if mode == 'courtyard':
+        courtyard_count, courtyard_box = PointBoxes(footprints, *CourtyardPoints(snapshot.courtyards))
+        use_courtyard = courtyard_count > 0
+        count = np.where(use_courtyard, courtyard_count, count)
+        box = [np.where(use_courtyard, b1, b0) for b0, b1 in zip(box, courtyard_box)]
+
+    # center of the box back to the board
+    center_x = (box[0] + box[2]) / 2.0
+    center_y = (box[1] + box[3]) / 2.0
+    angle = np.radians(Column(footprints, 'orientation') / 10.0)
+    c = np.cos(angle)
+    s = np.sin(angle)
+
+    ret = {}
+    ret['count'] = count
+    ret['size_x'] = np.rint(box[2] - box[0]).astype(np.int64)
+    ret['size_y'] = np.rint(box[3] - box[1]).astype(np.int64)
+    ret['center_x'] = Column(footprints, 'pos_x') + center_x * c + center_y * s
+    ret['center_y'] = Column(footprints, 'pos_y') + center_y * c - center_x * s
+    return ret
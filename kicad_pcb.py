@@ -0,0 +1,533 @@
+#!/usr/bin/env python2
+
+# Reader for .kicad_pcb files (Kicad 5 format) that does not need pcbnew
+#
+# The file is memory mapped and the top level sections are indexed with a
+# single scan. Only the sections needed for the requested tables are parsed
+# and the zone fills (the bulk of large files) are skipped. Files without the
+# Kicad layout are tokenized line by line. The result is a
+# board_snapshot.BoardSnapshot with the same content of
+# board_snapshot.ScanBoard(), so the scripts can analyze a board without a
+# Kicad install (e.g. in a CI container).
+
+import sys
+import io
+import re
+import math
+import mmap
+import argparse
+import board_snapshot
+
+__version__ = '0.1'
+
+# '(', ')', quoted string or atom. Kicad writes quoted strings on a single
+# line (new lines are escaped), so the file can be tokenized line by line.
+TOKEN_RE = re.compile(r'\(|\)|"(?:[^"\\]|\\.)*"|[^\s()"]+')
+ESCAPE_RE = re.compile(r'\\(.)')
+ESCAPES = {'n' : '\n', 't' : '\t', 'r' : '\r'}
+
+PAD_ATTRIBUTES = {
+        'thru_hole'    : board_snapshot.PAD_ATTRIB_STANDARD,
+        'smd'          : board_snapshot.PAD_ATTRIB_SMD,
+        'connect'      : board_snapshot.PAD_ATTRIB_CONN,
+        'np_thru_hole' : board_snapshot.PAD_ATTRIB_HOLE_NOT_PLATED,
+        }
+
+# Kicad 5.1 values of pcbnew.PAD_SHAPE_*
+PAD_SHAPES = {
+        'circle'         : 0,
+        'rect'           : 1,
+        'oval'           : 2,
+        'trapezoid'      : 3,
+        'roundrect'      : 4,
+        'chamfered_rect' : 5,
+        'custom'         : 6,
+        }
+
+COURTYARD_LAYERS = ['F.CrtYd', 'B.CrtYd']
+
+MODULE_ATTRIBUTES = {
+        'smd'     : 1,
+        'virtual' : 2,
+        }
+
+# used if the file has no net class with a via drill
+DEFAULT_VIA_DRILL = 0.4
+
+# Kicad writes each top level section on a new line with two spaces of
+# indentation and the nested sections with more indentation, so the sections
+# of a file can be found without tokenizing it
+SECTION_RE = re.compile(br'\n  \(([a-z_]+)')
+ZONE_FILL_RE = re.compile(br'\n    \((filled_polygon|fill_segments)')
+ZONE_CHILD_RE = re.compile(br'\n    \(')
+# size of the blocks of the file scanned for sections, multiple of the page size
+SCAN_BLOCK_SIZE = 1 << 24
+
+# zone fills are the bulk of large files and are not needed by the scripts
+ZONE_FILLS = ('filled_polygon', 'fill_segments')
+
+# top level sections needed for each table of the snapshot
+TABLE_SECTIONS = {
+        'footprints' : ['module', 'footprint'],
+        'pads'       : ['module', 'footprint'],
+        'vias'       : ['via', 'net', 'net_class'],
+        'tracks'     : ['segment', 'net', 'net_class'],
+        'edges'      : ['gr_line', 'gr_arc', 'gr_circle', 'gr_poly', 'gr_curve'],
+        }
+# always read, they are small
+COMMON_SECTIONS = ['layers', 'setup']
+
+
+def Unquote(token):
+    return ESCAPE_RE.sub(lambda m: ESCAPES.get(m.group(1), m.group(1)), token[1:-1])
+
+
+def ParseSections(lines, names=None, skip=()):
+    """Yield the top level sections of a board file as nested lists of strings.
+
+    Only the top level sections in names (all if None) are returned and the
+    nested sections in skip are dropped while tokenizing.
+    """
+
+    stack = []
+    # depth of the section being dropped, 0 if none
+    skip_depth = 0
+    for line in lines:
+        for token in TOKEN_RE.findall(line):
+            if skip_depth:
+                if token == '(':
+                    skip_depth += 1
+                elif token == ')':
+                    skip_depth -= 1
+                    if skip_depth == 1:
+                        skip_depth = 0
+                        stack.pop()
+                continue
+            if token == '(':
+                stack.append([])
+            elif token == ')':
+                node = stack.pop()
+                if len(stack) == 1:
+                    yield node
+                elif stack:
+                    stack[-1].append(node)
+            elif token[0] == '"':
+                stack[-1].append(Unquote(token))
+            else:
+                node = stack[-1]
+                if not node and ((len(stack) == 2 and names != None and token not in names) or token in skip):
+                    # drop the section, the placeholder is removed when it is closed
+                    skip_depth = 2
+                    continue
+                node.append(token)
+
+
+def Child(node, name):
+    """First child list of node starting with name."""
+    for c in node:
+        if type(c) is list and c and c[0] == name:
+            return c
+    return None
+
+
+def Children(node, name):
+    return [c for c in node if type(c) is list and c and c[0] == name]
+
+
+def ToIU(mm):
+    # Kicad rounds the file values to the nearest internal unit
+    return int(round(float(mm) * board_snapshot.IU_PER_MM))
+
+
+class SnapshotReader(object):
+    """Fill a BoardSnapshot with the top level sections of a board file."""
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.layer_ids = {}
+        self.net_class_of_net = {}
+        self.net_class_drills = {}
+        # vias using the net class drill: (index, netcode, micro via)
+        self.pending_vias = []
+        self.edge_points = []
+
+        self.handlers = {
+                'layers'     : self.AddLayers,
+                'setup'      : self.AddSetup,
+                'net'        : self.AddNet,
+                'net_class'  : self.AddNetClass,
+                'module'     : self.AddModule,
+                'footprint'  : self.AddModule,
+                'segment'    : self.AddSegment,
+                'via'        : self.AddVia,
+                'gr_line'    : self.AddDrawing,
+                'gr_arc'     : self.AddDrawing,
+                'gr_circle'  : self.AddDrawing,
+                'gr_poly'    : self.AddDrawing,
+                'gr_curve'   : self.AddDrawing,
+                }
+
+    def Add(self, section):
+        handler = self.handlers.get(section[0])
+        if handler != None:
+            handler(section)
+
+    def AddLayers(self, node):
+        snapshot = self.snapshot
+        copper_layer_count = 0
+        for layer in node[1:]:
+            layer_id = int(layer[0])
+            self.layer_ids[layer[1]] = layer_id
+            snapshot.layer_names[layer_id] = layer[1]
+            if layer_id <= board_snapshot.B_Cu:
+                copper_layer_count += 1
+        snapshot.copper_layer_count = copper_layer_count
+
+    def AddSetup(self, node):
+        origin = Child(node, 'aux_axis_origin')
+        if origin != None:
+            self.snapshot.aux_origin = (ToIU(origin[1]), ToIU(origin[2]))
+
+    def AddNet(self, node):
+        netcode = int(node[1])
+        name = node[2] if len(node) > 2 else ''
+        self.snapshot.net_names[netcode] = name
+
+    def AddNetClass(self, node):
+        name = node[1]
+        drills = {}
+        for key in ['via_drill', 'uvia_drill']:
+            value = Child(node, key)
+            if value != None:
+                drills[key] = ToIU(value[1])
+        self.net_class_drills[name] = drills
+        for add_net in Children(node, 'add_net'):
+            self.net_class_of_net[add_net[1]] = name
+
+    def AddModule(self, node):
+        footprints = self.snapshot.footprints
+        pads = self.snapshot.pads
+        index = len(footprints)
+
+        at = Child(node, 'at')
+        pos_x = ToIU(at[1])
+        pos_y = ToIU(at[2])
+        angle = float(at[3]) if len(at) > 3 else 0.0
+        layer = Child(node, 'layer')
+        attr = Child(node, 'attr')
+
+        reference = ''
+        value = ''
+        for text in Children(node, 'fp_text'):
+            if text[1] == 'reference':
+                reference = text[2]
+            elif text[1] == 'value':
+                value = text[2]
+        for prop in Children(node, 'property'):
+            # Kicad 6 format
+            if prop[1] == 'Reference':
+                reference = prop[2]
+            elif prop[1] == 'Value':
+                value = prop[2]
+
+        footprints.reference.append(reference)
+        footprints.value.append(value)
+        # library item name, without the library nickname
+        footprints.footprint.append(node[1].split(':', 1)[-1])
+        footprints.pos_x.append(pos_x)
+        footprints.pos_y.append(pos_y)
+        footprints.orientation.append(angle * 10)
+        footprints.attributes.append(MODULE_ATTRIBUTES.get(attr[1], 0) if attr != None else 0)
+        footprints.flipped.append(layer != None and layer[1] == 'B.Cu')
+
+        pad_count = 0
+        for pad in Children(node, 'pad'):
+            pad_count += 1
+            pad_at = Child(pad, 'at')
+            # pad positions are relative to the module, the angle is absolute
+            dx, dy = board_snapshot.RotatePoint(ToIU(pad_at[1]), ToIU(pad_at[2]), angle)
+            pad_angle = float(pad_at[3]) if len(pad_at) > 3 else 0.0
+            size = Child(pad, 'size')
+
+            drill_shape = board_snapshot.PAD_DRILL_SHAPE_CIRCLE
+            drill_x = drill_y = 0
+            drill = Child(pad, 'drill')
+            if drill != None:
+                values = [v for v in drill[1:] if type(v) is not list]
+                if values and values[0] == 'oval':
+                    drill_shape = board_snapshot.PAD_DRILL_SHAPE_OBLONG
+                    values = values[1:]
+                if values:
+                    drill_x = ToIU(values[0])
+                    drill_y = ToIU(values[1]) if len(values) > 1 else drill_x
+
+            pads.footprint.append(index)
+            pads.pos_x.append(pos_x + dx)
+            pads.pos_y.append(pos_y + dy)
+            pads.attribute.append(PAD_ATTRIBUTES.get(pad[2], board_snapshot.PAD_ATTRIB_SMD))
+            pads.drill_shape.append(drill_shape)
+            pads.drill_x.append(drill_x)
+            pads.drill_y.append(drill_y)
+            pads.size_x.append(ToIU(size[1]))
+            pads.size_y.append(ToIU(size[2]))
+            pads.orientation.append(pad_angle * 10)
+            pads.shape.append(PAD_SHAPES.get(pad[3], PAD_SHAPES['rect']))
+        footprints.pad_count.append(pad_count)
+
+        for drawing in node[1:]:
+            if type(drawing) is list and drawing[0] in ['fp_line', 'fp_circle', 'fp_arc', 'fp_poly']:
+                layer = Child(drawing, 'layer')
+                if layer != None and layer[1] in COURTYARD_LAYERS:
+                    self.AddCourtyardDrawing(index, pos_x, pos_y, angle, drawing)
+
+    def AddCourtyardDrawing(self, index, pos_x, pos_y, angle, node):
+        """Add the points of a courtyard drawing, the coordinates are relative to the module."""
+
+        courtyards = self.snapshot.courtyards
+        width = Child(node, 'width')
+        radius = ToIU(width[1]) // 2 if width != None else 0
+
+        start = Child(node, 'start')
+        end = Child(node, 'end')
+        if node[0] == 'fp_line':
+            points = [(ToIU(start[1]), ToIU(start[2])), (ToIU(end[1]), ToIU(end[2]))]
+        elif node[0] == 'fp_circle':
+            cx, cy = ToIU(start[1]), ToIU(start[2])
+            points = [(cx, cy)]
+            radius += int(round(math.hypot(ToIU(end[1]) - cx, ToIU(end[2]) - cy)))
+        elif node[0] == 'fp_arc':
+            points = board_snapshot.ArcPoints(ToIU(start[1]), ToIU(start[2]), ToIU(end[1]), ToIU(end[2]), float(Child(node, 'angle')[1]))
+        else:
+            pts = Child(node, 'pts')
+            points = [(ToIU(xy[1]), ToIU(xy[2])) for xy in Children(pts, 'xy')] if pts != None else []
+
+        for x, y in points:
+            dx, dy = board_snapshot.RotatePoint(int(round(x)), int(round(y)), angle)
+            courtyards.footprint.append(index)
+            courtyards.x.append(pos_x + dx)
+            courtyards.y.append(pos_y + dy)
+            courtyards.radius.append(radius)
+
+    def AddSegment(self, node):
+        tracks = self.snapshot.tracks
+        start = Child(node, 'start')
+        end = Child(node, 'end')
+        net = Child(node, 'net')
+        tracks.start_x.append(ToIU(start[1]))
+        tracks.start_y.append(ToIU(start[2]))
+        tracks.end_x.append(ToIU(end[1]))
+        tracks.end_y.append(ToIU(end[2]))
+        tracks.width.append(ToIU(Child(node, 'width')[1]))
+        tracks.layer.append(self.layer_ids.get(Child(node, 'layer')[1], -1))
+        tracks.netcode.append(int(net[1]) if net != None else 0)
+
+    def AddVia(self, node):
+        vias = self.snapshot.vias
+        at = Child(node, 'at')
+        net = Child(node, 'net')
+        netcode = int(net[1]) if net != None else 0
+        drill = Child(node, 'drill')
+        if drill != None:
+            vias.drill.append(ToIU(drill[1]))
+        else:
+            # the via uses the drill of its net class, resolved at the end of the file
+            self.pending_vias.append((len(vias), netcode, 'micro' in node))
+            vias.drill.append(0)
+        vias.pos_x.append(ToIU(at[1]))
+        vias.pos_y.append(ToIU(at[2]))
+        vias.netcode.append(netcode)
+
+    def AddDrawing(self, node):
+        layer = Child(node, 'layer')
+        if layer == None or layer[1] != 'Edge.Cuts':
+            return
+
+        width = Child(node, 'width')
+        inflate = (ToIU(width[1]) + 1) // 2 if width != None else 0
+
+        points = []
+        start = Child(node, 'start')
+        end = Child(node, 'end')
+        if node[0] == 'gr_line':
+            points = [(ToIU(start[1]), ToIU(start[2])), (ToIU(end[1]), ToIU(end[2]))]
+        elif node[0] in ['gr_circle', 'gr_arc']:
+            if node[0] == 'gr_circle':
+                sweep = 360.0
+            else:
+                sweep = float(Child(node, 'angle')[1])
+            points = board_snapshot.ArcPoints(ToIU(start[1]), ToIU(start[2]), ToIU(end[1]), ToIU(end[2]), sweep)
+        else:
+            pts = Child(node, 'pts')
+            if pts != None:
+                points = [(ToIU(xy[1]), ToIU(xy[2])) for xy in Children(pts, 'xy')]
+
+        for x, y in points:
+            self.edge_points.append((x - inflate, y - inflate))
+            self.edge_points.append((x + inflate, y + inflate))
+
+    def Finish(self):
+        snapshot = self.snapshot
+
+        for netcode, name in snapshot.net_names.items():
+            snapshot.net_classes[netcode] = self.net_class_of_net.get(name, 'Default')
+
+        default_drills = self.net_class_drills.get('Default', {})
+        for index, netcode, micro in self.pending_vias:
+            drills = self.net_class_drills.get(snapshot.net_classes.get(netcode, 'Default'), default_drills)
+            key = 'uvia_drill' if micro else 'via_drill'
+            drill = drills.get(key, default_drills.get(key, ToIU(DEFAULT_VIA_DRILL)))
+            snapshot.vias.drill[index] = drill
+
+        if self.edge_points:
+            xs = [p[0] for p in self.edge_points]
+            ys = [p[1] for p in self.edge_points]
+            snapshot.edge_bbox = (int(min(xs)), int(min(ys)), int(math.ceil(max(xs))), int(math.ceil(max(ys))))
+
+
+class BoardIndex(object):
+    """Byte offsets of the top level sections of a board file.
+
+    The file is memory mapped and scanned once. The sections are decoded and
+    parsed only when requested, so the memory use depends on the sections
+    that are read and not on the file size (most of it are zone fills).
+    """
+
+    def __init__(self, fname):
+        self.file = open(fname, 'rb')
+        self.data = None
+        # (name, start, end) of each top level section, in file order
+        self.sections = []
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file
+            return
+
+        data = self.data
+        if data[:len(b'(kicad_pcb')] != b'(kicad_pcb':
+            return
+        end = data.rfind(b'\n)')
+        starts = []
+        for block_start in range(0, end, SCAN_BLOCK_SIZE):
+            block_end = min(block_start + SCAN_BLOCK_SIZE, end)
+            # matches crossing the block end are found in this block
+            for m in SECTION_RE.finditer(data, block_start, min(block_end + 64, end)):
+                if m.start() >= block_end:
+                    break
+                starts.append((m.group(1).decode('ascii'), m.start() + 1))
+            if hasattr(data, 'madvise'):
+                # the scanned pages are not needed anymore, keep them out of
+                # the resident memory (python >= 3.8)
+                data.madvise(mmap.MADV_DONTNEED, block_start, block_end - block_start)
+        for i, (name, start) in enumerate(starts):
+            if i + 1 < len(starts):
+                section_end = starts[i + 1][1] - 1
+            else:
+                section_end = end
+            self.sections.append((name, start, section_end))
+
+    def IsValid(self):
+        """True if the file has the layout written by Kicad."""
+        if not self.sections:
+            return False
+        for name, start, end in self.sections:
+            if self.data[max(start, end - 16):end].rstrip()[-1:] != b')':
+                return False
+        return True
+
+    def Names(self):
+        return [name for name, start, end in self.sections]
+
+    def Raw(self, i):
+        name, start, end = self.sections[i]
+        return self.data[start:end]
+
+    def Parse(self, i, zone_fills=False):
+        """Parse a section. The fills of zones are dropped unless zone_fills is set."""
+
+        name, start, end = self.sections[i]
+        data = self.data
+        if name == 'zone' and not zone_fills:
+            # cut the fills before decoding, the zone outline is kept
+            chunks = []
+            pos = start
+            for m in ZONE_FILL_RE.finditer(data, start, end):
+                if m.start() < pos:
+                    continue
+                chunks.append(data[pos:m.start()])
+                next_child = ZONE_CHILD_RE.search(data, m.end(), end)
+                pos = next_child.start() if next_child != None else data.rfind(b'\n', m.end(), end)
+            chunks.append(data[pos:end])
+            text = b''.join(chunks)
+        else:
+            text = data[start:end]
+        # wrapped in a dummy root to reuse the section parser
+        lines = ['(', text.decode('utf-8'), ')']
+        for section in ParseSections(lines, skip=() if zone_fills else ZONE_FILLS):
+            return section
+
+    def Close(self):
+        if self.data != None:
+            self.data.close()
+        self.file.close()
+
+
+def SectionNames(tables):
+    names = set(COMMON_SECTIONS)
+    for table in tables:
+        names.update(TABLE_SECTIONS[table])
+    return names
+
+
+def LoadSnapshot(fname, tables=None):
+    """Read a board file into a BoardSnapshot without using pcbnew.
+
+    tables limits the data read to some of the tables of the snapshot (see
+    TABLE_SECTIONS), the other tables are left empty.
+    """
+
+    if tables == None:
+        tables = TABLE_SECTIONS.keys()
+    names = SectionNames(tables)
+
+    snapshot = board_snapshot.BoardSnapshot()
+    snapshot.file_name = fname
+    reader = SnapshotReader(snapshot)
+
+    index = BoardIndex(fname)
+    try:
+        if index.IsValid():
+            for i, name in enumerate(index.Names()):
+                if name in names:
+                    reader.Add(index.Parse(i))
+        else:
+            # not written by Kicad, tokenize the whole file
+            with io.open(fname, encoding='utf-8') as f:
+                for section in ParseSections(f, names, ZONE_FILLS):
+                    reader.Add(section)
+    finally:
+        index.Close()
+
+    reader.Finish()
+    return snapshot
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Read a Kicad PCB file without Kicad and print a summary')
+    parser.add_argument('kicad_pcb',
+            help="Kicad PCB file")
+    args = parser.parse_args()
+
+    snapshot = LoadSnapshot(args.kicad_pcb)
+
+    print('Copper layers : %d'%snapshot.copper_layer_count)
+    print('Footprints    : %d'%len(snapshot.footprints))
+    print('Pads          : %d'%len(snapshot.pads))
+    print('Vias          : %d'%len(snapshot.vias))
+    print('Tracks        : %d'%len(snapshot.tracks))
+    print('Nets          : %d'%len(snapshot.net_names))
+
+
+if __name__=='__main__':
+    sys.exit(main())
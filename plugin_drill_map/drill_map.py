@@ -1,7 +1,28 @@
 import sys
+import os
 import argparse
 import re
-import pcbnew
+import json
+import collections
+from array import array
+
+try:
+    import pcbnew
+except ImportError:
+    # the drill chart can be exported from the board file without Kicad
+    pcbnew = None
+
+try:
+    import numpy as np
+except ImportError:
+    # only needed for the npz export
+    np = None
+
+# shared modules are in the parent directory
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import board_snapshot
+import snapshot_cache
+import profiling
 
 __version__ = '0.1'
 
@@ -14,7 +35,22 @@ defaults = {
         }
 
 
-def DrawLine(board, layer, start, end, width):
+# Items generated by DrillMap are tagged with these time stamps, so they can
+# be found and updated by the next run without touching the user drawings
+MARKER_TAG = 0x44524D4B
+TABLE_TAG = 0x44525442
+
+STATE_VERSION = 1
+
+DRILL_SHAPES = {
+        board_snapshot.PAD_DRILL_SHAPE_CIRCLE : 'round',
+        board_snapshot.PAD_DRILL_SHAPE_OBLONG : 'oblong',
+        }
+
+EXPORT_FORMATS = ['csv', 'json', 'npz']
+
+
+def DrawLine(board, layer, start, end, width, tag=None):
     ds = pcbnew.DRAWSEGMENT(board)
     board.Add(ds)
     ds.SetShape(pcbnew.S_SEGMENT)
@@ -22,8 +58,11 @@ def DrawLine(board, layer, start, end, width):
     ds.SetEnd(pcbnew.wxPoint(end[0], end[1]))
     ds.SetWidth(width)
     ds.SetLayer(layer)
+    if tag != None:
+        ds.SetTimeStamp(tag)
+    return ds
 
-def DrawCircle(board, layer, center, end, width):
+def DrawCircle(board, layer, center, end, width, tag=None):
     ds = pcbnew.DRAWSEGMENT(board)
     board.Add(ds)
     ds.SetShape(pcbnew.S_CIRCLE)
@@ -31,10 +70,15 @@ def DrawCircle(board, layer, center, end, width):
     ds.SetEnd(pcbnew.wxPoint(end[0], end[1]))
     ds.SetWidth(width)
     ds.SetLayer(layer)
+    if tag != None:
+        ds.SetTimeStamp(tag)
+    return ds
 
-def DrawText(board, text_str, layer, pos, size=int(1.5*pcbnew.IU_PER_MM), thickness=None, h_align=pcbnew.GR_TEXT_HJUSTIFY_CENTER):
+def DrawText(board, text_str, layer, pos, size=int(1.5*board_snapshot.IU_PER_MM), thickness=None, h_align=None, tag=None):
     if thickness == None:
         thickness=int(size/7.5)
+    if h_align == None:
+        h_align = pcbnew.GR_TEXT_HJUSTIFY_CENTER
     text = pcbnew.TEXTE_PCB(board)
     text.SetText(text_str)
     text.SetPosition(pcbnew.wxPoint(*pos))
@@ -47,7 +91,10 @@ def DrawText(board, text_str, layer, pos, size=int(1.5*pcbnew.IU_PER_MM), thickn
     text.SetThickness(thickness)
     text.SetHorizJustify(h_align)
     text.SetLayer(layer)
+    if tag != None:
+        text.SetTimeStamp(tag)
     board.Add(text)
+    return text
         
 
 class Marker(object):
@@ -64,13 +111,22 @@ class Marker(object):
         self._size_half = int(self._size/2)
 
     def DrawLine(self, start, end, width):
-        DrawLine(self._board, self._layer, start, end, width)
+        if isinstance(self._board, MarkerTemplate):
+            self._board.AddSegment(pcbnew.S_SEGMENT, start, end, width)
+        else:
+            DrawLine(self._board, self._layer, start, end, width)
 
     def DrawCircle(self, center, end, width):
-        DrawCircle(self._board, self._layer, center, end, width)
+        if isinstance(self._board, MarkerTemplate):
+            self._board.AddSegment(pcbnew.S_CIRCLE, center, end, width)
+        else:
+            DrawCircle(self._board, self._layer, center, end, width)
 
     def DrawText(self, text_str):
-        DrawText(self._board, text_str, self._layer, (self._posX, self._posY), int(0.7*self._size))
+        if isinstance(self._board, MarkerTemplate):
+            self._board.AddText(text_str, (self._posX, self._posY), int(0.7*self._size))
+        else:
+            DrawText(self._board, text_str, self._layer, (self._posX, self._posY), int(0.7*self._size))
 
 
 class MarkerCircle(Marker):
@@ -217,6 +273,120 @@ class MarkerCharSquare(MarkerSquare):
 
         self.DrawText(letter)
 
+class MarkerTemplate(object):
+    """Strokes of a marker centered in (0, 0).
+
+    The marker is drawn into the template instead of the board, so the
+    strokes can be translated to every hole position of a drill class.
+    """
+
+    def __init__(self, marker, size):
+        self.segments = []
+        self.texts = []
+        marker(self, None, (0, 0), size)
+
+    def AddSegment(self, shape, start, end, width):
+        self.segments.append((shape, start, end, width))
+
+    def AddText(self, text_str, pos, size):
+        self.texts.append((text_str, pos, size))
+
+
+class MarkerBatch(object):
+    """Geometry of all the markers of a drill class, committed to the board in one pass.
+
+    Segments are stored in flat arrays: one shape and width per segment and
+    four coordinates (start x, start y, end x, end y) per segment.
+    """
+
+    def __init__(self, template):
+        self._template = template
+        self.shapes = array('b')
+        self.widths = array('l')
+        self.coords = array('l')
+        self.texts = []
+        self.text_coords = array('l')
+
+    def __len__(self):
+        return len(self.shapes)
+
+    def Add(self, positions):
+        count = len(positions)
+        for shape, start, end, width in self._template.segments:
+            sx, sy = start
+            ex, ey = end
+            self.shapes.extend(array('b', [shape]) * count)
+            self.widths.extend(array('l', [width]) * count)
+            self.coords.extend([v for x, y in positions for v in (x + sx, y + sy, x + ex, y + ey)])
+        for text_str, pos, size in self._template.texts:
+            px, py = pos
+            self.texts.extend([(text_str, size)] * count)
+            self.text_coords.extend([v for x, y in positions for v in (x + px, y + py)])
+
+    def Keys(self):
+        """Geometry keys of the batch items, matching DrawingKey() of the committed items."""
+        coords = iter(self.coords)
+        for shape, sx, sy, ex, ey in zip(self.shapes, coords, coords, coords, coords):
+            yield (shape, (sx, sy), (ex, ey))
+        text_coords = iter(self.text_coords)
+        for (text_str, size), x, y in zip(self.texts, text_coords, text_coords):
+            yield ('text', text_str, (x, y))
+
+    def Commit(self, board, layer, tag=None):
+        """Add the batch to the board and return the number of items created."""
+
+        # pcbnew has no bulk insert, so keep the per segment work to the
+        # minimum number of SWIG calls. S_SEGMENT is the default shape.
+        new_segment = pcbnew.DRAWSEGMENT
+        point = pcbnew.wxPoint
+        add = board.Add
+        segment_shape = pcbnew.S_SEGMENT
+        coords = iter(self.coords)
+        for shape, width, sx, sy, ex, ey in zip(self.shapes, self.widths, coords, coords, coords, coords):
+            ds = new_segment(board)
+            if shape != segment_shape:
+                ds.SetShape(shape)
+            ds.SetStart(point(sx, sy))
+            ds.SetEnd(point(ex, ey))
+            ds.SetWidth(width)
+            ds.SetLayer(layer)
+            if tag != None:
+                ds.SetTimeStamp(tag)
+            add(ds)
+
+        text_coords = iter(self.text_coords)
+        for (text_str, size), x, y in zip(self.texts, text_coords, text_coords):
+            DrawText(board, text_str, layer, (x, y), size, tag=tag)
+
+        return len(self.shapes) + len(self.texts)
+
+
+def DrawingKey(d):
+    # same format as MarkerBatch.Keys()
+    if type(d) is pcbnew.TEXTE_PCB:
+        return ('text', d.GetText(), d.GetPosition().Get())
+    return (d.GetShape(), d.GetStart().Get(), d.GetEnd().Get())
+
+
+def LoadState(fname):
+    """Load the drill map state saved by the last incremental run. Returns None if not available."""
+
+    try:
+        with open(fname) as f:
+            state = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if state.get('version') != STATE_VERSION:
+        return None
+    return state
+
+
+def SaveState(fname, state):
+    state['version'] = STATE_VERSION
+    with open(fname, 'w') as f:
+        json.dump(state, f)
+
+
 def __GetMarkerList():
     ret = [MarkerCross, MarkerX, MarkerCrossCircle, MarkerXCircle, MarkerSquare, MarkerTriangle, MarkerTriangleCircle]
     import string
@@ -229,6 +399,227 @@ def __GetMarkerList():
 MARKER_LIST = __GetMarkerList()
 
 
+def DrillsOverlap(drill1, drill2):
+    return (abs(drill1[0][0] - drill2[0][0]) < (drill1[1][0] + drill2[1][0])/2) and (abs(drill1[0][1] - drill2[0][1]) < (drill1[1][1] + drill2[1][1])/2)
+
+
+def FindDrillOverlaps(drill_list):
+    """Find all pairs of overlapping drills in a list of (position, size) tuples.
+
+    The drills are registered in a uniform grid in every cell covered by their
+    bounding box. The cell size is the median drill size, so a few large
+    holes do not make the cells crowded with small vias. Two drills can only
+    overlap if they share a cell, and each pair is tested only in the first
+    cell they share. The pairs are returned in the same order as an all-pairs
+    scan of drill_list would find them.
+    """
+
+    if not drill_list:
+        return []
+
+    sizes = sorted([max(size) for position, size in drill_list])
+    cell_size = max(1, int(sizes[len(sizes)//2]))
+
+    grid = {}
+    cell_ranges = []
+    for i, (position, size) in enumerate(drill_list):
+        half_x = (size[0] + 1) // 2
+        half_y = (size[1] + 1) // 2
+        cell_range = (
+                (position[0] - half_x) // cell_size, 
+                (position[1] - half_y) // cell_size,
+                (position[0] + half_x) // cell_size, 
+                (position[1] + half_y) // cell_size,
+                )
+        cell_ranges.append(cell_range)
+        for cx in range(cell_range[0], cell_range[2] + 1):
+            for cy in range(cell_range[1], cell_range[3] + 1):
+                grid.setdefault((cx, cy), []).append(i)
+
+    drill_overlaps = []
+    for i, drill1 in enumerate(drill_list):
+        range1 = cell_ranges[i]
+        candidates = []
+        for cx in range(range1[0], range1[2] + 1):
+            for cy in range(range1[1], range1[3] + 1):
+                for j in grid[(cx, cy)]:
+                    if j <= i:
+                        continue
+                    range2 = cell_ranges[j]
+                    # test the pair only in the first shared cell
+                    if cx == max(range1[0], range2[0]) and cy == max(range1[1], range2[1]):
+                        candidates.append(j)
+        candidates.sort()
+        for j in candidates:
+            drill2 = drill_list[j]
+            if DrillsOverlap(drill1, drill2):
+                drill_overlaps.append((drill1[0], drill2[0]))
+
+    return drill_overlaps
+
+
+def GetDrillPositions(snapshot):
+    """Positions of the holes of a snapshot.
+
+    Returns a dict (plated, (drill_x, drill_y), drill shape) -> list of
+    (x, y) positions, sizes and positions in IU.
+    """
+
+    drill_positions = {}
+    #find TH pads
+    pads = snapshot.pads
+    for attribute, shape, drill_x, drill_y, pos_x, pos_y in zip(pads.attribute, pads.drill_shape, pads.drill_x, pads.drill_y, pads.pos_x, pads.pos_y):
+
+        plated = True
+        if attribute == board_snapshot.PAD_ATTRIB_STANDARD:
+            plated = True
+        elif attribute == board_snapshot.PAD_ATTRIB_HOLE_NOT_PLATED:
+            plated = False
+        else:
+            #SMD
+            continue
+    
+        if shape not in [board_snapshot.PAD_DRILL_SHAPE_CIRCLE, board_snapshot.PAD_DRILL_SHAPE_OBLONG]:
+            raise Exception('Unknown drill shape: %d'%shape)
+
+        drill_positions.setdefault((plated, (drill_x, drill_y), shape), []).append((pos_x, pos_y))
+
+
+    # find VIA's
+    # TODO should we separate VIA types?
+    vias = snapshot.vias
+    for size, pos_x, pos_y in zip(vias.drill, vias.pos_x, vias.pos_y):
+        drill_positions.setdefault((True, (size, size), board_snapshot.PAD_DRILL_SHAPE_CIRCLE), []).append((pos_x, pos_y))
+
+    return drill_positions
+
+
+def GetDrillMarkers(drill_positions):
+    """Drill types in the order of the table and their index in MARKER_LIST."""
+
+    drill_types = sorted(drill_positions.keys())
+    # use last marker if we have too many drill sizes
+    drill_markers = dict([(drill_type, min(i, len(MARKER_LIST)-1)) for i, drill_type in enumerate(drill_types)])
+    return drill_types, drill_markers
+
+
+def GetDrillList(drill_positions):
+    """(position, size) of all the holes, for FindDrillOverlaps."""
+
+    drill_list = []
+    for drill_type in drill_positions.keys():
+        size = drill_type[1]
+        for position in drill_positions[drill_type]: 
+            drill_list.append((position, size))
+    return drill_list
+
+
+def DrillChart(board=None, snapshot=None, profiler=None):
+    """Drill classes and hole positions of a board, without drawing anything.
+
+    Returns a dict with 'drills', the drill classes in the order of the
+    drill map table, and 'overlaps', the pairs of positions of the
+    overlapping holes. Each drill class is a dict with symbol (the index of
+    its marker in MARKER_LIST), plated, shape ('round' or 'oblong'), size_x,
+    size_y, count and positions ((x, y) list), sizes and positions in IU.
+    The board is only used without snapshot.
+    """
+
+    if profiler == None:
+        profiler = profiling.NullProfiler()
+
+    with profiler.Span('scan board'):
+        if snapshot == None:
+            if board == None:
+                board = pcbnew.GetBoard()
+            if not board:
+                raise Exception('Error: Invalid board')
+            snapshot = board_snapshot.ScanBoard(board)
+
+    with profiler.Span('drill positions'):
+        drill_positions = GetDrillPositions(snapshot)
+        drill_types, drill_markers = GetDrillMarkers(drill_positions)
+
+    ret = {}
+    ret['drills'] = []
+    for drill_type in drill_types:
+        plated, size, shape = drill_type
+        ret['drills'].append({
+            'symbol'    : drill_markers[drill_type],
+            'plated'    : plated,
+            'shape'     : DRILL_SHAPES[shape],
+            'size_x'    : size[0],
+            'size_y'    : size[1],
+            'count'     : len(drill_positions[drill_type]),
+            'positions' : drill_positions[drill_type],
+            })
+
+    with profiler.Span('overlap check'):
+        ret['overlaps'] = FindDrillOverlaps(GetDrillList(drill_positions))
+
+    return ret
+
+
+def ExportDrillChart(fname, chart):
+    """Write a drill chart (see DrillChart) in the format of the file extension.
+
+    csv: one row per hole, json: the drill classes with their positions and
+    the overlaps, both in mm. npz: numpy arrays in IU, the hole positions
+    (x, y) with the index of their drill class (drill) and the drill class
+    columns.
+    """
+
+    export_format = os.path.splitext(fname)[1][1:].lower()
+    if export_format not in EXPORT_FORMATS:
+        raise Exception('Error: Unknown export format of %s (%s)'%(fname, ', '.join(EXPORT_FORMATS)))
+
+    def mm(iu):
+        return round(board_snapshot.ToMM(iu), 6)
+
+    drills = chart['drills']
+    if export_format == 'csv':
+        with open(fname, 'w') as f:
+            f.write('symbol,plated,shape,size_x_mm,size_y_mm,x_mm,y_mm\n')
+            for drill in drills:
+                row = '%d,%s,%s,%.6f,%.6f'%(drill['symbol'], 'YES' if drill['plated'] else 'NO', drill['shape'],
+                        board_snapshot.ToMM(drill['size_x']), board_snapshot.ToMM(drill['size_y']))
+                for x, y in drill['positions']:
+                    f.write('%s,%.6f,%.6f\n'%(row, board_snapshot.ToMM(x), board_snapshot.ToMM(y)))
+
+    elif export_format == 'json':
+        data = {}
+        data['units'] = 'mm'
+        data['drills'] = [{
+            'symbol'    : drill['symbol'],
+            'plated'    : drill['plated'],
+            'shape'     : drill['shape'],
+            'size_x'    : mm(drill['size_x']),
+            'size_y'    : mm(drill['size_y']),
+            'count'     : drill['count'],
+            'positions' : [(mm(x), mm(y)) for x, y in drill['positions']],
+            } for drill in drills]
+        data['overlaps'] = [[(mm(x), mm(y)) for x, y in overlap] for overlap in chart['overlaps']]
+        with open(fname, 'w') as f:
+            json.dump(data, f, indent=1)
+
+    else:
+        if np == None:
+            raise Exception('Error: numpy is needed for the npz export')
+        positions = [p for drill in drills for p in drill['positions']]
+        np.savez(fname,
+                x = np.array([p[0] for p in positions], dtype=np.int64),
+                y = np.array([p[1] for p in positions], dtype=np.int64),
+                drill = np.repeat(np.arange(len(drills)), [drill['count'] for drill in drills]).astype(np.int64),
+                symbol = np.array([drill['symbol'] for drill in drills], dtype=np.int64),
+                plated = np.array([drill['plated'] for drill in drills], dtype=bool),
+                shape = np.array([drill['shape'] for drill in drills]),
+                size_x = np.array([drill['size_x'] for drill in drills], dtype=np.int64),
+                size_y = np.array([drill['size_y'] for drill in drills], dtype=np.int64),
+                count = np.array([drill['count'] for drill in drills], dtype=np.int64),
+                iu_per_mm = board_snapshot.IU_PER_MM,
+                )
+
+
 def DrillMap(
         board=None, 
         layer_name=defaults['layer_name'], 
@@ -237,18 +628,35 @@ def DrillMap(
         table_text_size_mm=defaults['table_text_size_mm'], 
         table_title = defaults['table_title'],
         table_position_mm=None, 
-        output_log = sys.stdout
+        incremental = False,
+        snapshot = None,
+        output_log = sys.stdout,
+        progress = None,
+        run_in_ui = None,
+        profiler = None
         ):
+    """Draw the drill markers and the drill table.
+
+    progress(step, step_count, stage) is called before each stage and the
+    board is read and changed through run_in_ui(func, *args) (see
+    plugin_worker.py). The time of the stages is recorded in profiler (see
+    profiling.py).
+    """
 
     ret = {}
     ret['warn'] = []
 
+    if profiler == None:
+        profiler = profiling.NullProfiler()
+    if run_in_ui == None:
+        run_in_ui = lambda func, *args: func(*args)
+
     if board == None:
         board = pcbnew.GetBoard()
     if not board:
         raise Exception('Error: Invalid board')
 
-    layer = board.GetLayerID(layer_name)
+    layer = run_in_ui(board.GetLayerID, layer_name)
     if layer < 0:
         raise Exception('Invalid layer name: %s'%layer_name)
 
@@ -307,94 +715,35 @@ def DrillMap(
             raise Exception('Invalid column name: %s'%col)
     table_columns = ['Symbol'] + list(table_columns)
 
-    drill_positions = {}
-    #find TH pads
-    for m in board.GetModules():
-        for p in m.Pads():
-
-            plated = True
-            attribute = p.GetAttribute()
-            if attribute == pcbnew.PAD_ATTRIB_STANDARD:
-                plated = True
-            elif attribute == pcbnew.PAD_ATTRIB_HOLE_NOT_PLATED:
-                plated = False
-            else:
-                #SMD
-                continue
-            
-            shape = p.GetDrillShape()
-            if shape not in [pcbnew.PAD_DRILL_SHAPE_CIRCLE, pcbnew.PAD_DRILL_SHAPE_OBLONG]:
-                raise Exception('Unknown drill shape: %d'%shape)
-
-            size = p.GetDrillSize()
-            position = p.GetPosition()
+    stages = ['Scanning board', 'Drawing markers', 'Checking drill overlaps']
+    def report_progress(stage):
+        if progress != None:
+            progress(stages.index(stage), len(stages), stage)
 
-            drill_positions.setdefault((plated, size.Get(), shape), []).append(position.Get())
+    report_progress('Scanning board')
+    with profiler.Span('scan board'):
+        if snapshot == None:
+            snapshot = run_in_ui(board_snapshot.ScanBoard, board)
 
-
-    # find VIA's
-    for t in board.GetTracks():
-        if type(t) is pcbnew.VIA:
-            # TODO should we separate VIA types?
-            #if t.GetViaType() != pcbnew.VIA_THROUGH:
-            #    continue
-            size = t.GetDrillValue()
-            position = t.GetPosition()
-            drill_positions.setdefault((True, (size, size), pcbnew.PAD_DRILL_SHAPE_CIRCLE), []).append(position.Get())
+    with profiler.Span('drill positions'):
+        drill_positions = GetDrillPositions(snapshot)
 
     output_log.write("Found %d drill types\n"%len(drill_positions))
 
     if len(drill_positions) > len(MARKER_LIST):
         ret['warn'].append('Found more drill types than available markers. Different drills have been assigned the same marker')
 
-    # compute column widths
-    for col in table_columns:
-        if col == 'Symbol':
-            continue
-        col_width = TableColumnsDict[col][1]
-        for drill_type in drill_positions.keys():
-            col_width = max(col_width, len(TableColumnsDict[col][2](drill_type, drill_positions[drill_type])))
-        TableColumnsDict[col][1] = col_width
-
-    tbl_X_start = 0
-    tbl_Y_start = 0
-    if table_position_mm == None:
-        # Search for location marker:
-        marker_found = False
-        for d in board.GetDrawings():
-            if d.GetLayer() != layer:
+    with profiler.Span('table layout'):
+        # compute column widths
+        for col in table_columns:
+            if col == 'Symbol':
                 continue
-            if type(d) is pcbnew.TEXTE_PCB:
-              match = re.match(r'DrillTableLocationMarker\(\s*(\d+)\s*\)', d.GetText())
-              if match != None:
-                  pos = d.GetPosition()
-                  tbl_X_start = pos.x 
-                  tbl_Y_start = pos.y - int(match.groups()[0])
-                  marker_found = True
-                  break
-
-        if not marker_found:
-            # place the table below the board
-            rect = None
-            for d in board.GetDrawings():
-                if d.GetLayerName() != "Edge.Cuts":
-                    continue
-                if rect == None:
-                    rect = d.GetBoundingBox()
-                else:
-                    rect.Merge(d.GetBoundingBox())
+            col_width = TableColumnsDict[col][1]
+            for drill_type in drill_positions.keys():
+                col_width = max(col_width, len(TableColumnsDict[col][2](drill_type, drill_positions[drill_type])))
+            TableColumnsDict[col][1] = col_width
 
-            tbl_X_start = rect.GetX() + 10 * pcbnew.IU_PER_MM
-            tbl_Y_start = rect.GetY() + rect.GetHeight() + 30 * pcbnew.IU_PER_MM
-
-    else:
-        tbl_X_start = int(table_position_mm[0] * pcbnew.IU_PER_MM)
-        tbl_Y_start = int(table_position_mm[1] * pcbnew.IU_PER_MM)
-    
-    if clear_layer:
-        for d in board.GetDrawings():
-            if d.GetLayer() == layer:
-               d.DeleteStructure()
+    drill_types, drill_markers = GetDrillMarkers(drill_positions)
 
     # Draw table
     tbl_line_width = int(0.1 * pcbnew.IU_PER_MM)
@@ -403,93 +752,295 @@ def DrillMap(
     tbl_row_height = 2 * tbl_text_size
     tbl_height = (len(drill_positions.keys()) + 1) * tbl_row_height 
 
-    tbl_X = tbl_X_start
-    tbl_Y = tbl_Y_start
-    # Title
-    tbl_X = tbl_X_start
-    tbl_Y += int(tbl_row_height/2)
-    DrawText(board, table_title, layer, (tbl_X_start + tbl_row_width/2, tbl_Y), tbl_text_size)
-    tbl_Y += int(tbl_row_height/2)
-    # Header
-    tbl_X = tbl_X_start
-    DrawLine(board, layer, (tbl_X, tbl_Y), (tbl_X + tbl_row_width, tbl_Y), tbl_line_width) 
-    DrawText(board, 'DrillTableLocationMarker(%d)'%tbl_row_height, layer, (tbl_X, tbl_Y), int(0.05 * pcbnew.IU_PER_MM) , int(0.005 * pcbnew.IU_PER_MM), pcbnew.GR_TEXT_HJUSTIFY_LEFT)
-    tbl_X = tbl_X_start
-    tbl_Y += int(tbl_row_height/2)
-    for i, col in enumerate(table_columns):
-        tmp = int(TableColumnsDict[col][1] * tbl_text_size / 2)
-        tbl_X += tmp  
-        DrawText(board, TableColumnsDict[col][0], layer, (tbl_X, tbl_Y), tbl_text_size)
-        tbl_X += tmp
-    tbl_X = tbl_X_start
-    tbl_Y += int(tbl_row_height/2)
-    DrawLine(board, layer, (tbl_X, tbl_Y), (tbl_X + tbl_row_width, tbl_Y), tbl_line_width) 
-    tbl_Y += int(tbl_row_height/2)
-    
-    for i, drill_type in enumerate(sorted(drill_positions.keys())):
-
-        # use last marker if we have too many drill sizes
-        m = min(i, len(MARKER_LIST)-1)
-
-        # add markers to board area
-        for position in drill_positions[drill_type]:
-            MARKER_LIST[m](board, layer, position, min(drill_type[1]))
+    def find_table_position():
+        tbl_X_start = 0
+        tbl_Y_start = 0
+        if table_position_mm == None:
+            # Search for location marker:
+            marker_found = False
+            for d in board.GetDrawings():
+                if d.GetLayer() != layer:
+                    continue
+                if type(d) is pcbnew.TEXTE_PCB:
+                  match = re.match(r'DrillTableLocationMarker\(\s*(\d+)\s*\)', d.GetText())
+                  if match != None:
+                      pos = d.GetPosition()
+                      tbl_X_start = pos.x
+                      tbl_Y_start = pos.y - int(match.groups()[0])
+                      marker_found = True
+                      break
+
+            if not marker_found:
+                # place the table below the board
+                if snapshot.edge_bbox == None:
+                    raise Exception('Cannot place the drill table: no board edges found on Edge.Cuts')
+                tbl_X_start = snapshot.edge_bbox[0] + 10 * pcbnew.IU_PER_MM
+                tbl_Y_start = snapshot.edge_bbox[3] + 30 * pcbnew.IU_PER_MM
 
-        # add row to table
+        else:
+            tbl_X_start = int(table_position_mm[0] * pcbnew.IU_PER_MM)
+            tbl_Y_start = int(table_position_mm[1] * pcbnew.IU_PER_MM)
+        return tbl_X_start, tbl_Y_start
 
-        # write the marker in the first column
-        tbl_X = tbl_X_start + TableColumnsDict['Symbol'][1] * tbl_text_size / 2
-        MARKER_LIST[m](board, layer, (tbl_X, tbl_Y), tbl_text_size)
+    def draw_table(tbl_X_start, tbl_Y_start):
+        # returns the number of drawn items
+        count = 0
 
-        # write the rest of the columns
         tbl_X = tbl_X_start
+        tbl_Y = tbl_Y_start
+        # Title
+        tbl_X = tbl_X_start
+        tbl_Y += int(tbl_row_height/2)
+        DrawText(board, table_title, layer, (tbl_X_start + tbl_row_width/2, tbl_Y), tbl_text_size, tag=TABLE_TAG)
+        tbl_Y += int(tbl_row_height/2)
+        # Header
+        tbl_X = tbl_X_start
+        DrawLine(board, layer, (tbl_X, tbl_Y), (tbl_X + tbl_row_width, tbl_Y), tbl_line_width, tag=TABLE_TAG) 
+        DrawText(board, 'DrillTableLocationMarker(%d)'%tbl_row_height, layer, (tbl_X, tbl_Y), int(0.05 * pcbnew.IU_PER_MM) , int(0.005 * pcbnew.IU_PER_MM), pcbnew.GR_TEXT_HJUSTIFY_LEFT, tag=TABLE_TAG)
+        count += 3
+        tbl_X = tbl_X_start
+        tbl_Y += int(tbl_row_height/2)
         for i, col in enumerate(table_columns):
             tmp = int(TableColumnsDict[col][1] * tbl_text_size / 2)
+            tbl_X += tmp  
+            DrawText(board, TableColumnsDict[col][0], layer, (tbl_X, tbl_Y), tbl_text_size, tag=TABLE_TAG)
+            count += 1
             tbl_X += tmp
-            DrawText(board, TableColumnsDict[col][2](drill_type, drill_positions[drill_type]), layer, (tbl_X, tbl_Y), tbl_text_size)
-            tbl_X += tmp
-
-        tbl_X = tbl_X_start
-        tbl_Y += int(0.5 * tbl_row_height)
-        DrawLine(board, layer, (tbl_X, tbl_Y), (tbl_X + tbl_row_width, tbl_Y), tbl_line_width) 
-
         tbl_X = tbl_X_start
-        tbl_Y += int(0.5 * tbl_row_height)
+        tbl_Y += int(tbl_row_height/2)
+        DrawLine(board, layer, (tbl_X, tbl_Y), (tbl_X + tbl_row_width, tbl_Y), tbl_line_width, tag=TABLE_TAG) 
+        count += 1
+        tbl_Y += int(tbl_row_height/2)
         
-    # draw column separator lines
-    line_Y = tbl_Y_start + tbl_row_height
-    line_X = tbl_X_start
-    DrawLine(board, layer, (line_X, line_Y), (line_X, line_Y + tbl_height), tbl_line_width)
-    for col in table_columns:
-        line_X += int(TableColumnsDict[col][1] * tbl_text_size)
-        DrawLine(board, layer, (line_X, line_Y), (line_X, line_Y + tbl_height), tbl_line_width)
+        for drill_type in drill_types:
+
+            # add row to table
+
+            # write the marker in the first column
+            tbl_X = tbl_X_start + int(TableColumnsDict['Symbol'][1] * tbl_text_size / 2)
+            batch = MarkerBatch(MarkerTemplate(MARKER_LIST[drill_markers[drill_type]], tbl_text_size))
+            batch.Add([(int(tbl_X), int(tbl_Y))])
+            count += batch.Commit(board, layer, TABLE_TAG)
+
+            # write the rest of the columns
+            tbl_X = tbl_X_start
+            for i, col in enumerate(table_columns):
+                tmp = int(TableColumnsDict[col][1] * tbl_text_size / 2)
+                tbl_X += tmp
+                DrawText(board, TableColumnsDict[col][2](drill_type, drill_positions[drill_type]), layer, (tbl_X, tbl_Y), tbl_text_size, tag=TABLE_TAG)
+                count += 1
+                tbl_X += tmp
+
+            tbl_X = tbl_X_start
+            tbl_Y += int(0.5 * tbl_row_height)
+            DrawLine(board, layer, (tbl_X, tbl_Y), (tbl_X + tbl_row_width, tbl_Y), tbl_line_width, tag=TABLE_TAG) 
+            count += 1
+
+            tbl_X = tbl_X_start
+            tbl_Y += int(0.5 * tbl_row_height)
+            
+        # draw column separator lines
+        line_Y = tbl_Y_start + tbl_row_height
+        line_X = tbl_X_start
+        DrawLine(board, layer, (line_X, line_Y), (line_X, line_Y + tbl_height), tbl_line_width, tag=TABLE_TAG)
+        count += 1
+        for col in table_columns:
+            line_X += int(TableColumnsDict[col][1] * tbl_text_size)
+            DrawLine(board, layer, (line_X, line_Y), (line_X, line_Y + tbl_height), tbl_line_width, tag=TABLE_TAG)
+            count += 1
+
+        return count
+
+    def marker_batch(drill_type, marker, positions):
+        batch = MarkerBatch(MarkerTemplate(MARKER_LIST[marker], min(drill_type[1])))
+        batch.Add(positions)
+        return batch
+
+    def draw_board():
+        # all the board changes, in one call in the UI thread
+        with profiler.Span('table layout'):
+            tbl_X_start, tbl_Y_start = find_table_position()
+
+        # the table is redrawn only if one of these changes
+        table_fingerprint = [
+                list(table_columns), tbl_text_size, table_title, tbl_X_start, tbl_Y_start,
+                [[drill_type, len(drill_positions[drill_type])] for drill_type in drill_types]
+                ]
+        # JSON round trip, so it compares equal to the loaded state
+        table_fingerprint = json.loads(json.dumps(table_fingerprint))
+
+        state = None
+        state_fname = None
+        if incremental:
+            if board.GetFileName():
+                state_fname = board.GetFileName() + '.drill_map'
+                state = LoadState(state_fname)
+            else:
+                ret['warn'].append('Incremental mode is not available for boards without a file name')
 
-    
-    # check for overlapping drills
-    drill_list = []
-    for drill_type in drill_positions.keys():
-        size = drill_type[1]
-        for position in drill_positions[drill_type]: 
-            drill_list.append((position, size))
+        # find the items generated by the last run
+        marker_items = []
+        table_items = []
+        other_items = []
+        if incremental:
+            for d in board.GetDrawings():
+                if d.GetLayer() != layer:
+                    continue
+                tag = d.GetTimeStamp()
+                if tag == MARKER_TAG:
+                    marker_items.append(d)
+                elif tag == TABLE_TAG:
+                    table_items.append(d)
+                else:
+                    other_items.append(d)
+
+        if state != None:
+            if state['layer'] != layer_name or state['marker_items'] != len(marker_items) or state['table_items'] != len(table_items):
+                # the board does not match the saved state (e.g. it was not saved after the last run)
+                output_log.write('Drill map state does not match the board, redrawing all markers\n')
+                state = None
+
+        if state == None:
+            # full redraw
+            if clear_layer:
+                for d in board.GetDrawings():
+                    if d.GetLayer() == layer:
+                       d.DeleteStructure()
+            else:
+                # only the items found in incremental mode
+                for d in marker_items + table_items:
+                    d.DeleteStructure()
 
-    drill_overlaps = []
-    for i, drill1 in enumerate(drill_list):
-        for drill2 in drill_list[i+1 : len(drill_list)+1]:
-            if (abs(drill1[0][0] - drill2[0][0]) < (drill1[1][0] + drill2[1][0])/2) and (abs(drill1[0][1] - drill2[0][1]) < (drill1[1][1] + drill2[1][1])/2) :
-                drill_overlaps.append((drill1[0], drill2[0]))
+            with profiler.Span('marker drawing'):
+                marker_count = 0
+                for drill_type in drill_types:
+                    marker_count += marker_batch(drill_type, drill_markers[drill_type], drill_positions[drill_type]).Commit(board, layer, MARKER_TAG)
+            with profiler.Span('table drawing'):
+                table_count = draw_table(tbl_X_start, tbl_Y_start)
+
+        else:
+            if clear_layer:
+                # the generated items are updated below, the other drawings
+                # are removed as in a full redraw
+                for d in other_items:
+                    d.DeleteStructure()
+                if other_items:
+                    output_log.write('Removed %d other drawings from the layer\n'%len(other_items))
+
+            with profiler.Span('marker drawing'):
+                # incremental update: compare the drill positions with the last run
+                old_drills = {}
+                for drill in state['drills']:
+                    drill_type = (drill['type'][0], tuple(drill['type'][1]), drill['type'][2])
+                    old_drills[drill_type] = (drill['marker'], collections.Counter([tuple(p) for p in drill['positions']]))
+
+                removed = []
+                added = []
+                for drill_type, (marker, old_positions) in old_drills.items():
+                    if drill_markers.get(drill_type) != marker:
+                        # drill type removed or marker changed
+                        removed.append((drill_type, marker, list(old_positions.elements())))
+                for drill_type in drill_types:
+                    marker = drill_markers[drill_type]
+                    positions = collections.Counter(drill_positions[drill_type])
+                    if drill_type not in old_drills or old_drills[drill_type][0] != marker:
+                        added.append((drill_type, marker, list(positions.elements())))
+                    else:
+                        old_positions = old_drills[drill_type][1]
+                        removed.append((drill_type, marker, list((old_positions - positions).elements())))
+                        added.append((drill_type, marker, list((positions - old_positions).elements())))
+
+                marker_count = len(marker_items)
+                removed = [r for r in removed if r[2]]
+                if removed:
+                    marker_index = {}
+                    for d in marker_items:
+                        marker_index.setdefault(DrawingKey(d), []).append(d)
+                    for drill_type, marker, positions in removed:
+                        for key in marker_batch(drill_type, marker, positions).Keys():
+                            items = marker_index.get(key)
+                            if items:
+                                items.pop().DeleteStructure()
+                                marker_count -= 1
+
+                added_count = 0
+                for drill_type, marker, positions in added:
+                    if positions:
+                        added_count += marker_batch(drill_type, marker, positions).Commit(board, layer, MARKER_TAG)
+                marker_count += added_count
+
+            output_log.write('Updated drill markers: %d holes removed, %d holes added\n'%(
+                sum([len(r[2]) for r in removed]), sum([len(a[2]) for a in added])))
+
+            table_count = len(table_items)
+            if state['table'] != table_fingerprint:
+                for d in table_items:
+                    d.DeleteStructure()
+                with profiler.Span('table drawing'):
+                    table_count = draw_table(tbl_X_start, tbl_Y_start)
+
+        if state_fname != None:
+            SaveState(state_fname, {
+                'layer' : layer_name,
+                'marker_items' : marker_count,
+                'table_items' : table_count,
+                'table' : table_fingerprint,
+                'drills' : [{
+                    'type' : drill_type,
+                    'marker' : drill_markers[drill_type],
+                    'positions' : drill_positions[drill_type],
+                    } for drill_type in drill_types],
+                })
+
+    report_progress('Drawing markers')
+    run_in_ui(draw_board)
 
-    for drill_overlap in drill_overlaps:
-        output_log.write('Found drills overlap at (mm): (%.3f:%.3f) and (%3f:%.3f)\n'%
-                (
-                    drill_overlap[0][0]/pcbnew.IU_PER_MM, 
-                    drill_overlap[0][1]/pcbnew.IU_PER_MM,
-                    drill_overlap[1][0]/pcbnew.IU_PER_MM, 
-                    drill_overlap[1][1]/pcbnew.IU_PER_MM,
-                ))
+    # check for overlapping drills
+    report_progress('Checking drill overlaps')
+    with profiler.Span('overlap check'):
+        for drill_overlap in FindDrillOverlaps(GetDrillList(drill_positions)):
+            output_log.write('Found drills overlap at (mm): (%.3f:%.3f) and (%3f:%.3f)\n'%
+                    (
+                        drill_overlap[0][0]/pcbnew.IU_PER_MM, 
+                        drill_overlap[0][1]/pcbnew.IU_PER_MM,
+                        drill_overlap[1][0]/pcbnew.IU_PER_MM, 
+                        drill_overlap[1][1]/pcbnew.IU_PER_MM,
+                    ))
     
     return ret
 
 
+def ExportMain(args):
+    """Drill chart export of the command line (--export)."""
+
+    for fname in args.export:
+        if os.path.splitext(fname)[1][1:].lower() not in EXPORT_FORMATS:
+            print('Unknown export format of %s (%s)'%(fname, ', '.join(EXPORT_FORMATS)))
+            return 1
+
+    profiler = profiling.Profiler()
+
+    with profiler.Span('load board'):
+        board, snapshot = snapshot_cache.LoadSnapshot(args.kicad_pcb, ['footprints', 'pads', 'vias'], args.no_pcbnew, args.no_cache, args.cache_dir)
+
+    chart = profiling.Call(args.profile, DrillChart, snapshot=snapshot, profiler=profiler)
+
+    print("Found %d drill types, %d holes"%(len(chart['drills']), sum([drill['count'] for drill in chart['drills']])))
+    for overlap in chart['overlaps']:
+        print('Found drills overlap at (mm): (%.3f:%.3f) and (%.3f:%.3f)'%(
+            board_snapshot.ToMM(overlap[0][0]), board_snapshot.ToMM(overlap[0][1]),
+            board_snapshot.ToMM(overlap[1][0]), board_snapshot.ToMM(overlap[1][1])))
+
+    with profiler.Span('export'):
+        for fname in args.export:
+            ExportDrillChart(fname, chart)
+            print("Saved drill chart in %s"%fname)
+
+    if args.timing_report != None:
+        sys.stdout.write(profiler.Format())
+        profiler.WriteReport(args.timing_report)
+
+
 def main():
 
     parser = argparse.ArgumentParser(description='Script for generating drill markers and legend for a Kicad pcb')
@@ -505,27 +1056,65 @@ def main():
             help="Table text size (mm) (default = %(default)s)")
     parser.add_argument('--table_title', default=defaults['table_title'], 
             help="Table title")
+    parser.add_argument('-i', '--incremental', action='store_true', 
+            help="Only update the markers of the holes changed since the last incremental run")
     parser.add_argument('-o', '--overwrite', action='store_true', 
             help="Overwrite the original file")
+    parser.add_argument('--no_cache', action='store_true', 
+            help="Do not use the board data cache")
+    parser.add_argument('--cache_dir', default=None, 
+            help="Board data cache directory (default = %s next to the board)"%snapshot_cache.CACHE_DIR)
+    parser.add_argument('-e', '--export', default=None, action='append', 
+            help="Only export the drill chart (drill classes and hole positions) to this file (%s, can be repeated), nothing is drawn and the board is not saved"%', '.join(EXPORT_FORMATS))
+    parser.add_argument('--no_pcbnew', action='store_true', 
+            help="With --export, read the board file directly instead of loading it with pcbnew")
+    parser.add_argument('--timing_report', default=None, 
+            help="Write the time of each stage to this JSON file (see profiling.py)")
+    parser.add_argument('--profile', default=None, 
+            help="Write a cProfile dump of the drill map generation to this file")
 
     args = parser.parse_args()
 
+    if args.export != None:
+        return ExportMain(args)
+
+    if pcbnew == None:
+        print('pcbnew is needed for drawing the drill map, only --export is available without Kicad')
+        return 1
+
     if args.table_text_size_mm < 0.1 or args.table_text_size_mm > 10:
         print('Table Text Size (mm) should be a number between 0.1 and 10')
         return 1
 
-    board = pcbnew.LoadBoard(args.kicad_pcb)
+    profiler = profiling.Profiler()
 
-    # without this the netclass information is lost
-    board.BuildListOfNets()
+    with profiler.Span('load board'):
+        board = pcbnew.LoadBoard(args.kicad_pcb)
+
+        # without this the netclass information is lost
+        board.BuildListOfNets()
+
+    snapshot = None
+    if not args.no_cache:
+        cache = snapshot_cache.SnapshotCache(args.kicad_pcb, args.cache_dir)
+        snapshot = cache.Load('pcbnew')
+        if snapshot == None:
+            with profiler.Span('scan board'):
+                snapshot = board_snapshot.ScanBoard(board)
+            cache.Save('pcbnew', snapshot)
+        else:
+            print('Using cached board data')
     
-    ret = DrillMap(
+    ret = profiling.Call(args.profile, DrillMap,
         board = board,
         layer_name = args.layer_name,
         clear_layer = args.clear_layer,
         table_columns = args.table_columns,
         table_text_size_mm = args.table_text_size_mm,
         table_title = args.table_title,
+        incremental = args.incremental,
+        snapshot = snapshot,
+        profiler = profiler,
         )
 
     print("Done")
@@ -538,9 +1127,14 @@ def main():
     output_filename = args.kicad_pcb
     if not args.overwrite:
         output_filename += '.new'
-    pcbnew.SaveBoard(output_filename, board)
+    with profiler.Span('save board'):
+        pcbnew.SaveBoard(output_filename, board)
     print("Saved updated board in %s"%output_filename)
 
+    if args.timing_report != None:
+        sys.stdout.write(profiler.Format())
+        profiler.WriteReport(args.timing_report)
+
 
 if __name__=='__main__':
     sys.exit(main())
@@ -1,11 +1,11 @@
 
 import wx
-import traceback
 import drill_map as dmap
+import plugin_worker
 import pcbnew
 
 
-class MainPluginDialog(wx.Dialog):
+class MainPluginDialog(plugin_worker.WorkerDialog, wx.Dialog):
 
     def __init__(self, board):
 
@@ -38,6 +38,14 @@ class MainPluginDialog(wx.Dialog):
         self.clear_layer_ctrl.SetValue(True)
         pars_sizer.Add(self.clear_layer_ctrl, flag = ctrl_flags, border = spacing)
 
+        static_text =  wx.StaticText(self, label = "Incremental")
+        pars_sizer.Add(static_text, flag = label_flags, border = spacing)
+        self.incremental_ctrl = wx.CheckBox(self)
+        self.incremental_ctrl.SetValue(False)
+        tt = wx.ToolTip('Only update the markers of the holes changed since the last incremental run')
+        self.incremental_ctrl.SetToolTip(tt)
+        pars_sizer.Add(self.incremental_ctrl, flag = ctrl_flags, border = spacing)
+
         static_text =  wx.StaticText(self, label = "Table Title")
         pars_sizer.Add(static_text, flag = label_flags, border = spacing)
         self.title_ctrl = wx.TextCtrl(self, value = dmap.defaults['table_title']) 
@@ -51,13 +59,8 @@ class MainPluginDialog(wx.Dialog):
 
         main_sizer.Add(pars_sizer, 0, wx.ALIGN_CENTER_VERTICAL|wx.ALL|wx.EXPAND|wx.SHAPED, spacing )
 
-        button_sizer = wx.BoxSizer(wx.HORIZONTAL)
-        self.but_run = wx.Button(self, label = "Run")
-        button_sizer.Add(self.but_run, border = spacing)
-        self.but_dismiss = wx.Button(self, label = "Dismiss")
-        button_sizer.Add(self.but_dismiss, border = spacing)
-
-        main_sizer.Add(button_sizer, 0, flag = wx.ALL|wx.CENTER, border = spacing)
+        # run in background (see plugin_worker.py)
+        self.AddRunControls(main_sizer, spacing)
 
         self.output_log_ctrl = wx.TextCtrl(self, style=wx.TE_MULTILINE|wx.TE_READONLY|wx.TE_DONTWRAP, size=(500,300))
 
@@ -68,15 +71,7 @@ class MainPluginDialog(wx.Dialog):
 	main_sizer.Fit(self)
 	self.Centre(wx.BOTH)
 
-        self.Bind(wx.EVT_CLOSE, self.onCloseWindow)
-	self.but_dismiss.Bind(wx.EVT_BUTTON, self.onCloseWindow)
-	self.but_run.Bind(wx.EVT_BUTTON, self.onRun)
-
 
-    def onCloseWindow(self, event):
-        self.Destroy()
-
-    
     def onRun(self, event):
 
         text_size_mm = self.text_size_mm_ctrl.GetValue()
@@ -96,21 +91,18 @@ class MainPluginDialog(wx.Dialog):
 
 
         columns = self.columns_ctrl.GetCheckedStrings()
-        try:
-            ret = dmap.DrillMap(
-                    board = self.board,
-                    layer_name = self.layer_ctrl.GetString(self.layer_ctrl.GetSelection()),
-                    clear_layer = self.clear_layer_ctrl.IsChecked(),
-                    table_columns = self.columns_ctrl.GetCheckedStrings(),
-                    table_text_size_mm = text_size_mm,
-                    table_title = self.title_ctrl.GetValue(),
-                    output_log = self.output_log_ctrl
-                    )
-        except Exception:
-            self.output_log_ctrl.write(traceback.format_exc())
-            wx.MessageBox("An exception has occured. Please check the output log")
-            return
-                
+        self.StartWorker(dmap.DrillMap, dict(
+                board = self.board,
+                layer_name = self.layer_ctrl.GetString(self.layer_ctrl.GetSelection()),
+                clear_layer = self.clear_layer_ctrl.IsChecked(),
+                table_columns = self.columns_ctrl.GetCheckedStrings(),
+                table_text_size_mm = text_size_mm,
+                table_title = self.title_ctrl.GetValue(),
+                incremental = self.incremental_ctrl.IsChecked(),
+                ))
+
+
+    def DoneMessage(self, ret):
         message = ""
         message += "Done"
         message += '\n'
@@ -119,7 +111,7 @@ class MainPluginDialog(wx.Dialog):
         for warn in ret['warn']:
             message += warn 
             message += '\n'
-        self.output_log_ctrl.write(message)
+        return message
 
         
 def InitMainDialog(board):
@@ -0,0 +1,210 @@
+#!/usr/bin/env python2
+
+# Differences of the assembly data between two board revisions
+#
+# The part databases of the two revisions (built from the board and the
+# schematic BOM, or loaded from a Parts.db directory, see part_db.py) are
+# joined by reference. The report lists the added and removed parts, the
+# parts moved or rotated, the changes of the value, part numbers, footprint
+# and populate status and the BOM lines with a different quantity. It is
+# written in JSON format:
+#   > python plugin_output_assembly/assembly_diff.py rev_a/board.kicad_pcb rev_b/board.kicad_pcb -o diff.json
+
+import sys
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+import output_assembly
+import part_db
+import board_snapshot
+
+__version__ = '0.1'
+
+defaults = {
+        'tolerance_mm' : 0.01,
+        }
+
+# columns compared for the parts in both revisions
+DIFF_COLUMNS = ['value', 'manuf', 'manuf part', 'manuf part alt', 'footprint', 'footprint_type', 'populate']
+
+# columns reported for the added and removed parts
+PART_COLUMNS = ['reference', 'value', 'manuf part', 'footprint', 'side']
+
+# rotations closer than this are the same (degrees)
+ROTATION_TOLERANCE = 1e-3
+
+
+def get_part_keys(parts):
+    """Parts indexed by reference, the parts with the same reference are numbered in order."""
+
+    parts = parts.copy()
+    parts['instance'] = parts.groupby('reference', sort=False).cumcount()
+    return parts
+
+
+def position_mm(parts, suffix=''):
+    x = pd.to_numeric(parts['pos_x' + suffix], errors='coerce')
+    y = pd.to_numeric(parts['pos_y' + suffix], errors='coerce')
+    return board_snapshot.ToMM(x), board_snapshot.ToMM(y)
+
+
+def to_records(df):
+    """Rows of a table as dicts, None for the missing values."""
+
+    return df.astype(object).where(df.notnull(), None).to_dict('records')
+
+
+def part_records(parts, suffix=''):
+    """Description of the added or removed parts."""
+
+    columns = [c + suffix if c != 'reference' else c for c in PART_COLUMNS]
+    ret = parts[columns].copy()
+    ret.columns = PART_COLUMNS
+    ret['x_mm'], ret['y_mm'] = position_mm(parts, suffix)
+    ret['rotation_deg'] = parts['rotation_deg' + suffix]
+    return to_records(ret)
+
+
+def get_bom_quantities(parts, include_th):
+    """Quantity and first part of each BOM line, indexed by the line id."""
+
+    parts = output_assembly.get_bom_parts(parts, include_th)
+    group_id = output_assembly.get_bom_group_id(parts)
+    quantity = parts.groupby(group_id, sort=False).size()
+    first = ~group_id.duplicated()
+    ret = parts.loc[first, ['manuf', 'manuf part', 'footprint']].set_index(group_id[first])
+    ret['qty'] = quantity
+    return ret
+
+
+def diff_part_dbs(parts_a, parts_b, tolerance_mm=defaults['tolerance_mm'], include_th=True):
+    """Differences between the part databases of two revisions (see build_part_db)."""
+
+    a = get_part_keys(parts_a)
+    b = get_part_keys(parts_b)
+    # hash join on the reference
+    merged = pd.merge(a, b, how='outer', on=['reference', 'instance'], suffixes=('_a', '_b'), indicator=True, sort=False)
+
+    ret = {}
+    ret['tolerance_mm'] = tolerance_mm
+    ret['added'] = part_records(merged[merged['_merge'] == 'right_only'], '_b')
+    ret['removed'] = part_records(merged[merged['_merge'] == 'left_only'], '_a')
+
+    both = merged[merged['_merge'] == 'both']
+
+    x_a, y_a = position_mm(both, '_a')
+    x_b, y_b = position_mm(both, '_b')
+    distance = np.hypot(x_b - x_a, y_b - y_a)
+    moved = (distance > tolerance_mm) | (both['side_a'] != both['side_b'])
+    moved_parts = pd.DataFrame({
+            'reference' : both['reference'],
+            'side_a' : both['side_a'], 'side_b' : both['side_b'],
+            'x_mm_a' : x_a, 'y_mm_a' : y_a, 'x_mm_b' : x_b, 'y_mm_b' : y_b,
+            'distance_mm' : distance,
+            })
+    ret['moved'] = to_records(moved_parts[moved])
+
+    rotation = (both['rotation_deg_b'] - both['rotation_deg_a']) % 360
+    rotated = (rotation > ROTATION_TOLERANCE) & (rotation < 360 - ROTATION_TOLERANCE)
+    ret['rotated'] = to_records(both.loc[rotated, ['reference', 'rotation_deg_a', 'rotation_deg_b']])
+
+    # one entry per part with the changed columns, the parts are keyed as
+    # in the merge since a reference can be used by several parts
+    changes = {}
+    for col in DIFF_COLUMNS:
+        if col + '_a' not in both.columns or col + '_b' not in both.columns:
+            continue
+        changed = both[both[col + '_a'] != both[col + '_b']]
+        for key, value_a, value_b in zip(zip(changed['reference'], changed['instance']), changed[col + '_a'], changed[col + '_b']):
+            changes.setdefault(key, {})[col] = [value_a, value_b]
+    ret['changed'] = [{'reference' : key[0], 'changes' : changes[key]}
+            for key in zip(both['reference'], both['instance']) if key in changes]
+
+    # BOM lines with a different quantity
+    bom_a = get_bom_quantities(parts_a, include_th)
+    bom_b = get_bom_quantities(parts_b, include_th)
+    bom = bom_b.combine_first(bom_a)
+    bom['qty_a'] = bom_a['qty'].reindex(bom.index).fillna(0).astype(int)
+    bom['qty_b'] = bom_b['qty'].reindex(bom.index).fillna(0).astype(int)
+    bom['delta'] = bom['qty_b'] - bom['qty_a']
+    bom = bom[bom['delta'] != 0].drop(columns=['qty'])
+    bom.insert(0, 'id', [i.split('\x1f') for i in bom.index])
+    ret['bom'] = to_records(bom)
+
+    ret['summary'] = dict([(k, len(ret[k])) for k in ['added', 'removed', 'moved', 'rotated', 'changed', 'bom']])
+    return ret
+
+
+def load_parts(fname, bom_fname=None, no_pcbnew=False, no_cache=False, cache_dir=None):
+    """Part database of a board file or a Parts.db directory."""
+
+    if os.path.isdir(fname):
+        return part_db.load_part_db(fname)
+
+    if bom_fname == None:
+        bom_fname = os.path.splitext(fname)[0] + '.csv'
+    board, snapshot = output_assembly.snapshot_cache.LoadSnapshot(fname, ['footprints'], no_pcbnew, no_cache, cache_dir, output_log=sys.stderr)
+    return output_assembly.build_part_db(board, bom_fname, snapshot)
+
+
+def json_value(x):
+    # numpy scalars
+    if hasattr(x, 'item'):
+        return x.item()
+    return str(x)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Differences of the assembly data between two revisions of a Kicad project')
+    parser.add_argument('rev_a',
+            help="Kicad PCB file or part database directory (Parts.db) of the first revision")
+    parser.add_argument('rev_b',
+            help="Kicad PCB file or part database directory (Parts.db) of the second revision")
+    parser.add_argument('--bom_a', default=None,
+            help="BOM csv file of the first revision (default = csv file with the name of the board)")
+    parser.add_argument('--bom_b', default=None,
+            help="BOM csv file of the second revision (default = csv file with the name of the board)")
+    parser.add_argument('--output', '-o', default=None,
+            help="Output JSON file (default = standard output)")
+    parser.add_argument('--tolerance_mm', type=float, default=defaults['tolerance_mm'],
+            help="Parts moved by less than this distance are not reported (default = %(default)s)")
+    parser.add_argument('-t', '--include_th', action='store_true',
+            help="Include through hole components in the BOM lines")
+    parser.add_argument('--no_pcbnew', action='store_true',
+            help="Read the board files directly instead of loading them with pcbnew")
+    parser.add_argument('--no_cache', action='store_true',
+            help="Do not use the board data cache")
+    parser.add_argument('--cache_dir', default=None,
+            help="Board data cache directory (default = %s next to each board)"%output_assembly.snapshot_cache.CACHE_DIR)
+
+    args = parser.parse_args()
+
+    # the messages of build_part_db do not go in the report
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    try:
+        parts_a = load_parts(args.rev_a, args.bom_a, args.no_pcbnew, args.no_cache, args.cache_dir)
+        parts_b = load_parts(args.rev_b, args.bom_b, args.no_pcbnew, args.no_cache, args.cache_dir)
+    finally:
+        sys.stdout = stdout
+
+    ret = diff_part_dbs(parts_a, parts_b, args.tolerance_mm, args.include_th)
+    ret['rev_a'] = args.rev_a
+    ret['rev_b'] = args.rev_b
+
+    if args.output == None:
+        json.dump(ret, sys.stdout, indent=1, default=json_value)
+        sys.stdout.write('\n')
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(ret, f, indent=1, default=json_value)
+
+    sys.stderr.write(', '.join(['%s %d'%(k, v) for k, v in sorted(ret['summary'].items())]) + '\n')
+
+
+if __name__=='__main__':
+    sys.exit(main())
@@ -3,12 +3,30 @@
 import sys
 import os
 import shutil
-import re
 import collections
 import argparse
 import subprocess
+import numpy as np
 import pandas as pd
-import pcbnew
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+try:
+    import pcbnew
+except ImportError:
+    # the outputs can be generated from the board file without Kicad
+    pcbnew = None
+
+# shared modules are in the parent directory
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import board_snapshot
+import footprint_bbox
+import snapshot_cache
+import profiling
+import part_db
 
 __version__ = '0.1'
 
@@ -34,10 +52,6 @@ config = {
     }
 
 
-def get_ref_prefix(row):
-    return re.match('^(.*?)\d', row['reference']).group(1)
-
-
 description_spec = {
         #prefix     columns to concatenate
         'R' : ['Resistor', 'value', 'footprint_short', 'type', 'tolerance', 'power', 'tc'] ,
@@ -46,58 +60,65 @@ description_spec = {
         'Y' : ['Crystal', 'frequency', 'tolerance', 'footprint_short'] ,
         }
 
-    
-def generate_description(row):
-    """Create a description string using other fields in the row."""
-
-    if pd.isnull(row['description']):
-        ret = ''
-    else:
-        ret = row['description'] 
 
-    ref_prefix = row['ref_prefix']
+def merge_bom_descriptions(parts, group_id):
+    """Create the description strings of the merged lines in the BOM
 
-    if ref_prefix in description_spec.keys():
-        ret = description_spec[ref_prefix][0]
-        for col in description_spec[ref_prefix][1:]:
-            if col in row.index:
-                if not pd.isnull(row[col]):
-                    ret += ' '
-                    ret += row[col]
-    return ret.strip()
-
-
-def generate_merged_description(rows):
-    """Create a description string for a merged line in the BOM
-    
-    If a target column contains more than one spec all specs will be listed
-    
+    parts are the parts of the lines (without type override) and group_id
+    the line of each part. If a target column contains more than one spec
+    all specs will be listed, in the order of the parts.
+    Returns the descriptions indexed by group id.
     """
-    
-    ref_prefix_set = set([row['ref_prefix'] for row in rows])
-    if len(ref_prefix_set) > 1:
-        raise Exception('Error: Cannot merge description for items with differents ref prefix: ' + ', '.join(ref_prefix_set) )
-
-    ret = ''
-
-    ref_prefix = list(ref_prefix_set)[0]
-    if ref_prefix in description_spec.keys():
-        ret = description_spec[ref_prefix][0]
-        for col in description_spec[ref_prefix][1:]:
-            col_list = []
-            for row in rows:
-                if col in row.index:
-                    if not pd.isnull(row[col]):
-                        col_list.append(row[col])
-            col_list = list(set(col_list))
-            if len(col_list) > 1:
-                ret += ' (' + ' '.join(col_list) + ')'
-            else:
-                ret += ' ' + col_list[0]
-    else:
-        ret = rows[0]['description']
-
-    return ret.strip()
+
+    first = ~group_id.duplicated()
+    ret = pd.Series(parts['description'][first].values, index=group_id[first], dtype=object)
+
+    for ref_prefix, spec in description_spec.items():
+        mask = parts['ref_prefix'] == ref_prefix
+        if not mask.any():
+            continue
+        ids = group_id[mask]
+        description = pd.Series(spec[0], index=ids.unique(), dtype=object)
+        for col in spec[1:]:
+            if col not in parts.columns:
+                continue
+            specs = pd.DataFrame({'id' : ids, 'spec' : parts.loc[mask, col]}).drop_duplicates()
+            groups = specs.groupby('id', sort=False)['spec']
+            joined = groups.agg(' '.join)
+            description += ' ' + joined.where(groups.size() == 1, '(' + joined + ')')
+        ret[description.index] = description
+
+    return ret.str.strip()
+
+
+def get_bom_group_id(parts):
+    """Id of the BOM line of each part, using the criteria in config['BOM_grouping']."""
+
+    def group_key(grouping):
+        key = parts[grouping[0]].astype(str)
+        for col in grouping[1:]:
+            key = key + '\x1f' + parts[col].astype(str)
+        return key
+
+    groupings = config['BOM_grouping']
+    group_id = group_key(groupings[-1])
+    # the first valid criterion is used
+    for grouping in reversed(groupings[:-1]):
+        valid = parts[grouping].astype(bool).all(axis=1)
+        group_id = group_id.where(~valid, group_key(grouping))
+    return group_id
+
+
+def find_bom_conflict(group_id, values):
+    """First BOM line with parts of different values, (part id, values) or None."""
+
+    values = pd.DataFrame({'id' : group_id, 'value' : values}).drop_duplicates()
+    duplicated = values['id'].duplicated()
+    if not duplicated.any():
+        return None
+    # first line in the BOM order
+    part_id = values['id'][values['id'].isin(values['id'][duplicated])].iloc[0]
+    return tuple(part_id.split('\x1f')), list(values['value'][values['id'] == part_id])
 
 
 fooprint_short_spec = {
@@ -109,116 +130,87 @@ fooprint_short_spec = {
         }
 
 
-def get_footprint_short(row):
-    """Generate a short footprint string.
-    
-    For example remove the prefix: R_0402 -> 0402 
-    """
-
-    ref_prefix = row['ref_prefix']
-    if ref_prefix in fooprint_short_spec.keys():
-        return fooprint_short_spec[ref_prefix](row['footprint'])
-
-
-def split_part_numbers(row):
-    """Split part number string into main and alternates."""
-    
-    part_no = ''
-    part_no_alt = ''
-
-    if row['manuf part'] != '':
-        tmp = row['manuf part'].split(None, 1)
-        part_no = tmp[0]
-        if len(tmp) > 1:
-            part_no_alt = tmp[1]
-    row['manuf part'] = part_no
-    row['manuf part alt'] = part_no_alt
-            
-    return row
+def process_part_db(parts):
+    """Add the derived columns to the merged schematic and layout part table.
 
+    The value cleanup (ohms appended to the resistor values without
+    multiplier), the reference prefix, the short footprint, the populate and
+    type override status and the main and alternate part numbers are
+    computed on whole columns (see benchmarks/bench_part_db.py for the row
+    by row version).
+    """
 
-def process_value(row):
-    """Cleanup the value field."""
+    reference = parts['reference']
+    value = parts['value']
 
-    if row['reference'].upper()[0] == 'R':
-        # Append ohms for resistor values w/o multiplier
-        if re.match('\d*\.*\d$', row['value']):
-            row['value'] = row['value'] + ' ohms'
+    # Append ohms for resistor values w/o multiplier
+    ohms = reference.str.upper().str.startswith('R') & value.str.match(r'\d*\.*\d$')
+    parts.loc[ohms, 'value'] = value[ohms] + ' ohms'
 
-    return row
+    ref_prefix = reference.str.extract(r'^(.*?)\d', expand=False)
+    if ref_prefix.isnull().any():
+        raise Exception('Error: Invalid reference %s'%reference[ref_prefix.isnull()].iloc[0])
+    parts['ref_prefix'] = ref_prefix
 
-def populate_status(row):
+    # footprint processing 
+    parts['footprint_lib'] = parts['footprint'].apply(lambda x: x.split(':',1)[0])
+    parts['footprint'] = parts['footprint'].apply(lambda x: x.split(':',1)[1])
+    footprint_short = pd.Series([None] * len(parts), index=parts.index, dtype=object)
+    for prefix, func in fooprint_short_spec.items():
+        mask = ref_prefix == prefix
+        if mask.any():
+            footprint_short[mask] = parts.loc[mask, 'footprint'].map(func)
+    parts['footprint_short'] = footprint_short
 
-    if row['ref_prefix'] in config['DNI_ref_prefix']:
-        return False
-    for dni_pre in config['DNI_val_prefix']:
-        if row['value'].startswith(dni_pre):
-            return False
-    return True
+    value = parts['value']
+    dni = ref_prefix.isin(config['DNI_ref_prefix']) | value.str.startswith(tuple(config['DNI_val_prefix']))
+    parts['populate'] = ~dni
+    parts['type_override'] = value.str.startswith(tuple(config['TOV_value_prefix']))
 
+    # Split part number string into main and alternates
+    part_numbers = parts['manuf part'].str.split(None, n=1)
+    parts['manuf part'] = part_numbers.str[0].fillna('')
+    parts['manuf part alt'] = part_numbers.str[1].fillna('')
 
-def type_override_status(row):
+    # same column types as a row by row processing of the table
+    return parts.infer_objects()
 
-    if row['value'].startswith(tuple(config['TOV_value_prefix'])):
-        return True
-    return False
 
+def build_part_db(board, sch_bom_fname, snapshot=None, bbox_mode='pads'):
+    """Merge the schematic BOM with the footprints of the board.
 
-def build_part_db(board, sch_bom_fname):
+    bbox_mode selects the bounding box used for the part size and center
+    (see footprint_bbox.FootprintBoxes).
+    """
 
     sch_bom = pd.read_csv(sch_bom_fname, dtype=str)
     # remove white space from column names   
     sch_bom.columns = [c.strip().lower() for c in sch_bom.columns]
 
-
-    # Extract part info from the board file
-    pcb_modules = []
-    aux_origin = board.GetAuxOrigin()
-    #output += format_string%('#Ref', 'PosX', 'PosY', 'Rot', 'Side', 'Type', 'Val', 'Package')
-    for m in board.GetModules():
-        c = m.GetCenter()
-        pos_x = c.x - aux_origin.x
-        pos_y = aux_origin.y - c.y
-        side = 'top'
-        #change for kicad 4.x
-        #package = m.GetFPID().GetFootprintName().c_str()
-        #change for kicad 5.x
-        footprint = m.GetFPID().GetLibItemName().c_str()
-        m_type = 'SMT' 
-	attr = m.GetAttributes()
-        rotation_deg = m.GetOrientation()/10.0
-        if attr == 0:
-            m_type = 'TH'
-        elif attr == 1:
-            m_type = 'SMT'
-        else:
-            m_type = 'VIRT'
-        	
-        if m.IsFlipped():
-            side = 'bottom'
-
-        rect = None
-        for pad in m.Pads():
-            if rect == None:
-                rect = pad.GetBoundingBox()
-            else:
-                rect.Merge(pad.GetBoundingBox())
-
-        if rect != None:
-            if rotation_deg in [90, 270]:
-                size_x = rect.GetHeight()
-                size_y = rect.GetWidth()
-            else:
-                size_x = rect.GetWidth()
-                size_y = rect.GetHeight()
-
-            bb_pos_x = (rect.GetX() + rect.GetWidth() / 2) - aux_origin.x
-            bb_pos_y = aux_origin.y - (rect.GetY() + rect.GetHeight() / 2)
-
-        pcb_modules.append([m.GetReference(), m.GetValue(), footprint, pos_x, pos_y, rotation_deg, size_x, size_y, bb_pos_x, bb_pos_y, side, m_type])
-
-    pcb_modules = pd.DataFrame(pcb_modules)
-    pcb_modules.columns = ['reference', 'value_pcb', 'footprint_pcb', 'pos_x', 'pos_y', 'rotation_deg', 'size_x', 'size_y', 'bbox_pos_x', 'bbox_pos_y' ,'side', 'footprint_type']
+    if snapshot == None:
+        snapshot = board_snapshot.ScanBoard(board)
+
+    # Extract part info from the board snapshot
+    aux_origin_x, aux_origin_y = snapshot.aux_origin
+    fp = snapshot.footprints
+    boxes = footprint_bbox.FootprintBoxes(snapshot, bbox_mode)
+    attributes = footprint_bbox.Column(fp, 'attributes')
+
+    pcb_modules = pd.DataFrame(collections.OrderedDict([
+            ('reference',      fp.reference),
+            ('value_pcb',      fp.value),
+            ('footprint_pcb',  fp.footprint),
+            ('pos_x',          footprint_bbox.Column(fp, 'pos_x').astype(np.int64) - aux_origin_x),
+            ('pos_y',          aux_origin_y - footprint_bbox.Column(fp, 'pos_y').astype(np.int64)),
+            ('rotation_deg',   footprint_bbox.Column(fp, 'orientation') / 10.0),
+            # size in the footprint frame
+            ('size_x',         boxes['size_x']),
+            ('size_y',         boxes['size_y']),
+            ('bbox_pos_x',     boxes['center_x'] - aux_origin_x),
+            ('bbox_pos_y',     aux_origin_y - boxes['center_y']),
+            ('side',           np.where(footprint_bbox.Column(fp, 'flipped') != 0, 'bottom', 'top')),
+            ('footprint_type', np.where(attributes == 0, 'TH', np.where(attributes == 1, 'SMT', 'VIRT'))),
+            ]))
 
     parts = pd.merge(sch_bom, pcb_modules, how='outer', on='reference')
 
@@ -226,20 +218,7 @@ def build_part_db(board, sch_bom_fname):
     parts.fillna('', inplace=True)
     parts = parts.reset_index(drop=True)
 
-    parts = parts.apply(process_value, axis=1)
-    parts['ref_prefix'] = parts.apply(get_ref_prefix, axis=1)
-    
-    # footprint processing 
-    parts['footprint_lib'] = parts['footprint'].apply(lambda x: x.split(':',1)[0])
-    parts['footprint'] = parts['footprint'].apply(lambda x: x.split(':',1)[1])
-    parts['footprint_short'] = parts.apply(get_footprint_short, axis=1)
-
-    #parts['description'] = parts.apply(generate_description, axis=1)
-
-    parts['populate'] = parts.apply(populate_status, axis=1)
-    parts['type_override'] = parts.apply(type_override_status, axis=1)
-
-    parts = parts.apply(split_part_numbers, axis=1)
+    parts = process_part_db(parts)
 
     # check for errors
     footprint_mismatch = parts[(parts.footprint_pcb != parts.footprint) & (parts.footprint_pcb != '')]
@@ -259,7 +238,8 @@ def build_part_db(board, sch_bom_fname):
     return parts
 
 
-def get_data_str(
+def write_data(
+        f,
         parts, 
         spec_dict, 
         separator = ',',
@@ -269,6 +249,11 @@ def get_data_str(
         header_on = True, 
         header_prefix = ''
         ):
+    """Write the parts to the file object f, one line per part.
+
+    The lines are written as they are formatted, the columns in spec_dict
+    are read with itertuples() without building a row Series per part.
+    """
 
     if populated_only:
         parts = parts[(parts['populate'] == True)]
@@ -278,34 +263,49 @@ def get_data_str(
 
     parts = parts.sort_values(['reference'])
 
-    ret = ''
     if file_doc != None:
-        ret += file_doc
-        ret += '\n'
+        f.write(file_doc)
+        f.write('\n')
     
     if header_on:
         header_list = [v[0] for k,v in spec_dict.items()]
-        ret += header_prefix + separator.join(header_list)
-        ret += '\n'
+        f.write(header_prefix + separator.join(header_list))
+        f.write('\n')
 
-    for index, row in parts.iterrows():
-        ret += separator.join([v[1](row[k]) for k,v in spec_dict.items()])
-        ret += '\n'
-    return ret
+    funcs = [v[1] for k,v in spec_dict.items()]
+    for values in parts[list(spec_dict.keys())].itertuples(index=False, name=None):
+        f.write(separator.join([func(x) for func, x in zip(funcs, values)]))
+        f.write('\n')
 
 
-def get_centroid_data(parts):
+def get_data_str(
+        parts, 
+        spec_dict, 
+        separator = ',',
+        populated_only = True,
+        smt_only = True,
+        file_doc = None, 
+        header_on = True, 
+        header_prefix = ''
+        ):
+    f = StringIO()
+    write_data(f, parts, spec_dict, separator, populated_only, smt_only, file_doc, header_on, header_prefix)
+    return f.getvalue()
+
+
+def write_centroid_data(f, parts):
     
     spec_dict = collections.OrderedDict([
             # db_column        header       transform func
             ('reference',     ('RefDes',    lambda x: '"%s"'%x)), 
             ('side',          ('Layer',     lambda x: '"%s"'%x)), 
-            ('pos_x',         ('LocationX', lambda x: '"%.4f"'%pcbnew.ToMM(x))), 
-            ('pos_y',         ('LocationY', lambda x: '"%.4f"'%pcbnew.ToMM(x))), 
+            ('pos_x',         ('LocationX', lambda x: '"%.4f"'%board_snapshot.ToMM(x))), 
+            ('pos_y',         ('LocationY', lambda x: '"%.4f"'%board_snapshot.ToMM(x))), 
             ('rotation_deg',  ('Rotation',  lambda x: '"%.4f"'%x)), 
             ]) 
 
-    return get_data_str(
+    write_data(
+            f,
             parts,
             spec_dict,
             separator = ',',
@@ -316,7 +316,13 @@ def get_centroid_data(parts):
             )
 
 
-def get_MacroFab_xyrs_data(parts, include_th = True):
+def get_centroid_data(parts):
+    f = StringIO()
+    write_centroid_data(f, parts)
+    return f.getvalue()
+
+
+def write_MacroFab_xyrs_data(f, parts, include_th = True):
 
     def footprint_type(t):
         if t.lower() == 'smt':
@@ -330,20 +336,21 @@ def get_MacroFab_xyrs_data(parts, include_th = True):
 
     spec_dict = collections.OrderedDict([
             ('reference',        ('Designator', lambda x: '%s'%x)), 
-            ('bbox_pos_x',       ('X-Loc',      lambda x: '%.2f'%pcbnew.ToMils(x))), 
-            ('bbox_pos_y',       ('Y-Loc',      lambda x: '%.2f'%pcbnew.ToMils(x))), 
+            ('bbox_pos_x',       ('X-Loc',      lambda x: '%.2f'%board_snapshot.ToMils(x))), 
+            ('bbox_pos_y',       ('Y-Loc',      lambda x: '%.2f'%board_snapshot.ToMils(x))), 
             ('rotation_deg',     ('Rotation',   lambda x: '%.0f'%x)), 
             ('side',             ('Side',       lambda x: '%s'%x)), 
             ('footprint_type',   ('Type',       lambda x: '%s'%footprint_type(x))), 
-            ('size_x',           ('X-Size',     lambda x: '%.2f'%pcbnew.ToMils(x))), 
-            ('size_y',           ('Y-Size',     lambda x: '%.2f'%pcbnew.ToMils(x))), 
+            ('size_x',           ('X-Size',     lambda x: '%.2f'%board_snapshot.ToMils(x))), 
+            ('size_y',           ('Y-Size',     lambda x: '%.2f'%board_snapshot.ToMils(x))), 
             ('value',            ('Value',      lambda x: '%s'%x)), 
             ('footprint',        ('Footprint',  lambda x: '%s'%x)), 
             ('populate',         ('Populate',   lambda x: '%d'%populate_val(x))), 
             ('manuf part',       ('MPN',        lambda x: '%s'%x)), 
             ]) 
 
-    return get_data_str(
+    write_data(
+            f,
             parts,
             spec_dict,
             separator = '\t',
@@ -355,7 +362,14 @@ def get_MacroFab_xyrs_data(parts, include_th = True):
             )
 
 
-def get_bom_data(parts, include_th = True):
+def get_MacroFab_xyrs_data(parts, include_th = True):
+    f = StringIO()
+    write_MacroFab_xyrs_data(f, parts, include_th)
+    return f.getvalue()
+
+
+def get_bom_parts(parts, include_th = True):
+    """Parts listed in the BOM, in the BOM order."""
 
     # keep only active parts
     parts = parts[(parts['footprint_type'] != 'VIRT')]
@@ -365,74 +379,68 @@ def get_bom_data(parts, include_th = True):
     if not include_th:
         parts = parts[(parts['footprint_type'] == 'SMT') ]
 
-    parts = parts.sort_values(['type_override', 'footprint_type', 'reference'], ascending=[True, True, True])
-
-    # group the parts
-    bom_dict = collections.OrderedDict()
-    for index, row in parts.iterrows():
-        part_id = None
-        for grouping in config['BOM_grouping'][:-1]:
-            if all(row[grouping]):
-                part_id = tuple(row[grouping])
-                break
-        if not part_id:
-            part_id = tuple(row[config['BOM_grouping'][-1]])
-        if part_id in bom_dict:
-            (bom_dict[part_id])[0] += 1
-            (bom_dict[part_id])[1] += ',' + row['reference'] 
-            (bom_dict[part_id])[2].append(row) 
-        else:
-            bom_dict[part_id] = [1, row['reference'], [row]]
-
-    for part_id, part_bom in bom_dict.items():
-        part_bom_rows = []
-        part_bom_rows_tov = []
-        for row in part_bom[-1]:
-            if row['type_override']:
-                part_bom_rows_tov.append(row)
-            else:
-                part_bom_rows.append(row)
-
-        # check footprints (skip parts with type override)
-        footprint_set = set([row['footprint'] for row in part_bom_rows])
-        if len(footprint_set) > 1:
-            raise Exception('Error: parts identified with id "%s" have multiple fooprints: %s'%(part_id,  ', '.join(footprint_set)))
-        
-        if len(part_bom_rows) > 0:
-            # generate a merged description
-            merged_description = generate_merged_description(part_bom_rows)
-            part_bom[-1] = part_bom_rows[0]
-            part_bom[-1]['description'] = merged_description
-        else:
-            # we have only type override parts
-            part_bom[-1] = part_bom_rows_tov[0]
-            part_bom[-1]['description'] = "Part with type override"
+    return parts.sort_values(['type_override', 'footprint_type', 'reference'], ascending=[True, True, True])
 
 
-    ret = ''
-        
-    placements_total = 0
-    placement_th = 0
-    placement_has_BGA = 'No'
-    ret += 'Item#,Qty,RefDes,Manufacturer,Mfg Part #,Mfg Part # Alt,Description,Package,Type\n'
-    for i, (part_id, part_bom) in enumerate(bom_dict.items()):
-        ret += '%d,%d,"%s",'%(i+1,part_bom[0],part_bom[1])
+def write_bom_data(f, parts, include_th = True):
+    """Write the BOM to the file object f and return the board summary."""
+
+    parts = get_bom_parts(parts, include_th)
+
+    # group the parts, the groups are in the order of their first part
+    group_id = get_bom_group_id(parts)
+    groups = parts.groupby(group_id, sort=False)
+    quantity = groups.size()
+    references = groups['reference'].agg(','.join)
+
+    # parts with type override are sorted last, the first part of a group
+    # is a part without type override if the group has one
+    first = ~group_id.duplicated()
+    bom = parts[first].set_index(group_id[first])
+
+    # check footprints (skip parts with type override)
+    regular = ~parts['type_override']
+    conflict = find_bom_conflict(group_id[regular], parts.loc[regular, 'footprint'])
+    if conflict:
+        raise Exception('Error: parts identified with id "%s" have multiple fooprints: %s'%(conflict[0], ', '.join(conflict[1])))
+    conflict = find_bom_conflict(group_id[regular], parts.loc[regular, 'ref_prefix'])
+    if conflict:
+        raise Exception('Error: Cannot merge description for items with differents ref prefix: ' + ', '.join(conflict[1]))
+
+    # generate merged descriptions, groups with only type override parts get a fixed description
+    description = merge_bom_descriptions(parts[regular], group_id[regular])
+    bom['description'] = description.reindex(bom.index).fillna('Part with type override')
+
+    f.write('Item#,Qty,RefDes,Manufacturer,Mfg Part #,Mfg Part # Alt,Description,Package,Type\n')
+    columns = bom[['manuf', 'manuf part', 'manuf part alt', 'description', 'footprint', 'footprint_type']]
+    for i, (qty, refs, values) in enumerate(zip(quantity, references, columns.itertuples(index=False, name=None))):
+        f.write('%d,%d,"%s",'%(i+1, qty, refs))
         # add tab to values to prevent automatic conversion to numbers
-        ret += ','.join(['"%s\t"'%x for x in part_bom[-1][['manuf', 'manuf part', 'manuf part alt', 'description', 'footprint', 'footprint_type']]])
-        ret += '\n'
-        placements_total += part_bom[0]
-        if part_bom[-1]['footprint_type'] == 'TH':
-            placement_th += part_bom[0]
-        if re.search('[bB][gG][aA]', part_bom[-1]['footprint']):
-            placement_has_BGA = 'Yes'
-
-    ret += '\n'
-    ret += 'Board Summary\n'
-    ret += 'Unique Part Count,%d\n'%len(bom_dict.keys())
-    ret += 'Total Placements,%d\n'%placements_total
-    ret += 'Through Hole Placement,%d\n'%placement_th
-    ret += 'Has BGA Placements,%s\n'%placement_has_BGA
-    return ret
+        f.write(','.join(['"%s\t"'%x for x in values]))
+        f.write('\n')
+
+    placements_total = int(quantity.sum())
+    placement_th = int(quantity[bom['footprint_type'] == 'TH'].sum())
+    placement_has_BGA = 'Yes' if bom['footprint'].str.contains('[bB][gG][aA]').any() else 'No'
+
+    summary = collections.OrderedDict([
+            ('Unique Part Count',      len(bom)),
+            ('Total Placements',       placements_total),
+            ('Through Hole Placement', placement_th),
+            ('Has BGA Placements',     placement_has_BGA),
+            ])
+
+    f.write('\n')
+    f.write('Board Summary\n')
+    for k, v in summary.items():
+        f.write('%s,%s\n'%(k, v))
+    return summary
+
+
+def get_bom_data(parts, include_th = True):
+    f = StringIO()
+    write_bom_data(f, parts, include_th)
+    return f.getvalue()
 
 
 def OutputAssembly(
@@ -442,41 +450,77 @@ def OutputAssembly(
         bom_fname = None,
         include_th = True,
         dump_part_db = False,
-        output_log = sys.stdout
+        snapshot = None,
+        bbox_mode = 'pads',
+        output_log = sys.stdout,
+        progress = None,
+        run_in_ui = None,
+        profiler = None
         ):
+    """Generate the assembly outputs.
+
+    progress(step, step_count, stage) is called before each stage and the
+    board is scanned through run_in_ui(func, *args) (see plugin_worker.py).
+    The time of the stages is recorded in profiler (see profiling.py).
+    """
 
     ret = {}
     ret['warn'] = []
 
-    if board == None:
-        board = pcbnew.GetBoard()
+    if profiler == None:
+        profiler = profiling.NullProfiler()
+    if run_in_ui == None:
+        run_in_ui = lambda func, *args: func(*args)
+
+    stages = ['Building part database', 'Writing part database', 'Writing placement data', 'Writing XYRS data', 'Writing BOM']
+    if not dump_part_db:
+        stages.remove('Writing part database')
+    def report_progress(stage):
+        if progress != None:
+            progress(stages.index(stage), len(stages), stage)
+
+    if snapshot == None:
+        if board == None:
+            board = pcbnew.GetBoard()
 
-    if not board:
-        raise Exception('Error: Invalid board')
+        if not board:
+            raise Exception('Error: Invalid board')
 
     if bom_fname == None:
         raise Exception("Missing BOM file")
 
-    parts = build_part_db(board, bom_fname)
+    report_progress('Building part database')
+    with profiler.Span('part db'):
+        if snapshot == None:
+            snapshot = run_in_ui(board_snapshot.ScanBoard, board)
+        parts = build_part_db(board, bom_fname, snapshot, bbox_mode)
 
     os.makedirs(output_dir)
 
     if dump_part_db:
-        fname = os.path.join(output_dir, "Parts.csv")
+        report_progress('Writing part database')
+        fname = os.path.join(output_dir, "Parts.db")
         output_log.write('Writing part database to %s\n'%fname)
-        parts.to_csv(fname)
+        with profiler.Span('write part db'):
+            part_db.save_part_db(parts, fname)
 
+    report_progress('Writing placement data')
     fname = os.path.join(output_dir, "Placement.pos")
     output_log.write('Writing SMT placement data to %s\n'%fname)
-    open(fname, 'w').write(get_centroid_data(parts.copy()))
+    with profiler.Span('write placement'), open(fname, 'w') as f:
+        write_centroid_data(f, parts)
 
+    report_progress('Writing XYRS data')
     fname = os.path.join(output_dir, "Parts.XYRS")
     output_log.write('Writing XYRS data to %s\n'%fname)
-    open(fname, 'w').write(get_MacroFab_xyrs_data(parts.copy(), include_th))
+    with profiler.Span('write xyrs'), open(fname, 'w') as f:
+        write_MacroFab_xyrs_data(f, parts, include_th)
 
+    report_progress('Writing BOM')
     fname = os.path.join(output_dir, "BOM.csv")
     output_log.write('Writing BOM to %s\n'%fname)
-    open(fname, 'w').write(get_bom_data(parts.copy(), include_th))
+    with profiler.Span('write bom'), open(fname, 'w') as f:
+        ret['bom_summary'] = write_bom_data(f, parts, include_th)
 
     return ret
 
@@ -495,7 +539,19 @@ def main():
     parser.add_argument('-t', '--include_th', action='store_true',
             help="Include through hole components in the generated bom")
     parser.add_argument('-d', '--debug_db', action='store_true',
-            help="Dump the part database as csv")
+            help="Dump the part database (Parts.db directory, see part_db.py)")
+    parser.add_argument('-b', '--bbox', default='pads', choices=footprint_bbox.BBOX_MODES,
+            help="Footprint outline used for the part size and center in the XYRS file (default = %(default)s)")
+    parser.add_argument('--no_pcbnew', action='store_true',
+            help="Read the board file directly instead of loading it with pcbnew")
+    parser.add_argument('--no_cache', action='store_true',
+            help="Do not use the board data cache")
+    parser.add_argument('--cache_dir', default=None,
+            help="Board data cache directory (default = %s next to the board)"%snapshot_cache.CACHE_DIR)
+    parser.add_argument('--timing_report', default=None,
+            help="Write the time of each stage to this JSON file (see profiling.py)")
+    parser.add_argument('--profile', default=None,
+            help="Write a cProfile dump of the output generation to this file")
 
     args = parser.parse_args()
 
@@ -507,24 +563,35 @@ def main():
             return
 
 
-    board = pcbnew.LoadBoard(args.kicad_pcb)
+    profiler = profiling.Profiler()
+
+    with profiler.Span('load board'):
+        # only the footprints are needed
+        board, snapshot = snapshot_cache.LoadSnapshot(args.kicad_pcb, ['footprints'], args.no_pcbnew, args.no_cache, args.cache_dir)
 
     if args.bom_fname == None:
-        args.bom_fname = os.path.splitext(os.path.basename(board.GetFileName()))[0] + '.csv'
+        args.bom_fname = os.path.splitext(os.path.basename(args.kicad_pcb))[0] + '.csv'
 
-    ret = OutputAssembly(
+    ret = profiling.Call(args.profile, OutputAssembly,
             board = board, 
             output_dir = args.output_dir, 
             overwrite = args.overwrite,
             bom_fname = args.bom_fname,
             include_th = args.include_th,
-            dump_part_db = args.debug_db
+            dump_part_db = args.debug_db,
+            snapshot = snapshot,
+            bbox_mode = args.bbox,
+            profiler = profiler
             )
 
     print("Done\n")
     for w in ret['warn']:
         print(w)
 
+    if args.timing_report != None:
+        sys.stdout.write(profiler.Format())
+        profiler.WriteReport(args.timing_report)
+
 
 if __name__=='__main__':
     sys.exit(main())
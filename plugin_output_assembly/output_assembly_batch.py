@@ -0,0 +1,165 @@
+#!/usr/bin/env python2
+
+# Assembly outputs of several boards
+#
+# The boards are listed in a JSON manifest, paths are relative to the
+# manifest file:
+#   [
+#     {"kicad_pcb" : "board_a/board_a.kicad_pcb", "bom" : "board_a/bom.csv", "output_dir" : "out/board_a"},
+#     {"kicad_pcb" : "board_b/board_b.kicad_pcb", "include_th" : true}
+#   ]
+# The BOM defaults to the csv file with the name of the board next to the
+# board, the output directory to OUTPUT_ASSEMBLY next to the board.
+#
+# The jobs are run by a pool of worker processes (see batch_runner.py), so
+# the modules are imported once per worker instead of once per board. A
+# failed job does not stop the other ones.
+#   > python plugin_output_assembly/output_assembly_batch.py -j 8 release.json
+
+import sys
+import os
+import json
+import time
+import shutil
+import argparse
+import traceback
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+import output_assembly
+import profiling
+import batch_runner
+
+__version__ = '0.1'
+
+
+def load_manifest(fname):
+    """Jobs of a manifest file with the paths and the default values resolved."""
+
+    with open(fname) as f:
+        manifest = json.load(f)
+
+    base_dir = os.path.dirname(os.path.abspath(fname))
+    jobs = []
+    for i, entry in enumerate(manifest):
+        if 'kicad_pcb' not in entry:
+            raise Exception('Error: Missing "kicad_pcb" in job %d of %s'%(i + 1, fname))
+        kicad_pcb = os.path.join(base_dir, entry['kicad_pcb'])
+        board_dir = os.path.dirname(kicad_pcb)
+        job = {}
+        job['index'] = i
+        job['name'] = entry.get('name', os.path.splitext(os.path.basename(kicad_pcb))[0])
+        job['kicad_pcb'] = kicad_pcb
+        if 'bom' in entry:
+            job['bom'] = os.path.join(base_dir, entry['bom'])
+        else:
+            job['bom'] = os.path.splitext(kicad_pcb)[0] + '.csv'
+        if 'output_dir' in entry:
+            job['output_dir'] = os.path.join(base_dir, entry['output_dir'])
+        else:
+            job['output_dir'] = os.path.join(board_dir, output_assembly.defaults['output_dir'])
+        job['include_th'] = entry.get('include_th', None)
+        jobs.append(job)
+    return jobs
+
+
+def run_job(job):
+    """Generate the outputs of a job, the errors are returned in the result."""
+
+    ret = {}
+    ret['index'] = job['index']
+    ret['name'] = job['name']
+    ret['output_dir'] = job['output_dir']
+    ret['error'] = None
+    ret['bom_summary'] = None
+    ret['timing'] = None
+
+    t = time.time()
+    profiler = profiling.Profiler()
+    log = StringIO()
+    # build_part_db prints the missing fields
+    stdout = sys.stdout
+    sys.stdout = log
+    try:
+        if os.path.exists(job['output_dir']):
+            if job['overwrite']:
+                shutil.rmtree(job['output_dir'])
+            else:
+                raise Exception('Directory %s exists. Please specify another location or the overwrite flag.'%job['output_dir'])
+
+        with profiler.Span('load board'):
+            board, snapshot = output_assembly.snapshot_cache.LoadSnapshot(job['kicad_pcb'], ['footprints'],
+                    job['no_pcbnew'], job['no_cache'], job['cache_dir'], output_log=log)
+
+        ret_oa = output_assembly.OutputAssembly(
+                board = board,
+                output_dir = job['output_dir'],
+                overwrite = job['overwrite'],
+                bom_fname = job['bom'],
+                include_th = job['include_th'],
+                dump_part_db = job['debug_db'],
+                snapshot = snapshot,
+                output_log = log,
+                profiler = profiler
+                )
+        for w in ret_oa['warn']:
+            log.write(w + '\n')
+        # plain dict for the json report
+        ret['bom_summary'] = dict(ret_oa['bom_summary'])
+    except Exception:
+        ret['error'] = traceback.format_exc()
+    finally:
+        sys.stdout = stdout
+
+    ret['time'] = time.time() - t
+    # time of the stages (see profiling.py)
+    ret['timing'] = profiler.Report()
+    ret['log'] = log.getvalue()
+    return ret
+
+
+def bom_counts(result):
+    summary = result['bom_summary']
+    return [summary['Unique Part Count'], summary['Total Placements'], summary['Through Hole Placement']]
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Script for generating the assembly outputs of several Kicad projects')
+    parser.add_argument('manifest',
+            help="JSON file with the list of jobs (kicad_pcb, bom, output_dir, include_th)")
+    parser.add_argument('-o', '--overwrite', action='store_true',
+            help="Overwrite the output directories")
+    parser.add_argument('-t', '--include_th', action='store_true',
+            help="Include through hole components in the generated boms (for the jobs that do not set it)")
+    parser.add_argument('-d', '--debug_db', action='store_true',
+            help="Dump the part databases (Parts.db directories, see part_db.py)")
+    parser.add_argument('--no_pcbnew', action='store_true',
+            help="Read the board files directly instead of loading them with pcbnew")
+    parser.add_argument('--no_cache', action='store_true',
+            help="Do not use the board data cache")
+    parser.add_argument('--cache_dir', default=None,
+            help="Board data cache directory (default = %s next to each board)"%output_assembly.snapshot_cache.CACHE_DIR)
+    batch_runner.AddArguments(parser,
+            report_help="Write the results of the jobs (with the time of the stages of each job) to this JSON file")
+
+    args = parser.parse_args()
+
+    jobs = load_manifest(args.manifest)
+    for job in jobs:
+        if job['include_th'] == None:
+            job['include_th'] = args.include_th
+        job['overwrite'] = args.overwrite
+        job['debug_db'] = args.debug_db
+        job['no_pcbnew'] = args.no_pcbnew
+        job['no_cache'] = args.no_cache
+        job['cache_dir'] = args.cache_dir
+
+    return batch_runner.Run(run_job, jobs, args, ['Unique parts', 'Placements', 'TH'], bom_counts)
+
+
+if __name__=='__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+#!/usr/bin/env python2
+
+# Columnar storage of the part database
+#
+# The part table built by output_assembly.build_part_db is stored in a
+# directory with one numpy file per column and a schema.json file with the
+# column names and types. The numeric and boolean columns keep their types
+# and can be memory mapped, text columns are stored as the list of their
+# distinct values with the index of the value of each part. A stored table
+# can be reloaded without the board, e.g. for comparing two revisions or
+# generating the BOM again:
+#   > python plugin_output_assembly/part_db.py OUTPUT_ASSEMBLY/Parts.db --bom BOM.csv
+
+import sys
+import os
+import re
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+__version__ = '0.1'
+
+PART_DB_VERSION = 1
+SCHEMA_FNAME = 'schema.json'
+
+
+def column_kind(series):
+    """Storage of a column: 'array' for numbers and booleans, 'str' for text, 'object' for the other ones."""
+
+    if series.dtype.kind in 'biuf':
+        return 'array'
+    if pd.api.types.infer_dtype(series, skipna=True) in ['string', 'unicode', 'empty']:
+        return 'str'
+    return 'object'
+
+
+def save_part_db(parts, dir_name):
+    """Store the part table in the directory dir_name (created if needed)."""
+
+    if not os.path.isdir(dir_name):
+        os.makedirs(dir_name)
+
+    columns = []
+    for i, name in enumerate(parts.columns):
+        series = parts[name]
+        column = {}
+        column['name'] = name
+        column['kind'] = column_kind(series)
+        column['file'] = '%02d_%s.npy'%(i, re.sub('[^A-Za-z0-9_]', '_', name))
+        fname = os.path.join(dir_name, column['file'])
+        if column['kind'] == 'array':
+            np.save(fname, series.values)
+        elif column['kind'] == 'str':
+            # the values are repeated (footprints, manufacturers, ...), they
+            # are stored once with the index of the value of each part,
+            # -1 for the null values
+            codes, uniques = pd.factorize(series)
+            column['values_file'] = column['file'].replace('.npy', '.values.npy')
+            np.save(fname, codes.astype(np.int32))
+            np.save(os.path.join(dir_name, column['values_file']), np.array(list(uniques), dtype='U'))
+        else:
+            np.save(fname, series.values.astype(object), allow_pickle=True)
+        columns.append(column)
+
+    schema = {}
+    schema['version'] = PART_DB_VERSION
+    schema['rows'] = len(parts)
+    schema['columns'] = columns
+    # written last, a directory without schema is not a valid database
+    with open(os.path.join(dir_name, SCHEMA_FNAME), 'w') as f:
+        json.dump(schema, f, indent=1)
+
+
+def load_schema(dir_name):
+    with open(os.path.join(dir_name, SCHEMA_FNAME)) as f:
+        schema = json.load(f)
+    if schema.get('version') != PART_DB_VERSION:
+        raise Exception('Error: Unsupported part database version %s in %s'%(schema.get('version'), dir_name))
+    return schema
+
+
+def load_part_db(dir_name, columns=None, mmap=False):
+    """Load a part table stored by save_part_db().
+
+    columns is the list of columns to load (all if None). With mmap the
+    numeric and boolean columns are memory mapped instead of read.
+    """
+
+    schema = load_schema(dir_name)
+    mmap_mode = 'r' if mmap else None
+
+    data = {}
+    names = []
+    for column in schema['columns']:
+        name = column['name']
+        if columns != None and name not in columns:
+            continue
+        fname = os.path.join(dir_name, column['file'])
+        if column['kind'] == 'array':
+            values = np.load(fname, mmap_mode=mmap_mode)
+        elif column['kind'] == 'str':
+            uniques = np.load(os.path.join(dir_name, column['values_file'])).astype(object)
+            # index -1 is the None added at the end
+            values = np.append(uniques, None).take(np.load(fname, mmap_mode=mmap_mode))
+        else:
+            values = np.load(fname, allow_pickle=True)
+        data[name] = pd.Series(values, copy=False)
+        names.append(name)
+
+    if columns != None:
+        missing = [name for name in columns if name not in names]
+        if missing:
+            raise Exception('Error: Missing columns in %s: %s'%(dir_name, ', '.join(missing)))
+        names = list(columns)
+
+    return pd.DataFrame(data, columns=names, index=pd.RangeIndex(schema['rows']), copy=False)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Show, convert or generate the BOM of a stored part database')
+    parser.add_argument('part_db',
+            help="Part database directory (Parts.db in the assembly output directory)")
+    parser.add_argument('--csv', default=None,
+            help="Write the part table to this csv file")
+    parser.add_argument('--bom', default=None,
+            help="Write the BOM to this file")
+    parser.add_argument('-t', '--include_th', action='store_true',
+            help="Include through hole components in the generated bom")
+    args = parser.parse_args()
+
+    parts = load_part_db(args.part_db)
+    print('%d parts'%len(parts))
+    for name, dtype in parts.dtypes.items():
+        print('  %-20s %s'%(name, dtype))
+
+    if args.csv != None:
+        parts.to_csv(args.csv)
+
+    if args.bom != None:
+        import output_assembly
+        with open(args.bom, 'w') as f:
+            output_assembly.write_bom_data(f, parts, args.include_th)
+
+
+if __name__=='__main__':
+    sys.exit(main())
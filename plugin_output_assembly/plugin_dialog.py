@@ -2,12 +2,12 @@
 import os
 import shutil
 import wx
-import traceback
 import output_assembly
+import plugin_worker
 import pcbnew
 
 
-class MainPluginDialog(wx.Dialog):
+class MainPluginDialog(plugin_worker.WorkerDialog, wx.Dialog):
 
     def __init__(self, board):
 
@@ -58,19 +58,14 @@ class MainPluginDialog(wx.Dialog):
         pars_sizer.Add(static_text, flag = label_flags, border = spacing)
         self.dump_db_ctrl = wx.CheckBox(self)
         self.dump_db_ctrl.SetValue(False)
-        tt = wx.ToolTip('Dump all part information in csv format')
+        tt = wx.ToolTip('Dump all part information in the Parts.db directory (see part_db.py)')
         self.dump_db_ctrl.SetToolTip(tt)
         pars_sizer.Add(self.dump_db_ctrl, flag = ctrl_flags, border = spacing)
 
         main_sizer.Add(pars_sizer, 0, wx.ALIGN_CENTER_VERTICAL|wx.ALL|wx.EXPAND, spacing )
 
-        button_sizer = wx.BoxSizer(wx.HORIZONTAL)
-        self.but_run = wx.Button(self, label = "Run")
-        button_sizer.Add(self.but_run, border = spacing)
-        self.but_dismiss = wx.Button(self, label = "Dismiss")
-        button_sizer.Add(self.but_dismiss, border = spacing)
-
-        main_sizer.Add(button_sizer, 0, flag = wx.ALL|wx.CENTER, border = spacing)
+        # run in background (see plugin_worker.py)
+        self.AddRunControls(main_sizer, spacing)
 
         self.output_log_ctrl = wx.TextCtrl(self, style=wx.TE_MULTILINE|wx.TE_READONLY|wx.TE_DONTWRAP, size=(500,300))
 
@@ -81,15 +76,7 @@ class MainPluginDialog(wx.Dialog):
 	main_sizer.Fit(self)
 	self.Centre(wx.BOTH)
 
-        self.Bind(wx.EVT_CLOSE, self.onCloseWindow)
-	self.but_dismiss.Bind(wx.EVT_BUTTON, self.onCloseWindow)
-	self.but_run.Bind(wx.EVT_BUTTON, self.onRun)
-
 
-    def onCloseWindow(self, event):
-        self.Destroy()
-
-    
     def onRun(self, event):
         
         overwrite = self.output_dir_overwrite_ctrl.IsChecked()
@@ -103,28 +90,15 @@ class MainPluginDialog(wx.Dialog):
                 wx.MessageBox("Output directory exists. Specify another directory or check the overwrite box.")
                 return
 
-        try:
-            ret = output_assembly.OutputAssembly(
-                    board = self.board,
-                    output_dir = output_dir, 
-                    overwrite = overwrite,
-                    bom_fname = self.bom_fname_ctrl.GetValue(),
-                    include_th = self.include_th_ctrl.IsChecked(),
-                    dump_part_db = dump_db,
-                    output_log = self.output_log_ctrl
-                    )
-        except Exception:
-            self.output_log_ctrl.write(traceback.format_exc())
-            wx.MessageBox("An exception has occured. Please check the output log")
-            return
-                
-        message = ""
-        message += "Done"
-        message += '\n\n'
-        for warn in ret['warn']:
-            message += warn 
-            message += '\n'
-        self.output_log_ctrl.write(message)
+        self.StartWorker(output_assembly.OutputAssembly, dict(
+                board = self.board,
+                output_dir = output_dir,
+                overwrite = overwrite,
+                bom_fname = self.bom_fname_ctrl.GetValue(),
+                include_th = self.include_th_ctrl.IsChecked(),
+                dump_part_db = dump_db,
+                ))
+
 
         
 def InitMainDialog(board):
@@ -0,0 +1,189 @@
+#!/usr/bin/env python2
+
+# Cache of the plotted fab layers
+#
+# The key of a layer is the hash of the parts of the board file that can
+# change its plot: the top level sections with items on the layer (or on the
+# layers it depends on), the sections without layers (setup, nets, ...), the
+# file header with the Kicad version and the plot options. When a board is
+# plotted again after a change, the layers with the same key are copied from
+# the cache instead of being plotted.
+
+import os
+import re
+import json
+import shutil
+import hashlib
+
+import kicad_pcb
+import snapshot_cache
+
+# change when the plot options, the key computation or the entry format change
+FAB_CACHE_VERSION = 2
+
+CACHE_DIR = '.fab_cache'
+CACHE_EXT = '.plot'
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024
+
+# sections not used for the plot of any layer (item counts, page and title block)
+IGNORED_SECTIONS = ['general', 'page', 'title_block', 'net_class']
+
+LAYER_TOKEN_RE = re.compile(br'\(layers? ((?:[^()"]|"[^"]*")+)\)')
+LAYER_NAME_RE = re.compile(br'"[^"]*"|[^\s"]+')
+
+COPPER_LAYERS = range(0, 32)
+F_Cu = 0
+B_Cu = 31
+
+
+def SectionLayers(raw):
+    """Names of the layers used in a section (as written in the file, including wildcards)."""
+
+    ret = set()
+    for m in LAYER_TOKEN_RE.finditer(raw):
+        for name in LAYER_NAME_RE.findall(m.group(1)):
+            ret.add(name.strip(b'"').decode('utf-8'))
+    return ret
+
+
+def LayerTokens(layer_id, layer_name):
+    """Layer names that match a layer, including the wildcards."""
+
+    ret = set([layer_name])
+    if layer_id in COPPER_LAYERS:
+        ret.add('*.Cu')
+        if layer_id in [F_Cu, B_Cu]:
+            ret.add('F&B.Cu')
+    elif '.' in layer_name:
+        ret.add('*.' + layer_name.split('.', 1)[1])
+    return ret
+
+
+class FabCache(object):
+    """Plotted layers of a board, keyed by the content of the board file.
+
+    The key is computed only from the board file, so the board must not
+    have unsaved changes (i.e. it was loaded from the file).
+    """
+
+    def __init__(self, board_fname, cache_dir=None, max_size=DEFAULT_MAX_SIZE):
+        if cache_dir == None:
+            cache_dir = os.path.join(os.path.dirname(os.path.abspath(board_fname)), CACHE_DIR)
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.board_fname = board_fname
+        self.hits = 0
+        self.misses = 0
+        self.time_saved = 0.0
+
+        self.index = kicad_pcb.BoardIndex(board_fname)
+        # index of the layers section, the layer names used by the items are
+        # the ones of the board (copper layers can be renamed)
+        self.layer_names = {}
+        self.section_layers = []
+        if not self.index.IsValid():
+            return
+        for i, name in enumerate(self.index.Names()):
+            if name == 'layers':
+                for layer in self.index.Parse(i)[1:]:
+                    self.layer_names[int(layer[0])] = layer[1]
+            if name in IGNORED_SECTIONS:
+                self.section_layers.append(None)
+            else:
+                self.section_layers.append(SectionLayers(self.index.Raw(i)))
+
+    def IsValid(self):
+        return bool(self.section_layers)
+
+    def LayerKey(self, layer_id, dependencies, options):
+        """Key of the plot of a layer.
+
+        dependencies are the ids of the other layers that change the plot
+        (e.g. the mask layer for a silk layer with the mask subtracted),
+        options is a string with the plot options.
+        """
+
+        tokens = set()
+        uses_vias = False
+        for l in [layer_id] + list(dependencies):
+            name = self.layer_names.get(l, '')
+            tokens.update(LayerTokens(l, name))
+            # vias can be plotted on the mask layers (setup option)
+            if l in COPPER_LAYERS or name.endswith('.Mask'):
+                uses_vias = True
+
+        h = hashlib.sha1()
+        h.update(('%d\n%s\n%s\n'%(FAB_CACHE_VERSION, options, os.path.basename(self.board_fname))).encode('utf-8'))
+        # file header with the file version and the Kicad version
+        h.update(self.index.data[:self.index.sections[0][1]])
+        for i, (name, start, end) in enumerate(self.index.sections):
+            layers = self.section_layers[i]
+            if layers == None:
+                continue
+            # sections without layers (setup, layers, nets) are used for
+            # all the layers, all the vias are used since blind vias list
+            # only the first and last layer
+            if (not layers) or (layers & tokens) or (uses_vias and name == 'via'):
+                h.update(self.index.data[start:end])
+        return h.hexdigest()
+
+    def EntryPath(self, key):
+        return os.path.join(self.cache_dir, key + CACHE_EXT)
+
+    def Get(self, key, dir_name):
+        """Copy a cached plot in dir_name, return the file name or None if not cached.
+
+        A damaged entry (e.g. truncated by a full disk) is removed and
+        counted as a miss.
+        """
+
+        entry_fname = self.EntryPath(key)
+        try:
+            f = open(entry_fname, 'rb')
+        except IOError:
+            self.misses += 1
+            return None
+        with f:
+            try:
+                # first line is the entry info, then the plot file
+                info = json.loads(f.readline().decode('utf-8'))
+                fname = os.path.join(dir_name, info['name'])
+                if os.fstat(f.fileno()).st_size - f.tell() != info['size']:
+                    raise ValueError('Wrong plot file size')
+            except (ValueError, KeyError, TypeError):
+                info = None
+            if info != None:
+                with open(fname, 'wb') as out:
+                    shutil.copyfileobj(f, out)
+        if info == None:
+            try:
+                os.remove(entry_fname)
+            except OSError:
+                pass
+            self.misses += 1
+            return None
+        os.utime(entry_fname, None)
+        self.hits += 1
+        self.time_saved += info['plot_time']
+        return fname
+
+    def Put(self, key, fname, plot_time):
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        entry_fname = self.EntryPath(key)
+        tmp_fname = '%s.%d.tmp'%(entry_fname, os.getpid())
+        info = {'name' : os.path.basename(fname), 'plot_time' : plot_time, 'size' : os.path.getsize(fname)}
+        with open(tmp_fname, 'wb') as out:
+            out.write((json.dumps(info) + '\n').encode('utf-8'))
+            with open(fname, 'rb') as f:
+                shutil.copyfileobj(f, out)
+        if os.path.exists(entry_fname):
+            os.remove(entry_fname)
+        os.rename(tmp_fname, entry_fname)
+
+    def Close(self):
+        self.index.Close()
+        snapshot_cache.Evict(self.cache_dir, self.max_size, CACHE_EXT)
+
+    def Report(self):
+        return 'Fab layer cache: %d hits, %d misses, %.1f s saved'%(self.hits, self.misses, self.time_saved)
@@ -3,41 +3,30 @@
 import sys
 import os
 import shutil
+import collections
 import argparse
-import subprocess
+import multiprocessing
+import zipfile
+import zlib
+import hashlib
+import time
 import pcbnew
 
+# shared modules are in the parent directory
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import fab_cache
+import profiling
+
 __version__ = '0.1'
 
 debug = False
 
 defaults = {
         'output_dir' : 'OUTPUT_FAB',
+        'zip_level' : 6,
         }
 
-def OutputFab(
-        board=None, 
-        output_dir=defaults['output_dir'], 
-        overwrite=False, 
-        protel_ext=False,
-        output_log = sys.stdout
-        ):
-
-    ret = {}
-    ret['warn'] = []
-
-    if board == None:
-        board = pcbnew.GetBoard()
-    if not board:
-        raise Exception('Error: Invalid board')
-
-    os.makedirs(output_dir)
-
-    out_file_prefix = os.path.splitext(os.path.basename(board.GetFileName()))[0]
-
-    # TODO run DRC
-
-    pctl = pcbnew.PLOT_CONTROLLER(board)
+def SetPlotOptions(pctl, output_dir, protel_ext):
     popt = pctl.GetPlotOptions()
     popt.SetOutputDirectory(output_dir)
 
@@ -55,7 +44,10 @@ def OutputFab(
 
     popt.SetSubtractMaskFromSilk(True)
     popt.SetDrillMarksType(pcbnew.PCB_PLOT_PARAMS.NO_DRILL_SHAPE)
+    return popt
 
+
+def GetPlotPlan(board):
     plot_plan = [
         # fname_suffix     layer_id             comment
         ( "CuTop",         pcbnew.F_Cu,         "Top layer" ),
@@ -74,61 +66,311 @@ def OutputFab(
         layer_name = "Int%d"%inner_layer
         plot_plan.append((layer_name ,inner_layer, "Layer %s"%layer_name))
 
-    # now do the plot
-    for layer_info in plot_plan:
-        pctl.SetLayer(layer_info[1])
-        pctl.OpenPlotfile(layer_info[0], pcbnew.PLOT_FORMAT_GERBER, layer_info[2])
-        output_log.write('Ploting %s\n' % pctl.GetPlotFileName())
-        if pctl.PlotLayer() == False:
-            raise Exception("Plot error")
-
-    # Plot the FAB notes and drill legend
-    popt.SetUseAuxOrigin(False)
-    # Color plotting does not work from the python interface 
-    # Might need to export each layer separatelly and combine them with external tools 
-    pctl.SetColorMode(True)
-    pctl.OpenPlotfile("FabDrawing", pcbnew.PLOT_FORMAT_PDF, "Fab Drawing")
-    output_log.write('Ploting %s\n'%pctl.GetPlotFileName())
-    #popt.SetColor(pcbnew.GREEN)  # kicad 4.0
-    #popt.SetColor(pcbnew.COLOR4D(0.050, 0.050, 0.050, 0.1)) # kicad 5.0
-    pctl.SetLayer(pcbnew.Edge_Cuts)
-    pctl.PlotLayer()
-    pctl.SetLayer(pcbnew.Cmts_User)
-    pctl.PlotLayer()
-    pctl.SetLayer(pcbnew.Eco1_User)
-    pctl.PlotLayer()
-    
-    # Generate drill files
-    mirror = False
-    minimalHeader = False
-    offset = board.GetAuxOrigin()
-    mergeNPTH = True
+    return plot_plan
+
+
+# Other layers that change the plot of a layer (the mask is subtracted from the silk)
+PLOT_DEPENDENCIES = {
+        pcbnew.F_SilkS : [pcbnew.F_Mask],
+        pcbnew.B_SilkS : [pcbnew.B_Mask],
+        }
+
+
+def PlotOptionsKey(protel_ext, layer_info):
+    # the options set by SetPlotOptions() are covered by fab_cache.FAB_CACHE_VERSION
+    version = pcbnew.GetBuildVersion() if hasattr(pcbnew, 'GetBuildVersion') else ''
+    return '%s %s %d %s %s'%(version, protel_ext, layer_info[1], layer_info[0], layer_info[2])
+
+
+def GetPlotDir(board, output_dir):
+    # pcbnew plots in the output directory relative to the board file
+    if os.path.isabs(output_dir):
+        return output_dir
+    return os.path.join(os.path.dirname(os.path.abspath(board.GetFileName())), output_dir)
+
+
+def PlotLayer(pctl, layer_info):
+    pctl.SetLayer(layer_info[1])
+    pctl.OpenPlotfile(layer_info[0], pcbnew.PLOT_FORMAT_GERBER, layer_info[2])
+    if pctl.PlotLayer() == False:
+        raise Exception("Plot error")
+    return pctl.GetPlotFileName()
+
 
-    drlwriter = pcbnew.EXCELLON_WRITER( board )
-    drlwriter.SetOptions( mirror, minimalHeader, offset, mergeNPTH )
-    drlwriter.SetMapFileFormat( pcbnew.PLOT_FORMAT_PDF )
+class FabPackage(object):
+    """Zip archive of the fab outputs, each file is added as soon as it is done.
 
-    metricFmt = True
-    drlwriter.SetFormat( metricFmt )
+    The zip file is created in the directory of the first file added, the
+    plot directory is known only when the first plot file is opened.
+    Add() returns the manifest entry of the file (size, compressed size,
+    crc32 and sha1). The compression level is used only on python >= 3.7,
+    older versions use the zlib default.
+    """
 
-    genDrl = True
-    genMap = True
-    output_log.write('Create drill and map files\n')
-    drlwriter.CreateDrillandMapFilesSet( pctl.GetPlotDirName(), genDrl, genMap );
+    def __init__(self, zip_name, level=defaults['zip_level']):
+        self.zip_name = zip_name
+        self.level = level
+        self.fname = None
+        self.zip = None
+        self.manifest = []
+
+    def Open(self, dir_name):
+        self.fname = os.path.join(dir_name, self.zip_name)
+        compression = zipfile.ZIP_DEFLATED if self.level > 0 else zipfile.ZIP_STORED
+        if sys.version_info >= (3, 7):
+            self.zip = zipfile.ZipFile(self.fname, 'w', compression, compresslevel=self.level)
+        else:
+            self.zip = zipfile.ZipFile(self.fname, 'w', compression)
+
+    def Add(self, fname):
+        if self.zip == None:
+            self.Open(os.path.dirname(fname))
+        # the file was just written, read it once for the archive and the checksums
+        with open(fname, 'rb') as f:
+            data = f.read()
+        name = os.path.basename(fname)
+        self.zip.writestr(name, data)
+        info = self.zip.getinfo(name)
+        entry = collections.OrderedDict([
+                ('name',            name),
+                ('size',            len(data)),
+                ('compressed_size', info.compress_size),
+                ('crc32',           '%08x'%(zlib.crc32(data) & 0xffffffff)),
+                ('sha1',            hashlib.sha1(data).hexdigest()),
+                ])
+        self.manifest.append(entry)
+        return entry
+
+    def Close(self):
+        if self.zip != None:
+            self.zip.close()
+        return self.manifest
+
+
+# Board and plot controller of the plot worker processes
+_worker = {}
+
+def _PlotWorkerInit(board_fname, output_dir, protel_ext):
+    # each worker loads its own copy of the board
+    board = pcbnew.LoadBoard(board_fname)
+    pctl = pcbnew.PLOT_CONTROLLER(board)
+    SetPlotOptions(pctl, output_dir, protel_ext)
+    # the plot controller does not own the board, keep a reference
+    _worker['board'] = board
+    _worker['pctl'] = pctl
 
-    report_filename = pctl.GetPlotDirName() + out_file_prefix +'_DrillReport.rpt'
-    output_log.write('Create drill report in %s\n'%report_filename)
-    drlwriter.GenDrillReportFile( report_filename );
 
+def PlotAndClose(pctl, layer_info):
+    t = time.time()
+    fname = PlotLayer(pctl, layer_info)
+    # flush the file before reporting it as done
     pctl.ClosePlot()
+    return fname, time.time() - t
+
+
+def _PlotWorker(layer_info):
+    return PlotAndClose(_worker['pctl'], layer_info)
+
+
+def OutputFab(
+        board=None, 
+        output_dir=defaults['output_dir'], 
+        overwrite=False, 
+        protel_ext=False,
+        jobs=1,
+        zip_level=defaults['zip_level'],
+        use_cache=False,
+        cache_dir=None,
+        output_log = sys.stdout,
+        progress = None,
+        run_in_ui = None,
+        profiler = None
+        ):
+    """Generate the fabrication outputs.
+
+    With jobs > 1 the gerber layers are plotted by a pool of processes, each
+    one loading the board from its file. The board must be saved, so this is
+    used only from the command line.
+
+    The gerbers, the fab drawing and the drill file are packed in a zip file
+    while they are generated, ret['manifest'] lists the packed files.
+
+    With use_cache the gerbers of the layers not changed since a previous
+    run are copied from the cache (see fab_cache.py). The cache is keyed by
+    the content of the board file, so it is used only from the command line.
+
+    progress(step, step_count, stage) is called before each stage and the
+    board is read and plotted through run_in_ui(func, *args) (see
+    plugin_worker.py). The time of the stages is recorded in profiler (see
+    profiling.py), the plot time of each layer in the 'plot <layer>' spans.
+    """
 
-    output_log.write('Create zip file')
-    os.chdir(pctl.GetPlotDirName())
-    cmd = 'zip -j {0}.zip {0}*.g?? {0}*.g? {0}-FabDrawing.pdf {0}.drl '.format(out_file_prefix)
-    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-    stdout, stderr = p.communicate()
-    output_log.write(stdout)
-    output_log.write(stderr)
+    ret = {}
+    ret['warn'] = []
+
+    if profiler == None:
+        profiler = profiling.NullProfiler()
+    if run_in_ui == None:
+        run_in_ui = lambda func, *args: func(*args)
+
+    if board == None:
+        board = pcbnew.GetBoard()
+    if not board:
+        raise Exception('Error: Invalid board')
+
+    os.makedirs(output_dir)
+
+    # TODO run DRC
+
+    def setup_plot():
+        pctl = pcbnew.PLOT_CONTROLLER(board)
+        popt = SetPlotOptions(pctl, output_dir, protel_ext)
+        return board.GetFileName(), GetPlotDir(board, output_dir), pctl, popt, GetPlotPlan(board)
+
+    board_fname, plot_dir, pctl, popt, plot_plan = run_in_ui(setup_plot)
+    out_file_prefix = os.path.splitext(os.path.basename(board_fname))[0]
+
+    stages = ['Plotting %s'%layer_info[2] for layer_info in plot_plan] + ['Plotting fab drawing', 'Creating drill files']
+    def report_progress(stage):
+        if progress != None:
+            progress(stages.index(stage), len(stages), stage)
+
+    package = FabPackage(out_file_prefix + '.zip', zip_level)
+
+    cache = None
+    # the pool and the zip file are not left open if a stage fails
+    pool = None
+    try:
+        if use_cache:
+            cache = fab_cache.FabCache(board_fname, cache_dir)
+            if not cache.IsValid():
+                ret['warn'].append('Fab layer cache not used, the board file does not have the Kicad layout')
+                cache.Close()
+                cache = None
+
+        # copy the layers found in the cache, the other ones are plotted
+        cache_keys = [None] * len(plot_plan)
+        cached_fnames = [None] * len(plot_plan)
+        if cache != None:
+            if not os.path.isdir(plot_dir):
+                os.makedirs(plot_dir)
+            with profiler.Span('cache lookup'):
+                for i, layer_info in enumerate(plot_plan):
+                    cache_keys[i] = cache.LayerKey(layer_info[1], PLOT_DEPENDENCIES.get(layer_info[1], []), PlotOptionsKey(protel_ext, layer_info))
+                    cached_fnames[i] = cache.Get(cache_keys[i], plot_dir)
+        layers_to_plot = [layer_info for i, layer_info in enumerate(plot_plan) if cached_fnames[i] == None]
+
+        def AddLayer(i, fname, plot_time):
+            if cached_fnames[i] != None:
+                output_log.write('Using cached %s\n' % fname)
+            else:
+                output_log.write('Ploting %s\n' % fname)
+                # timed here for the layers plotted by the pool too
+                profiler.AddTime('plot %s'%plot_plan[i][0], plot_time)
+                if cache != None:
+                    cache.Put(cache_keys[i], fname, plot_time)
+            with profiler.Span('zip'):
+                package.Add(fname)
+
+        # now do the plot
+        if jobs > 1 and layers_to_plot:
+            pool = multiprocessing.Pool(jobs, _PlotWorkerInit, (board_fname, output_dir, protel_ext))
+            # results are returned in plot plan order, they are collected after
+            # the plots done by this process
+            plot_results = pool.imap(_PlotWorker, layers_to_plot)
+        else:
+            for i, layer_info in enumerate(plot_plan):
+                if cached_fnames[i] != None:
+                    AddLayer(i, cached_fnames[i], 0)
+                    continue
+                report_progress('Plotting %s'%layer_info[2])
+                fname, plot_time = run_in_ui(PlotAndClose, pctl, layer_info)
+                AddLayer(i, fname, plot_time)
+
+        # Plot the FAB notes and drill legend
+        def plot_fab_drawing():
+            popt.SetUseAuxOrigin(False)
+            # Color plotting does not work from the python interface 
+            # Might need to export each layer separatelly and combine them with external tools 
+            pctl.SetColorMode(True)
+            pctl.OpenPlotfile("FabDrawing", pcbnew.PLOT_FORMAT_PDF, "Fab Drawing")
+            output_log.write('Ploting %s\n'%pctl.GetPlotFileName())
+            #popt.SetColor(pcbnew.GREEN)  # kicad 4.0
+            #popt.SetColor(pcbnew.COLOR4D(0.050, 0.050, 0.050, 0.1)) # kicad 5.0
+            pctl.SetLayer(pcbnew.Edge_Cuts)
+            pctl.PlotLayer()
+            pctl.SetLayer(pcbnew.Cmts_User)
+            pctl.PlotLayer()
+            pctl.SetLayer(pcbnew.Eco1_User)
+            pctl.PlotLayer()
+            fab_drawing_fname = pctl.GetPlotFileName()
+            pctl.ClosePlot()
+            return fab_drawing_fname
+
+        report_progress('Plotting fab drawing')
+        with profiler.Span('fab drawing'):
+            fab_drawing_fname = run_in_ui(plot_fab_drawing)
+
+        if pool != None:
+            # the gerbers go first in the zip file, as in the serial path
+            for i, layer_info in enumerate(plot_plan):
+                if cached_fnames[i] != None:
+                    AddLayer(i, cached_fnames[i], 0)
+                else:
+                    fname, plot_time = next(plot_results)
+                    AddLayer(i, fname, plot_time)
+            pool.close()
+            pool.join()
+        with profiler.Span('zip'):
+            package.Add(fab_drawing_fname)
+    
+        # Generate drill files
+        def write_drill_files():
+            mirror = False
+            minimalHeader = False
+            offset = board.GetAuxOrigin()
+            mergeNPTH = True
+
+            drlwriter = pcbnew.EXCELLON_WRITER( board )
+            drlwriter.SetOptions( mirror, minimalHeader, offset, mergeNPTH )
+            drlwriter.SetMapFileFormat( pcbnew.PLOT_FORMAT_PDF )
+
+            metricFmt = True
+            drlwriter.SetFormat( metricFmt )
+
+            genDrl = True
+            genMap = True
+            output_log.write('Create drill and map files\n')
+            drlwriter.CreateDrillandMapFilesSet( pctl.GetPlotDirName(), genDrl, genMap );
+
+            report_filename = pctl.GetPlotDirName() + out_file_prefix +'_DrillReport.rpt'
+            output_log.write('Create drill report in %s\n'%report_filename)
+            drlwriter.GenDrillReportFile( report_filename );
+            return pctl.GetPlotDirName()
+
+        report_progress('Creating drill files')
+        with profiler.Span('drill files'):
+            plot_dir_name = run_in_ui(write_drill_files)
+
+        with profiler.Span('zip'):
+            package.Add(plot_dir_name + out_file_prefix + '.drl')
+            ret['manifest'] = package.Close()
+    except BaseException:
+        if pool != None:
+            pool.terminate()
+            pool.join()
+        package.Close()
+        if cache != None:
+            cache.Close()
+        raise
+    output_log.write('Created zip file %s\n'%package.fname)
+
+    if cache != None:
+        cache.Close()
+        output_log.write(cache.Report() + '\n')
+        ret['cache'] = {'hits' : cache.hits, 'misses' : cache.misses, 'time_saved' : cache.time_saved}
+    for entry in ret['manifest']:
+        output_log.write('  %-40s %10d %10d  %s\n'%(entry['name'], entry['size'], entry['compressed_size'], entry['sha1']))
 
     # TODO IPC-D-356 (it's not exposed in the python interface)
     ret['warn'].append('Please create manually the IPC-D-356 file from the File->Fabrication Outputs menu')
@@ -147,6 +389,18 @@ def main():
             help="Overwrite output directory")
     parser.add_argument('-p', '--protel', action='store_true',
             help="Use Protel file extensions")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+            help="Number of processes used for plotting the gerber layers (default = %(default)s)")
+    parser.add_argument('-z', '--zip_level', type=int, default=defaults['zip_level'], choices=range(10),
+            help="Compression level of the zip file, 0 for no compression (default = %(default)s)")
+    parser.add_argument('--no_cache', action='store_true',
+            help="Plot all the layers instead of reusing the unchanged ones from the fab layer cache")
+    parser.add_argument('--cache_dir', default=None,
+            help="Fab layer cache directory (default = %s next to the board)"%fab_cache.CACHE_DIR)
+    parser.add_argument('--timing_report', default=None,
+            help="Write the time of each stage to this JSON file (see profiling.py)")
+    parser.add_argument('--profile', default=None,
+            help="Write a cProfile dump of the output generation to this file")
 
     args = parser.parse_args()
 
@@ -158,19 +412,31 @@ def main():
             return
 
 
-    board = pcbnew.LoadBoard(args.kicad_pcb)
+    profiler = profiling.Profiler()
 
-    ret = OutputFab(
+    with profiler.Span('load board'):
+        board = pcbnew.LoadBoard(args.kicad_pcb)
+
+    ret = profiling.Call(args.profile, OutputFab,
             board = board,
             output_dir = args.output_dir,
             overwrite = args.overwrite,
-            protel_ext = args.protel
+            protel_ext = args.protel,
+            jobs = args.jobs,
+            zip_level = args.zip_level,
+            use_cache = not args.no_cache,
+            cache_dir = args.cache_dir,
+            profiler = profiler
             )
 
     print("Done\n")
     for w in ret['warn']:
         print(w)
 
+    if args.timing_report != None:
+        sys.stdout.write(profiler.Format())
+        profiler.WriteReport(args.timing_report)
+
 
 if __name__=='__main__':
     sys.exit(main())
@@ -2,12 +2,12 @@
 import os
 import shutil
 import wx
-import traceback
 import output_fab
+import plugin_worker
 import pcbnew
 
 
-class MainPluginDialog(wx.Dialog):
+class MainPluginDialog(plugin_worker.WorkerDialog, wx.Dialog):
 
     def __init__(self, board):
 
@@ -45,13 +45,8 @@ class MainPluginDialog(wx.Dialog):
 
         main_sizer.Add(pars_sizer, 0, wx.ALIGN_CENTER_VERTICAL|wx.ALL|wx.EXPAND, spacing )
 
-        button_sizer = wx.BoxSizer(wx.HORIZONTAL)
-        self.but_run = wx.Button(self, label = "Run")
-        button_sizer.Add(self.but_run, border = spacing)
-        self.but_dismiss = wx.Button(self, label = "Dismiss")
-        button_sizer.Add(self.but_dismiss, border = spacing)
-
-        main_sizer.Add(button_sizer, 0, flag = wx.ALL|wx.CENTER, border = spacing)
+        # run in background (see plugin_worker.py)
+        self.AddRunControls(main_sizer, spacing)
 
         self.output_log_ctrl = wx.TextCtrl(self, style=wx.TE_MULTILINE|wx.TE_READONLY|wx.TE_DONTWRAP, size=(500,300))
 
@@ -62,15 +57,7 @@ class MainPluginDialog(wx.Dialog):
 	main_sizer.Fit(self)
 	self.Centre(wx.BOTH)
 
-        self.Bind(wx.EVT_CLOSE, self.onCloseWindow)
-	self.but_dismiss.Bind(wx.EVT_BUTTON, self.onCloseWindow)
-	self.but_run.Bind(wx.EVT_BUTTON, self.onRun)
-
 
-    def onCloseWindow(self, event):
-        self.Destroy()
-
-    
     def onRun(self, event):
         
         overwrite = self.output_dir_overwrite_ctrl.IsChecked()
@@ -84,26 +71,13 @@ class MainPluginDialog(wx.Dialog):
                 wx.MessageBox("Output directory exists. Specify another directory or check the overwrite box.")
                 return
 
-        try:
-            ret = output_fab.OutputFab(
-                    board = self.board,
-                    output_dir = output_dir, 
-                    overwrite = overwrite,
-                    protel_ext = protel_ext,
-                    output_log = self.output_log_ctrl
-                    )
-        except Exception:
-            self.output_log_ctrl.write(traceback.format_exc())
-            wx.MessageBox("An exception has occured. Please check the output log")
-            return
-                
-        message = ""
-        message += "Done"
-        message += '\n\n'
-        for warn in ret['warn']:
-            message += warn 
-            message += '\n'
-        self.output_log_ctrl.write(message)
+        self.StartWorker(output_fab.OutputFab, dict(
+                board = self.board,
+                output_dir = output_dir,
+                overwrite = overwrite,
+                protel_ext = protel_ext,
+                ))
+
 
         
 def InitMainDialog(board):
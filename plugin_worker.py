@@ -0,0 +1,202 @@
+#!/usr/bin/env python2
+
+# Background execution of the plugin functions
+#
+# The dialogs run DrillMap, OutputAssembly and OutputFab in a worker thread,
+# so Kicad is not blocked while the outputs are generated. The functions
+# report their stages with the progress callback:
+#   progress(step, step_count, stage)
+# which is posted to the dialog with wx.CallAfter, like the lines written to
+# the output log. The callback is also where the run is cancelled: after
+# Cancel() the next call raises Cancelled, so the functions stop between two
+# stages and never in the middle of one.
+#
+# pcbnew is not thread safe: the worker thread only does the computations
+# and the file outputs. The functions read the board, change it and plot it
+# through the second callback:
+#   run_in_ui(func, *args)
+# which calls func in the UI thread with wx.CallAfter and returns its result
+# (or raises its exception) in the worker thread. The board can be edited
+# between two of these calls, each one reads and changes the board it needs
+# at once.
+
+import threading
+import traceback
+import wx
+
+
+class Cancelled(Exception):
+    pass
+
+
+class UICallError(Exception):
+    pass
+
+
+class LogSink(object):
+    """File-like object writing to a wx text control from any thread."""
+
+    def __init__(self, ctrl):
+        self.ctrl = ctrl
+
+    def write(self, text):
+        wx.CallAfter(self.ctrl.write, text)
+
+    def flush(self):
+        pass
+
+
+class Worker(threading.Thread):
+    """Thread calling func(progress=..., run_in_ui=..., **kwargs).
+
+    on_progress(step, step_count, stage) and on_done(ret, error) are called
+    in the UI thread. error is None on success, the traceback if func raised
+    an exception and 'Cancelled' if the run was cancelled.
+    """
+
+    def __init__(self, func, kwargs, on_progress, on_done):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.func = func
+        self.kwargs = kwargs
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.cancel_event = threading.Event()
+
+    def Cancel(self):
+        self.cancel_event.set()
+
+    def IsCancelled(self):
+        return self.cancel_event.is_set()
+
+    def Progress(self, step, step_count, stage):
+        if self.cancel_event.is_set():
+            raise Cancelled('Cancelled before: %s'%stage)
+        wx.CallAfter(self.on_progress, step, step_count, stage)
+
+    def RunInUI(self, func, *args):
+        """Call func(*args) in the UI thread and wait for the result.
+
+        An exception of func is raised again as UICallError, with the
+        traceback of the UI thread in its message.
+        """
+
+        result = {}
+        done = threading.Event()
+        def call():
+            try:
+                result['ret'] = func(*args)
+            except Exception:
+                result['error'] = traceback.format_exc()
+            finally:
+                # also set when func is interrupted (e.g. SystemExit)
+                done.set()
+        wx.CallAfter(call)
+        done.wait()
+        if 'error' in result:
+            raise UICallError('Error in the UI thread:\n%s'%result['error'])
+        if 'ret' not in result:
+            raise UICallError('Error: The call in the UI thread was interrupted')
+        return result['ret']
+
+    def run(self):
+        ret = None
+        error = None
+        try:
+            ret = self.func(progress=self.Progress, run_in_ui=self.RunInUI, **self.kwargs)
+        except Cancelled:
+            error = 'Cancelled'
+        except Exception:
+            error = traceback.format_exc()
+        wx.CallAfter(self.on_done, ret, error)
+
+
+class WorkerDialog(object):
+    """Mixin of the plugin dialogs running their function in a Worker.
+
+    AddRunControls() adds the Run, Cancel and Dismiss buttons and the
+    progress gauge, the dialog provides onRun() and output_log_ctrl and
+    starts the run with StartWorker(func, kwargs). DoneMessage(ret) is
+    written to the log after a successful run. Closing the dialog during a
+    run cancels it, the dialog is destroyed when the worker is done.
+    """
+
+    def AddRunControls(self, main_sizer, spacing):
+        self.worker = None
+        self.close_pending = False
+
+        button_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        self.but_run = wx.Button(self, label = "Run")
+        button_sizer.Add(self.but_run, border = spacing)
+        self.but_cancel = wx.Button(self, label = "Cancel")
+        self.but_cancel.Enable(False)
+        button_sizer.Add(self.but_cancel, border = spacing)
+        self.but_dismiss = wx.Button(self, label = "Dismiss")
+        button_sizer.Add(self.but_dismiss, border = spacing)
+
+        main_sizer.Add(button_sizer, 0, flag = wx.ALL|wx.CENTER, border = spacing)
+
+        self.gauge = wx.Gauge(self, range = 1)
+        main_sizer.Add(self.gauge, 0, flag = wx.ALL|wx.EXPAND, border = spacing)
+
+        self.Bind(wx.EVT_CLOSE, self.onCloseWindow)
+        self.but_dismiss.Bind(wx.EVT_BUTTON, self.onCloseWindow)
+        self.but_run.Bind(wx.EVT_BUTTON, self.onRun)
+        self.but_cancel.Bind(wx.EVT_BUTTON, self.onCancel)
+
+    def onCloseWindow(self, event):
+        if self.worker != None:
+            # destroyed when the worker is done, it still writes to the log
+            self.worker.Cancel()
+            self.close_pending = True
+            self.Hide()
+            return
+        self.Destroy()
+
+    def onCancel(self, event):
+        if self.worker != None:
+            self.worker.Cancel()
+            self.but_cancel.Enable(False)
+            self.output_log_ctrl.write('Cancelling after the current stage\n')
+
+    def onProgress(self, step, step_count, stage):
+        self.gauge.SetRange(step_count)
+        self.gauge.SetValue(step)
+        self.output_log_ctrl.write('[%d/%d] %s\n'%(step + 1, step_count, stage))
+
+    def StartWorker(self, func, kwargs):
+        self.but_run.Enable(False)
+        self.but_cancel.Enable(True)
+        self.gauge.SetValue(0)
+        kwargs['output_log'] = LogSink(self.output_log_ctrl)
+        self.worker = Worker(func, kwargs, self.onProgress, self.onDone)
+        self.worker.start()
+
+    def DoneMessage(self, ret):
+        message = ""
+        message += "Done"
+        message += '\n\n'
+        for warn in ret['warn']:
+            message += warn 
+            message += '\n'
+        return message
+
+    def onDone(self, ret, error):
+        self.worker = None
+        if self.close_pending:
+            self.Destroy()
+            return
+        self.but_run.Enable(True)
+        self.but_cancel.Enable(False)
+
+        if error == 'Cancelled':
+            self.gauge.SetValue(0)
+            self.output_log_ctrl.write('Cancelled\n')
+            return
+        if error != None:
+            self.output_log_ctrl.write(error)
+            wx.MessageBox("An exception has occured. Please check the output log")
+            return
+
+        self.gauge.SetValue(self.gauge.GetRange())
+        self.output_log_ctrl.write(self.DoneMessage(ret))
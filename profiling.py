@@ -0,0 +1,205 @@
+#!/usr/bin/env python2
+
+# Timing of the stages of the scripts
+#
+# The output functions take a Profiler and wrap each stage in a span:
+#   with profiler.Span('markers'):
+#       ...
+# Each span records the number of calls, the total wall time and how much
+# the peak memory of the process grew during the span (the largest growth
+# of its calls): the peak only grows, so the stages that do not need more
+# memory than the earlier ones show 0. Spans can be nested, the
+# time of a span includes the spans inside it. The report is written in
+# JSON format (--timing_report option of the scripts), so the stage times
+# can be compared between releases:
+#   > python_k plugin_drill_map/drill_map.py --timing_report new.json board.kicad_pcb
+#   > python profiling.py old.json new.json
+#
+# --profile writes a cProfile dump of the whole run, for looking inside a
+# stage (python -m pstats <file>).
+
+import sys
+import time
+import json
+import argparse
+import collections
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+__version__ = '0.1'
+
+REPORT_VERSION = 2
+
+
+def PeakMemoryKB():
+    """Peak resident memory of the process (KB), None if not available."""
+
+    if resource == None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # bytes on macOS
+        peak //= 1024
+    return peak
+
+
+class _Span(object):
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start_peak = PeakMemoryKB()
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        seconds = time.time() - self.start
+        peak_growth = None
+        if self.start_peak != None:
+            peak_growth = PeakMemoryKB() - self.start_peak
+        self.profiler.AddTime(self.name, seconds, peak_growth)
+        return False
+
+
+class Profiler(object):
+    """Time, number of calls and peak memory growth of named spans."""
+
+    def __init__(self):
+        self.start = time.time()
+        # in order of first use
+        self.spans = collections.OrderedDict()
+
+    def Span(self, name):
+        return _Span(self, name)
+
+    def AddTime(self, name, seconds, peak_growth_kb=None):
+        """Record a span timed somewhere else (e.g. in a worker process)."""
+
+        span = self.spans.get(name)
+        if span == None:
+            span = {'count' : 0, 'time' : 0.0, 'peak_growth_kb' : None}
+            self.spans[name] = span
+        span['count'] += 1
+        span['time'] += seconds
+        if peak_growth_kb != None:
+            span['peak_growth_kb'] = max(span['peak_growth_kb'], peak_growth_kb) if span['peak_growth_kb'] != None else peak_growth_kb
+
+    def Report(self):
+        ret = {}
+        ret['version'] = REPORT_VERSION
+        ret['total_time'] = time.time() - self.start
+        ret['peak_memory_kb'] = PeakMemoryKB()
+        ret['spans'] = [dict(name=name, **span) for name, span in self.spans.items()]
+        return ret
+
+    def WriteReport(self, fname):
+        with open(fname, 'w') as f:
+            json.dump(self.Report(), f, indent=1)
+
+    def Format(self):
+        return FormatReport(self.Report())
+
+
+class _NullSpan(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+
+class NullProfiler(object):
+    """Profiler that records nothing, used when no profiler is given."""
+
+    _span = _NullSpan()
+
+    def Span(self, name):
+        return self._span
+
+    def AddTime(self, name, seconds, peak_growth_kb=None):
+        pass
+
+
+def Call(profile_fname, func, *args, **kwargs):
+    """Call func, under cProfile if profile_fname is not None.
+
+    The profile statistics are dumped to profile_fname (pstats format).
+    """
+
+    if profile_fname == None:
+        return func(*args, **kwargs)
+
+    import cProfile
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(func, *args, **kwargs)
+    finally:
+        profile.dump_stats(profile_fname)
+
+
+def FormatReport(report):
+    """Table with the spans of a report."""
+
+    def mb(kb):
+        return '-' if kb == None else '%.1f'%(kb / 1024.0)
+
+    format_string = '%-30s %8s %10s %12s\n'
+    ret = format_string%('Span', 'Count', 'Time (s)', 'Peak + (MB)')
+    for span in report['spans']:
+        ret += format_string%(span['name'], span['count'], '%.3f'%span['time'], mb(span.get('peak_growth_kb')))
+    # peak of the whole process
+    ret += format_string%('Total (process peak)', 1, '%.3f'%report['total_time'], mb(report['peak_memory_kb']))
+    return ret
+
+
+def CompareReports(report_a, report_b):
+    """Table with the span times of two reports."""
+
+    spans_a = dict([(span['name'], span) for span in report_a['spans']])
+    spans_b = dict([(span['name'], span) for span in report_b['spans']])
+    names = [span['name'] for span in report_a['spans']] + [span['name'] for span in report_b['spans'] if span['name'] not in spans_a]
+
+    format_string = '%-30s %10s %10s %8s\n'
+    ret = format_string%('Span', 'A (s)', 'B (s)', 'B/A')
+    rows = [(name, spans_a.get(name, {}).get('time'), spans_b.get(name, {}).get('time')) for name in names]
+    rows.append(('Total', report_a['total_time'], report_b['total_time']))
+    for name, time_a, time_b in rows:
+        ratio = '-'
+        if time_a and time_b != None:
+            ratio = '%.2f'%(time_b / time_a)
+        ret += format_string%(name,
+                '-' if time_a == None else '%.3f'%time_a,
+                '-' if time_b == None else '%.3f'%time_b,
+                ratio)
+    return ret
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Show or compare timing reports (--timing_report option of the scripts)')
+    parser.add_argument('report',
+            help="JSON timing report")
+    parser.add_argument('report_b', nargs='?', default=None,
+            help="Second report, compared with the first one")
+    args = parser.parse_args()
+
+    with open(args.report) as f:
+        report = json.load(f)
+
+    if args.report_b == None:
+        sys.stdout.write(FormatReport(report))
+    else:
+        with open(args.report_b) as f:
+            report_b = json.load(f)
+        sys.stdout.write(CompareReports(report, report_b))
+
+
+if __name__=='__main__':
+    sys.exit(main())
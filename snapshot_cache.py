@@ -0,0 +1,278 @@
+#!/usr/bin/env python2
+
+# Persistent cache of board snapshots
+#
+# The snapshot of a board (see board_snapshot.py) is stored in a cache
+# directory next to the board, keyed by the hash of the board file and the
+# version of the extraction code. Repeated runs on an unchanged board load
+# the snapshot instead of crawling the board. The cache size is bounded, the
+# least recently used entries are removed first. The entries only contain
+# data (JSON and the raw column arrays), loading one does not run any code.
+
+import sys
+import os
+import json
+import hashlib
+import argparse
+from array import array
+
+try:
+    import pcbnew
+except ImportError:
+    # the board file is read by kicad_pcb.py without Kicad
+    pcbnew = None
+
+import board_snapshot
+import kicad_pcb
+
+__version__ = '0.1'
+
+# change when the content of the snapshot or the extraction code changes,
+# the entries of the older versions are not used anymore
+EXTRACTOR_VERSION = 3
+
+CACHE_DIR = '.snapshot_cache'
+CACHE_EXT = '.snapshot'
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+SNAPSHOT_FIELDS = ['aux_origin', 'edge_bbox', 'copper_layer_count', 'layer_names', 'net_names', 'net_classes']
+SNAPSHOT_TABLES = ['footprints', 'pads', 'courtyards', 'vias', 'tracks']
+
+
+def FileHash(fname):
+    h = hashlib.sha1()
+    with open(fname, 'rb') as f:
+        while True:
+            block = f.read(1 << 20)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+def WriteSnapshot(f, snapshot):
+    """Write a snapshot to the binary file f.
+
+    The file starts with a JSON header line with the fields, the text
+    columns and the typecode and length of the numeric columns, followed by
+    the data of the numeric columns in the order of the header.
+    """
+
+    header = {}
+    header['version'] = EXTRACTOR_VERSION
+    header['byteorder'] = sys.byteorder
+    for field in SNAPSHOT_FIELDS:
+        value = getattr(snapshot, field)
+        if isinstance(value, dict):
+            # JSON keys are strings, the netcodes and layer ids are kept as numbers
+            value = sorted(value.items())
+        header[field] = value
+    arrays = []
+    for name in SNAPSHOT_TABLES:
+        table = getattr(snapshot, name)
+        columns = []
+        for column in table.columns:
+            data = getattr(table, column)
+            if type(data) is array:
+                columns.append([column, data.typecode, data.itemsize, len(data)])
+                arrays.append(data)
+            else:
+                columns.append([column, None, 0, list(data)])
+        header[name] = columns
+
+    f.write(json.dumps(header).encode('utf-8') + b'\n')
+    for data in arrays:
+        data.tofile(f)
+
+
+def ReadSnapshot(f):
+    """Inverse of WriteSnapshot(), None if the file can not be used."""
+
+    header = json.loads(f.readline().decode('utf-8'))
+    if header.get('version') != EXTRACTOR_VERSION or header.get('byteorder') != sys.byteorder:
+        return None
+
+    snapshot = board_snapshot.BoardSnapshot()
+    for field in SNAPSHOT_FIELDS:
+        value = header[field]
+        if isinstance(getattr(snapshot, field), dict):
+            value = dict([(key, item) for key, item in value])
+        elif isinstance(value, list):
+            # aux_origin and edge_bbox
+            value = tuple(value)
+        setattr(snapshot, field, value)
+    for name in SNAPSHOT_TABLES:
+        table = getattr(snapshot, name)
+        for column, typecode, itemsize, values in header[name]:
+            if column not in table.columns:
+                return None
+            current = getattr(table, column)
+            if typecode == None:
+                if type(current) is array:
+                    return None
+                setattr(table, column, values)
+                continue
+            if type(current) is not array or current.typecode != typecode or current.itemsize != itemsize:
+                # other snapshot layout or written on a platform with different sizes
+                return None
+            column_data = array(typecode)
+            column_data.fromfile(f, values)
+            setattr(table, column, column_data)
+        if len(set([len(getattr(table, column)) for column in table.columns])) > 1:
+            return None
+    return snapshot
+
+
+class SnapshotCache(object):
+    """Snapshot cache of a board file.
+
+    source identifies how the snapshot was created (e.g. 'pcbnew' or the
+    tables read from the file), snapshots of different sources are stored
+    in different entries.
+    """
+
+    def __init__(self, board_fname, cache_dir=None, max_size=DEFAULT_MAX_SIZE):
+        self.board_fname = board_fname
+        if cache_dir == None:
+            cache_dir = os.path.join(os.path.dirname(os.path.abspath(board_fname)), CACHE_DIR)
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        # hash of the file when the cache is created, the board can be
+        # modified and saved later by the scripts
+        self.board_hash = FileHash(board_fname)
+
+    def EntryPath(self, source):
+        return os.path.join(self.cache_dir, '%s-%d-%s%s'%(self.board_hash, EXTRACTOR_VERSION, source, CACHE_EXT))
+
+    def Load(self, source):
+        """Cached snapshot, None if not found."""
+
+        fname = self.EntryPath(source)
+        try:
+            with open(fname, 'rb') as f:
+                snapshot = ReadSnapshot(f)
+        except Exception:
+            # missing or damaged entry
+            return None
+        if snapshot == None:
+            return None
+
+        snapshot.file_name = self.board_fname
+        # mark as recently used
+        try:
+            os.utime(fname, None)
+        except OSError:
+            pass
+        return snapshot
+
+    def Save(self, source, snapshot):
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+        fname = self.EntryPath(source)
+        # write to a temporary file first, other processes may be reading the entry
+        tmp_fname = '%s.%d.tmp'%(fname, os.getpid())
+        with open(tmp_fname, 'wb') as f:
+            WriteSnapshot(f, snapshot)
+        if os.path.exists(fname):
+            os.remove(fname)
+        os.rename(tmp_fname, fname)
+
+        Evict(self.cache_dir, self.max_size)
+
+
+def LoadSnapshot(board_fname, tables, no_pcbnew=False, no_cache=False, cache_dir=None, output_log=sys.stdout):
+    """Snapshot of a board file, from the cache if possible.
+
+    Without the cache entry the board is loaded and scanned by pcbnew, or
+    only the tables listed are read from the file (see
+    kicad_pcb.LoadSnapshot) if pcbnew is not available or no_pcbnew is
+    set. Returns the board (None if not loaded with pcbnew) and the
+    snapshot.
+    """
+
+    use_pcbnew = not no_pcbnew and pcbnew != None
+    if use_pcbnew:
+        sources = ['pcbnew']
+    else:
+        # the data extracted by pcbnew is also fine
+        sources = ['pcbnew', 'file_' + '_'.join(sorted(tables))]
+
+    cache = None
+    if not no_cache:
+        cache = SnapshotCache(board_fname, cache_dir)
+        for source in sources:
+            snapshot = cache.Load(source)
+            if snapshot != None:
+                output_log.write('Using cached board data\n')
+                return None, snapshot
+
+    board = None
+    if use_pcbnew:
+        board = pcbnew.LoadBoard(board_fname)
+        snapshot = board_snapshot.ScanBoard(board)
+    else:
+        snapshot = kicad_pcb.LoadSnapshot(board_fname, tables=tables)
+    if cache != None:
+        cache.Save(sources[-1], snapshot)
+    return board, snapshot
+
+
+def CacheEntries(cache_dir, ext=CACHE_EXT):
+    """(last use, size, path) of the cache entries, oldest first."""
+
+    ret = []
+    if not os.path.isdir(cache_dir):
+        return ret
+    for name in os.listdir(cache_dir):
+        if not name.endswith(ext):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        ret.append((st.st_mtime, st.st_size, path))
+    ret.sort()
+    return ret
+
+
+def Evict(cache_dir, max_size, ext=CACHE_EXT):
+    """Remove the least recently used entries until the cache fits in max_size bytes."""
+
+    entries = CacheEntries(cache_dir, ext)
+    total_size = sum([size for mtime, size, path in entries])
+    removed = 0
+    for mtime, size, path in entries:
+        if total_size <= max_size:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total_size -= size
+        removed += 1
+    return removed
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Show or trim the board snapshot cache')
+    parser.add_argument('cache_dir',
+            help="Cache directory (e.g. <board directory>/%s)"%CACHE_DIR)
+    parser.add_argument('-m', '--max_size_mb', type=float, default=None,
+            help="Remove the least recently used entries until the cache is smaller than this size")
+    args = parser.parse_args()
+
+    if args.max_size_mb != None:
+        removed = Evict(args.cache_dir, int(args.max_size_mb * 1024 * 1024))
+        print('Removed %d entries'%removed)
+
+    entries = CacheEntries(args.cache_dir)
+    for mtime, size, path in entries:
+        print('%10d  %s'%(size, os.path.basename(path)))
+    print('%d entries, %.1f MB'%(len(entries), sum([size for mtime, size, path in entries]) / (1024.0 * 1024.0)))
+
+
+if __name__=='__main__':
+    sys.exit(main())
@@ -0,0 +1,237 @@
+#!/usr/bin/env python2
+
+# Track width rules for track_width.py
+#
+# The "rules" list of the track width configuration refines the widths of
+# "target_widths" with conditions on the segments. Each rule is a dict with
+# the width (mils) and any of the conditions:
+#   "name"            : name of the rule in the reports
+#   "net_classes"     : net classes of the segments (default all)
+#   "layers"          : layer names of the segments (default all)
+#   "min_length_mm"   : minimum segment length
+#   "max_length_mm"   : maximum segment length
+#   "pad_distance_mm" : an end of the segment is within this distance of a
+#                       pad on the same layer (neck-down)
+#   "diff_pair"       : the net is (true) or is not (false) in a
+#                       differential pair (nets named <name>P/<name>N or
+#                       <name>+/<name>-)
+# e.g.
+#   "rules" : [
+#       {"name" : "50 ohm neck-down", "net_classes" : ["50_ohms"], "pad_distance_mm" : 0.5,
+#        "max_length_mm" : 1.0, "width" : 4}
+#   ]
+# The segments matching several rules get the width of the last one.
+#
+# The segment geometry is read from the board snapshot once into numpy
+# arrays (SegmentGeometry) and the rules are evaluated on all the segments
+# at once. The pad distances use a grid index of the pads.
+
+import numpy as np
+
+import board_snapshot
+from footprint_bbox import Column
+
+RULE_KEYS = ['name', 'net_classes', 'layers', 'min_length_mm', 'max_length_mm', 'pad_distance_mm', 'diff_pair', 'width']
+
+DIFF_PAIR_SUFFIXES = {'P' : 'N', 'N' : 'P', '+' : '-', '-' : '+'}
+
+
+def CheckRules(rules, layer_names):
+    """Raise an exception for invalid rules."""
+
+    for k, rule in enumerate(rules):
+        name = rule.get('name', k)
+        for key in rule.keys():
+            if key not in RULE_KEYS:
+                raise Exception('Invalid key %s in track width rule %s'%(key, name))
+        if 'width' not in rule or rule['width'] <= 0:
+            raise Exception('Invalid width in track width rule %s'%name)
+        for layer_name in rule.get('layers', []):
+            if layer_name not in layer_names:
+                raise Exception('Invalid layer name %s in track width rule %s'%(layer_name, name))
+
+
+def DiffPairNets(net_names):
+    """Netcodes of the nets with a differential pair partner."""
+
+    names = set(net_names.values())
+    ret = set()
+    for netcode, name in net_names.items():
+        if len(name) > 1 and name[-1] in DIFF_PAIR_SUFFIXES:
+            if name[:-1] + DIFF_PAIR_SUFFIXES[name[-1]] in names:
+                ret.add(netcode)
+    return ret
+
+
+def PadLayers(snapshot):
+    """Copper layer of each pad, -1 for the pads on all layers."""
+
+    pads = snapshot.pads
+    attribute = Column(pads, 'attribute')
+    flipped = Column(snapshot.footprints, 'flipped').astype(bool)[Column(pads, 'footprint')]
+    surface = (attribute == board_snapshot.PAD_ATTRIB_SMD) | (attribute == board_snapshot.PAD_ATTRIB_CONN)
+    return np.where(surface, np.where(flipped, board_snapshot.B_Cu, board_snapshot.F_Cu), -1)
+
+
+class PadIndex(object):
+    """Grid index of the pads, for finding the points near a pad.
+
+    The pads are approximated by a circle with the radius of their largest
+    side. Each pad is registered in every cell covered by the circle grown
+    by the search distance, so a point only looks in its own cell.
+    """
+
+    def __init__(self, snapshot, distance):
+        pads = snapshot.pads
+        self.x = Column(pads, 'pos_x').astype(float)
+        self.y = Column(pads, 'pos_y').astype(float)
+        self.radius = np.maximum(Column(pads, 'size_x'), Column(pads, 'size_y')) / 2.0
+        self.layer = PadLayers(snapshot)
+        self.distance = distance
+
+        reach = self.radius + distance
+        # most pads in a few cells
+        self.cell_size = max(1.0, 2 * float(np.median(reach))) if len(reach) else 1.0
+        x0 = np.floor((self.x - reach) / self.cell_size).astype(np.int64)
+        y0 = np.floor((self.y - reach) / self.cell_size).astype(np.int64)
+        nx = np.floor((self.x + reach) / self.cell_size).astype(np.int64) - x0 + 1
+        ny = np.floor((self.y + reach) / self.cell_size).astype(np.int64) - y0 + 1
+
+        cell_count = nx * ny
+        pad = np.repeat(np.arange(len(reach)), cell_count)
+        k = np.arange(cell_count.sum()) - np.repeat(np.cumsum(cell_count) - cell_count, cell_count)
+        keys = self.Key(x0[pad] + k % nx[pad], y0[pad] + k // nx[pad])
+        order = np.argsort(keys, kind='mergesort')
+        self.keys = keys[order]
+        self.pads = pad[order]
+
+    def Key(self, cx, cy):
+        # cell coordinates fit in 32 bits for any board
+        return (cx << 32) + (cy & 0xffffffff)
+
+    def Near(self, x, y, layer):
+        """Mask of the points (x, y on layer) within the distance of a pad on the same layer."""
+
+        cx = np.floor(x / self.cell_size).astype(np.int64)
+        cy = np.floor(y / self.cell_size).astype(np.int64)
+        keys = self.Key(cx, cy)
+        lo = np.searchsorted(self.keys, keys, 'left')
+        counts = np.searchsorted(self.keys, keys, 'right') - lo
+
+        # all the (point, pad) pairs sharing a cell
+        point = np.repeat(np.arange(len(x)), counts)
+        k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        pad = self.pads[lo[point] + k]
+
+        near = np.hypot(x[point] - self.x[pad], y[point] - self.y[pad]) - self.radius[pad] <= self.distance
+        near &= (self.layer[pad] < 0) | (self.layer[pad] == layer[point])
+        return np.bincount(point[near], minlength=len(x)) > 0
+
+
+class SegmentGeometry(object):
+    """Geometry of the track segments of a snapshot, in the order of snapshot.tracks.
+
+    The arrays are extracted once and the results of the pad and net
+    queries are cached, so several rule sets can be evaluated on the same
+    board.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        tracks = snapshot.tracks
+        self.start_x = Column(tracks, 'start_x').astype(float)
+        self.start_y = Column(tracks, 'start_y').astype(float)
+        self.end_x = Column(tracks, 'end_x').astype(float)
+        self.end_y = Column(tracks, 'end_y').astype(float)
+        self.length = np.hypot(self.end_x - self.start_x, self.end_y - self.start_y)
+        self.layer = Column(tracks, 'layer').astype(np.int64)
+        self.netcode = Column(tracks, 'netcode').astype(np.int64)
+
+        self._near_pads = {}
+        self._diff_pair = None
+
+    def __len__(self):
+        return len(self.length)
+
+    def NetMask(self, netcodes):
+        """Mask of the segments on the nets in netcodes."""
+
+        if not netcodes:
+            return np.zeros(len(self), dtype=bool)
+        table = np.zeros(max(max(netcodes), self.netcode.max() if len(self) else 0) + 1, dtype=bool)
+        table[list(netcodes)] = True
+        return table[self.netcode]
+
+    def NearPads(self, distance):
+        """Mask of the segments with an end within distance (IU) of a pad on the same layer."""
+
+        if distance not in self._near_pads:
+            if len(self.snapshot.pads) == 0 or len(self) == 0:
+                near = np.zeros(len(self), dtype=bool)
+            else:
+                index = PadIndex(self.snapshot, distance)
+                count = len(self)
+                ends = index.Near(np.concatenate([self.start_x, self.end_x]), np.concatenate([self.start_y, self.end_y]),
+                        np.concatenate([self.layer, self.layer]))
+                near = ends[:count] | ends[count:]
+            self._near_pads[distance] = near
+        return self._near_pads[distance]
+
+    def DiffPair(self):
+        """Mask of the segments on nets of a differential pair."""
+
+        if self._diff_pair is None:
+            self._diff_pair = self.NetMask(DiffPairNets(self.snapshot.net_names))
+        return self._diff_pair
+
+
+def RuleMask(geometry, rule, layer_ids):
+    """Mask of the segments matching the conditions of a rule."""
+
+    snapshot = geometry.snapshot
+    mask = np.ones(len(geometry), dtype=bool)
+    if 'net_classes' in rule:
+        mask &= geometry.NetMask([netcode for netcode, nc in snapshot.net_classes.items() if nc in rule['net_classes']])
+    if 'layers' in rule:
+        # the last entry is for the unknown layers (-1)
+        layers = np.zeros(board_snapshot.PCB_LAYER_ID_COUNT + 1, dtype=bool)
+        layers[[layer_ids[layer_name] for layer_name in rule['layers']]] = True
+        mask &= layers[geometry.layer]
+    if 'min_length_mm' in rule:
+        mask &= geometry.length >= board_snapshot.FromMM(rule['min_length_mm'])
+    if 'max_length_mm' in rule:
+        mask &= geometry.length <= board_snapshot.FromMM(rule['max_length_mm'])
+    if 'pad_distance_mm' in rule:
+        mask &= geometry.NearPads(board_snapshot.FromMM(rule['pad_distance_mm']))
+    if 'diff_pair' in rule:
+        mask &= geometry.DiffPair() == bool(rule['diff_pair'])
+    return mask
+
+
+def TrackTargets(geometry, net_widths, rules, layer_ids):
+    """Target width of each segment with the rules applied.
+
+    net_widths are the widths of the net classes (see
+    track_width.get_net_widths) and layer_ids maps the layer names to
+    their ids. Returns the widths in IU (0 for the segments without target
+    width, -1 for the segments on an unexpected layer) and the index of the
+    rule that set the width (-1 for the net class width). The segments on a
+    layer unknown to the board (layer -1) have no target width.
+    """
+
+    # netcode x layer table of the net class widths
+    net_count = max(list(net_widths.keys()) + [geometry.netcode.max() if len(geometry) else 0]) + 1
+    table = np.zeros((net_count, board_snapshot.PCB_LAYER_ID_COUNT), dtype=np.int64)
+    for netcode, (layer_widths, default_width) in net_widths.items():
+        table[netcode, :] = -1 if default_width == None else default_width
+        for layer_id, width in layer_widths.items():
+            table[netcode, layer_id] = width
+
+    known = geometry.layer >= 0
+    targets = np.where(known, table[geometry.netcode, np.maximum(geometry.layer, 0)], 0)
+    rule_index = np.full(len(geometry), -1, dtype=np.int64)
+    for k, rule in enumerate(rules):
+        mask = RuleMask(geometry, rule, layer_ids) & known
+        targets[mask] = board_snapshot.FromMils(rule['width'])
+        rule_index[mask] = k
+    return targets, rule_index
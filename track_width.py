@@ -1,16 +1,69 @@
 #!/usr/bin/env python2
 
+# Set the track widths of the net classes of a board (see track_width.json)
+#
+#   > python_k track_width.py board.kicad_pcb track_width.json
+#
+# writes the updated board in board.kicad_pcb.new. With --audit the board is
+# only checked: the tracks with another width and the tracks on unexpected
+# layers are reported (--json/--csv) and the exit status is 1 if any is
+# found. The audit reads the board file directly (kicad_pcb.py), so it runs
+# without Kicad, e.g. as a CI check:
+#   > python track_width.py --audit --json violations.json board.kicad_pcb track_width.json
+#
+# The optional "rules" list of the configuration sets other widths by
+# segment length, distance to the pads and differential pair membership
+# (see track_rules.py, needs numpy).
+
 import sys
-import pcbnew
+import csv
 import collections
 import json
+import argparse
+import board_snapshot
+import kicad_pcb
+
+try:
+    import pcbnew
+except ImportError:
+    # the audit reads the board file without Kicad
+    pcbnew = None
+
+try:
+    import track_rules
+except ImportError:
+    # numpy is only needed for the rules
+    track_rules = None
+
+__version__ = '0.1'
+
+AUDIT_VERSION = 1
+
+# columns of the violations in the audit report
+AUDIT_COLUMNS = ['type', 'net', 'net_class', 'layer', 'start_x_mm', 'start_y_mm', 'end_x_mm', 'end_y_mm', 'width_mils', 'target_mils', 'rule']
+
 
-def set_trace_widths(board, target_widths):
+def snapshot_tables(rules):
+    """Tables of the board snapshot needed for the rules (see board_snapshot.ScanBoard)."""
+
+    tables = ['tracks']
+    if rules and any(['pad_distance_mm' in rule for rule in rules]):
+        tables += ['footprints', 'pads']
+    return tables
+
+
+def get_net_widths(snapshot, target_widths):
+    """Target widths of the nets of the net classes in target_widths.
+
+    Returns the copper layers and a dict netcode -> (layer -> width, default
+    width), widths in IU, default width None if the other layers are not
+    expected. The nets of other classes are not in the dict.
+    """
 
-    board.BuildListOfNets() # required so 'board' contains valid netclass data
     # build list with copper layer names
-    copper_layer_count = board.GetCopperLayerCount()
-    layer_names = [board.GetLayerName(layer_id) for layer_id in range(board.GetCopperLayerCount() - 1)] + [board.GetLayerName(31)]
+    copper_layer_count = snapshot.copper_layer_count
+    copper_layers = list(range(copper_layer_count - 1)) + [31]
+    layer_names = [snapshot.GetLayerName(layer_id) for layer_id in copper_layers]
     
     # check the target widths structure
     for nc, width_map in target_widths.items():
@@ -19,45 +72,240 @@ def set_trace_widths(board, target_widths):
         for layer_name in width_map.keys():
             if layer_name != 'Default' and layer_name not in layer_names:
                 raise Exception('Invalid layer name: %s'%layer_name)
-    
+
+    # converted once per net class and layer
+    class_widths = {}
+    for nc, width_map in target_widths.items():
+        default_width = None
+        if width_map['Default'] > 0:
+            default_width = board_snapshot.FromMils(width_map['Default'])
+        layer_widths = {}
+        for layer_id, layer_name in zip(copper_layers, layer_names):
+            if layer_name in width_map:
+                layer_widths[layer_id] = board_snapshot.FromMils(width_map[layer_name])
+        class_widths[nc] = (layer_widths, default_width)
+
+    net_widths = {}
+    for netcode, nc in snapshot.net_classes.items():
+        if nc in class_widths:
+            net_widths[netcode] = class_widths[nc]
+
+    return copper_layers, net_widths
+
+
+def get_track_targets(snapshot, target_widths, rules=None, geometry=None):
+    """Target width of each track of the snapshot.
+
+    Returns the copper layers, the widths in IU (0 for the tracks of other
+    net classes and on layers unknown to the board, -1 for the tracks on
+    unexpected layers) and, with rules,
+    the index of the rule that set each width (-1 for the net class width,
+    None without rules). geometry is the track_rules.SegmentGeometry of the
+    snapshot, it can be kept for the next calls on the same board.
+    """
+
+    copper_layers, net_widths = get_net_widths(snapshot, target_widths)
+    tracks = snapshot.tracks
+
+    if rules:
+        if track_rules == None:
+            raise Exception('Error: numpy is needed for the track width rules')
+        layer_ids = dict([(snapshot.GetLayerName(layer_id), layer_id) for layer_id in copper_layers])
+        track_rules.CheckRules(rules, layer_ids)
+        if geometry == None:
+            geometry = track_rules.SegmentGeometry(snapshot)
+        targets, rule_index = track_rules.TrackTargets(geometry, net_widths, rules, layer_ids)
+        return copper_layers, targets.tolist(), rule_index.tolist()
+
+    targets = []
+    for netcode, layer_id in zip(tracks.netcode, tracks.layer):
+        target = net_widths.get(netcode)
+        if target == None or layer_id < 0:
+            targets.append(0)
+            continue
+        width = target[0].get(layer_id, target[1])
+        targets.append(-1 if width == None else width)
+    return copper_layers, targets, None
+
+
+def set_trace_widths(board, target_widths, snapshot=None, rules=None, geometry=None):
+    """Set the width of the tracks of the net classes in target_widths.
+
+    target_widths maps a net class to the width (mils) on each layer, the
+    'Default' width is used on the layers not listed (<= 0 to raise an
+    error for a track on these layers). The widths are converted once per
+    net class and layer, and each track is looked up through its netcode.
+    SetWidth is only called on the tracks with another width. The rules
+    refine the widths (see track_rules.py).
+
+    Returns the number of tracks of these net classes on each layer.
+    """
+
+    if snapshot == None:
+        snapshot = board_snapshot.ScanBoard(board, snapshot_tables(rules))
+
+    copper_layers, targets, rule_index = get_track_targets(snapshot, target_widths, rules, geometry)
+
+    tracks = snapshot.tracks
+    if len(snapshot.track_items) != len(tracks):
+        raise Exception('Error: The track widths can not be changed without the board items (snapshot read from the board file?)')
+
     # initialize counters for changes
-    count = collections.OrderedDict()
-    for layer_name in layer_names:
-        count.setdefault(layer_name, 0)
+    layer_count = dict([(layer_id, 0) for layer_id in copper_layers])
     
-    for track in board.GetTracks():
-        for nc, width_map in target_widths.items():
-            default_width = width_map['Default']
-            if type(track) == pcbnew.TRACK and track.GetNet().GetClassName() == nc:
-                layer_name = track.GetLayerName()
-                if layer_name in width_map:
-                    track.SetWidth(pcbnew.FromMils(width_map[layer_name]))
-                else:
-                    if default_width <= 0:
-                        pos = track.GetPosition()
-                        x = pcbnew.ToMM(pos.x)
-                        y = pcbnew.ToMM(pos.y)
-                        raise Exception('Found track on net %s on unexpected layer: %s at position %.2fx%.2f mm'%(track.GetNetname(), layer_name, x, y)) 
-                    else:
-                        track.SetWidth(pcbnew.FromMils(default_width))
-                count[layer_name] += 1
+    track_items = snapshot.track_items
+    layers = tracks.layer
+    widths = tracks.width
+    for i, width in enumerate(targets):
+        if width == 0:
+            continue
+        layer_id = layers[i]
+        if width < 0:
+            x = board_snapshot.ToMM(tracks.start_x[i])
+            y = board_snapshot.ToMM(tracks.start_y[i])
+            raise Exception('Found track on net %s on unexpected layer: %s at position %.2fx%.2f mm'%(snapshot.net_names[tracks.netcode[i]], snapshot.GetLayerName(layer_id), x, y)) 
+        if widths[i] != width:
+            track_items[i].SetWidth(width)
+            # keep the snapshot valid for the next scripts
+            widths[i] = width
+        layer_count[layer_id] = layer_count.get(layer_id, 0) + 1
+
+    count = collections.OrderedDict()
+    for layer_id in copper_layers + sorted(set(layer_count.keys()) - set(copper_layers)):
+        count[snapshot.GetLayerName(layer_id)] = layer_count[layer_id]
 
     return count
     
 
-if __name__=='__main__':
-    import sys
-    board_filename = sys.argv[1]
-    config = json.load(open(sys.argv[2]))
-    board = pcbnew.LoadBoard(board_filename)
+def audit_trace_widths(board, target_widths, snapshot=None, rules=None, geometry=None):
+    """Check the track widths without changing the board.
+
+    Returns the violations in track order, as dicts with the AUDIT_COLUMNS
+    keys: the tracks of the net classes in target_widths with another width
+    (type 'width') and the tracks on layers without a target width (type
+    'layer', target_mils None). rule is the name of the rule that set the
+    target width, empty for the net class width. The snapshot can be read
+    from the board file (kicad_pcb.LoadSnapshot), board is only used
+    without snapshot.
+    """
+
+    if snapshot == None:
+        snapshot = board_snapshot.ScanBoard(board, snapshot_tables(rules))
+
+    copper_layers, targets, rule_index = get_track_targets(snapshot, target_widths, rules, geometry)
+
+    violations = []
+    tracks = snapshot.tracks
+    netcodes = tracks.netcode
+    layers = tracks.layer
+    widths = tracks.width
+    for i, width in enumerate(targets):
+        if width == 0:
+            continue
+        if width < 0:
+            violation_type = 'layer'
+        elif widths[i] != width:
+            violation_type = 'width'
+        else:
+            continue
+        rule = ''
+        if rule_index != None and rule_index[i] >= 0:
+            rule = rules[rule_index[i]].get('name', 'rule %d'%rule_index[i])
+        netcode = netcodes[i]
+        violations.append({
+            'type'        : violation_type,
+            'net'         : snapshot.net_names.get(netcode, ''),
+            'net_class'   : snapshot.net_classes.get(netcode, ''),
+            'layer'       : snapshot.GetLayerName(layers[i]),
+            'start_x_mm'  : board_snapshot.ToMM(tracks.start_x[i]),
+            'start_y_mm'  : board_snapshot.ToMM(tracks.start_y[i]),
+            'end_x_mm'    : board_snapshot.ToMM(tracks.end_x[i]),
+            'end_y_mm'    : board_snapshot.ToMM(tracks.end_y[i]),
+            'width_mils'  : board_snapshot.ToMils(widths[i]),
+            'target_mils' : None if width < 0 else board_snapshot.ToMils(width),
+            'rule'        : rule,
+            })
+
+    return violations
+
+
+def group_violations(violations):
+    """Number of violations per type, net class and layer."""
+
+    count = collections.Counter([(v['type'], v['net_class'], v['layer']) for v in violations])
+    return [dict(type=key[0], net_class=key[1], layer=key[2], count=count[key]) for key in sorted(count.keys())]
 
-    count = set_trace_widths(board, config["target_widths"])
+
+def write_audit_json(fname, board_fname, track_count, violations):
+    report = {}
+    report['version'] = AUDIT_VERSION
+    report['board'] = board_fname
+    report['track_count'] = track_count
+    report['violation_count'] = len(violations)
+    report['groups'] = group_violations(violations)
+    report['violations'] = violations
+    with open(fname, 'w') as f:
+        json.dump(report, f, indent=1)
+
+
+def write_audit_csv(fname, violations):
+    with open(fname, 'w') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(AUDIT_COLUMNS)
+        for v in violations:
+            writer.writerow(['' if v[c] == None else v[c] for c in AUDIT_COLUMNS])
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Set the track widths of the net classes of a Kicad board')
+    parser.add_argument('kicad_pcb',
+            help="Kicad PCB file")
+    parser.add_argument('config',
+            help="JSON file with the target widths (see track_width.json)")
+    parser.add_argument('--audit', action='store_true',
+            help="Only check the track widths, the board is not changed. The exit status is 1 if there are violations")
+    parser.add_argument('--json', default=None,
+            help="Write the audit violations to this JSON file")
+    parser.add_argument('--csv', default=None,
+            help="Write the audit violations to this CSV file")
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = json.load(f)
+    rules = config.get("rules", [])
+
+    if args.audit:
+        # the board items are not needed
+        snapshot = kicad_pcb.LoadSnapshot(args.kicad_pcb, tables=snapshot_tables(rules))
+        violations = audit_trace_widths(None, config["target_widths"], snapshot, rules)
+
+        print("Track Width Violations:")
+        for group in group_violations(violations):
+            print('%6s %16s %10s : %d'%(group['type'], group['net_class'], group['layer'], group['count']))
+        print('%d violations in %d tracks'%(len(violations), len(snapshot.tracks)))
+
+        if args.json != None:
+            write_audit_json(args.json, args.kicad_pcb, len(snapshot.tracks), violations)
+        if args.csv != None:
+            write_audit_csv(args.csv, violations)
+        return 1 if violations else 0
+
+    if pcbnew == None:
+        print('pcbnew is needed to change the board, only --audit is available without Kicad')
+        return 1
+
+    board = pcbnew.LoadBoard(args.kicad_pcb)
+
+    count = set_trace_widths(board, config["target_widths"], rules=rules)
 
     print("Tracks Change Summary:")
     for k, v in count.items():
         print('%10s : %d'%(k,v))
 
-    pcbnew.SaveBoard(board_filename + '.new', board)
-    print("Saved updated board in %s.new"%board_filename)
+    pcbnew.SaveBoard(args.kicad_pcb + '.new', board)
+    print("Saved updated board in %s.new"%args.kicad_pcb)
 
 
+if __name__=='__main__':
+    sys.exit(main())
@@ -0,0 +1,177 @@
+#!/usr/bin/env python2
+
+# Track widths of several boards
+#
+# The boards and the configurations are listed in a JSON manifest, paths
+# are relative to the manifest file:
+#   {
+#     "config" : "stackup.json",
+#     "overlays" : ["fab_a.json"],
+#     "boards" : [
+#       {"kicad_pcb" : "board_a/board_a.kicad_pcb", "output" : "out/board_a.kicad_pcb"},
+#       {"kicad_pcb" : "board_b/board_b.kicad_pcb", "overlays" : ["board_b/widths.json",
+#         {"target_widths" : {"50_ohms" : {"In2.Cu" : 4.5}}}]}
+#     ]
+#   }
+# config is a track width configuration (see track_width.json). The
+# overlays (files or inline dicts) are applied in order, first the ones of
+# the manifest, then the ones of the board: their widths replace the ones
+# of the same net class and layer and their rules are added after the
+# rules of the configuration (see track_rules.py). The output defaults to
+# the board file name with .new appended, as track_width.py.
+#
+# The jobs are run by a pool of worker processes (see batch_runner.py). The
+# boards are written to a temporary file first and renamed, so an output is
+# either complete or not changed. A failed job does not stop the other ones.
+#   > python_k track_width_batch.py -j 8 variants.json
+
+import sys
+import os
+import copy
+import json
+import time
+import argparse
+import traceback
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+import track_width
+import batch_runner
+import pcbnew
+
+__version__ = '0.1'
+
+
+def merge_config(config, overlay):
+    """Configuration with an overlay applied."""
+
+    ret = copy.deepcopy(config)
+    target_widths = ret.setdefault('target_widths', {})
+    for nc, width_map in overlay.get('target_widths', {}).items():
+        target_widths.setdefault(nc, {}).update(width_map)
+    ret['rules'] = ret.get('rules', []) + overlay.get('rules', [])
+    return ret
+
+
+def load_overlays(overlays, base_dir):
+    ret = []
+    for overlay in overlays:
+        if isinstance(overlay, dict):
+            ret.append(overlay)
+        else:
+            with open(os.path.join(base_dir, overlay)) as f:
+                ret.append(json.load(f))
+    return ret
+
+
+def load_manifest(fname):
+    """Jobs of a manifest file with the paths resolved and the overlays applied."""
+
+    with open(fname) as f:
+        manifest = json.load(f)
+
+    base_dir = os.path.dirname(os.path.abspath(fname))
+    if 'config' not in manifest:
+        raise Exception('Error: Missing "config" in %s'%fname)
+    with open(os.path.join(base_dir, manifest['config'])) as f:
+        config = json.load(f)
+    for overlay in load_overlays(manifest.get('overlays', []), base_dir):
+        config = merge_config(config, overlay)
+
+    jobs = []
+    for i, entry in enumerate(manifest.get('boards', [])):
+        if 'kicad_pcb' not in entry:
+            raise Exception('Error: Missing "kicad_pcb" in board %d of %s'%(i + 1, fname))
+        kicad_pcb = os.path.join(base_dir, entry['kicad_pcb'])
+        job = {}
+        job['index'] = i
+        job['name'] = entry.get('name', os.path.splitext(os.path.basename(kicad_pcb))[0])
+        job['kicad_pcb'] = kicad_pcb
+        if 'output' in entry:
+            job['output'] = os.path.join(base_dir, entry['output'])
+        else:
+            job['output'] = kicad_pcb + '.new'
+        job_config = config
+        for overlay in load_overlays(entry.get('overlays', []), base_dir):
+            job_config = merge_config(job_config, overlay)
+        for nc, width_map in job_config.get('target_widths', {}).items():
+            if 'Default' not in width_map:
+                raise Exception('Error: Missing "Default" width of net class %s in board %d of %s'%(nc, i + 1, fname))
+        job['config'] = job_config
+        jobs.append(job)
+    return jobs
+
+
+def save_board(fname, board):
+    """Save a board through a temporary file, fname is either the complete board or not changed."""
+
+    output_dir = os.path.dirname(os.path.abspath(fname))
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    tmp_fname = '%s.%d.tmp'%(fname, os.getpid())
+    try:
+        if not pcbnew.SaveBoard(tmp_fname, board):
+            raise Exception('Error: Could not save %s'%fname)
+        # rename replaces the file atomically, except on Windows
+        if os.name == 'nt' and os.path.exists(fname):
+            os.remove(fname)
+        os.rename(tmp_fname, fname)
+    finally:
+        if os.path.exists(tmp_fname):
+            os.remove(tmp_fname)
+
+
+def run_job(job):
+    """Set the track widths of a board, the errors are returned in the result."""
+
+    ret = {}
+    ret['index'] = job['index']
+    ret['name'] = job['name']
+    ret['output'] = job['output']
+    ret['error'] = None
+    ret['count'] = None
+
+    t = time.time()
+    log = StringIO()
+    try:
+        board = pcbnew.LoadBoard(job['kicad_pcb'])
+        config = job['config']
+        count = track_width.set_trace_widths(board, config['target_widths'], rules=config.get('rules', []))
+        save_board(job['output'], board)
+        # plain list for the json report, in layer order
+        ret['count'] = list(count.items())
+        log.write("Tracks Change Summary:\n")
+        for k, v in count.items():
+            log.write('%10s : %d\n'%(k,v))
+        log.write("Saved updated board in %s\n"%job['output'])
+    except Exception:
+        ret['error'] = traceback.format_exc()
+
+    ret['time'] = time.time() - t
+    ret['log'] = log.getvalue()
+    return ret
+
+
+def track_counts(result):
+    return [sum([v for k, v in result['count']])]
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Script for setting the track widths of several Kicad boards')
+    parser.add_argument('manifest',
+            help="JSON file with the configuration, the overlays and the list of boards (kicad_pcb, overlays, output)")
+    batch_runner.AddArguments(parser,
+            report_help="Write the results of the jobs (with the track counts per layer) to this JSON file")
+
+    args = parser.parse_args()
+
+    jobs = load_manifest(args.manifest)
+    return batch_runner.Run(run_job, jobs, args, ['Tracks'], track_counts)
+
+
+if __name__=='__main__':
+    sys.exit(main())